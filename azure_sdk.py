@@ -0,0 +1,86 @@
+"""The parts of pulumi_azure_native this program uses, and nothing else.
+
+``from pulumi_azure_native import network`` is lazy, but the first attribute
+access runs ``network/__init__.py``, which imports all ~290 network resource
+modules. Here each package's ``__init__`` is skipped: only ``_enums``,
+``_inputs`` and the listed resource modules are imported, under a bare
+package module that is swapped back for the SDK's lazy one afterwards. A
+later full import of the package reuses the same submodules, so classes stay
+identical either way.
+
+Add a module to the lists below before using a new resource type.
+"""
+
+import importlib
+import importlib.machinery
+import importlib.util
+import sys
+import types
+
+import pulumi_azure_native
+
+NETWORK_MODULES = (
+    "commit",
+    "connectivity_configuration",
+    "load_balancer",
+    "network_group",
+    "network_interface",
+    "network_manager",
+    "network_security_group",
+    "public_ip_address",
+    "route",
+    "route_table",
+    "static_member",
+    "subnet",
+    "virtual_network",
+    "virtual_network_gateway",
+    "virtual_network_gateway_connection",
+    "virtual_network_peering",
+)
+
+COMPUTE_MODULES = (
+    "virtual_machine",
+)
+
+RESOURCES_MODULES = (
+    "resource_group",
+)
+
+AUTHORIZATION_MODULES = (
+    "get_client_config",
+)
+
+
+def _public_names(module):
+    names = getattr(module, "__all__", None)
+    if names is None:
+        names = [n for n in vars(module) if not n.startswith("_")]
+    return {n: getattr(module, n) for n in names}
+
+
+def load(package, modules):
+    """Return a namespace with the public names of ``pulumi_azure_native.<package>.<module>``."""
+    fullname = f"pulumi_azure_native.{package}"
+    current = sys.modules.get(fullname)
+    if current is not None and type(current) is types.ModuleType:
+        # Already fully imported by someone else; nothing left to save.
+        return current
+
+    spec = importlib.machinery.PathFinder.find_spec(fullname, pulumi_azure_native.__path__)
+    sys.modules[fullname] = importlib.util.module_from_spec(spec)
+    try:
+        namespace = types.ModuleType(fullname)
+        for name in ("_enums", "_inputs") + tuple(modules):
+            vars(namespace).update(_public_names(importlib.import_module(f"{fullname}.{name}")))
+    finally:
+        if current is not None:
+            sys.modules[fullname] = current
+        else:
+            del sys.modules[fullname]
+    return namespace
+
+
+network = load("network", NETWORK_MODULES)
+compute = load("compute", COMPUTE_MODULES)
+resources = load("resources", RESOURCES_MODULES)
+authorization = load("authorization", AUTHORIZATION_MODULES)
@@ -0,0 +1,60 @@
+"""Overlap detection time for large address plans.
+
+    python benchmarks/bench_cidr.py [--prefixes 1000 10000]
+
+Compares cidr.find_overlaps with naive pairwise ``ipaddress`` checks (only
+run up to --pairwise-limit prefixes; it is quadratic).
+"""
+
+import argparse
+import ipaddress
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cidr import PrefixAllocator, find_overlaps  # noqa: E402
+
+
+def address_plan(count, seed=0):
+    """Mostly disjoint /24 VNets with a few deliberate overlaps sprinkled in."""
+    rng = random.Random(seed)
+    allocator = PrefixAllocator("10.0.0.0/8")
+    plan = [(f"vnet{i}", str(allocator.allocate(24))) for i in range(count)]
+    for i in range(max(1, count // 100)):
+        _, prefix = rng.choice(plan)
+        plan.append((f"overlap{i}", str(next(ipaddress.ip_network(prefix).subnets(new_prefix=26)))))
+    rng.shuffle(plan)
+    return plan
+
+
+def pairwise(plan):
+    nets = [(label, ipaddress.ip_network(p)) for label, p in plan]
+    return [(a, b) for (a, x), (b, y) in itertools.combinations(nets, 2) if x.overlaps(y)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prefixes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--pairwise-limit", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'prefixes':>9} {'overlaps':>9} {'index ms':>9} {'pairwise ms':>12}")
+    for count in args.prefixes:
+        plan = address_plan(count)
+        start = time.perf_counter()
+        overlaps = find_overlaps(plan)
+        index_ms = (time.perf_counter() - start) * 1000
+        naive = "-"
+        if len(plan) <= args.pairwise_limit:
+            start = time.perf_counter()
+            assert len(pairwise(plan)) == len(overlaps)
+            naive = f"{(time.perf_counter() - start) * 1000:.1f}"
+        print(f"{len(plan):>9} {len(overlaps):>9} {index_ms:>9.1f} {naive:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Peering vs Virtual Network Manager connectivity: resource count and evaluation time, under mocks.
+
+    python benchmarks/bench_connectivity.py [--spokes 50 390] [--modes peering avnm avnm-mesh]
+
+Every (spoke count, mode) pair is evaluated in a fresh interpreter.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_spokes import synthetic_topology  # noqa: E402
+from network_manager import CONNECTIVITY_MODES  # noqa: E402
+
+PEERING = "azure-native:network:VirtualNetworkPeering"
+
+
+def measure(count, mode):
+    import azure_sdk  # noqa: F401  keep SDK import cost out of the timing
+    import offline
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(synthetic_topology(count), f)
+    try:
+        start = time.perf_counter()
+        registrations = offline.run_program(config={"topologyFile": f.name, "connectivity": mode})
+        elapsed = time.perf_counter() - start
+    finally:
+        os.unlink(f.name)
+    custom = [r for r in registrations if r.custom]
+    return {
+        "spokes": count,
+        "mode": mode,
+        "resources": len(custom),
+        "peerings": sum(r.typ == PEERING for r in custom),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spokes", type=int, nargs="+", default=[50, 390])
+    parser.add_argument("--modes", nargs="+", choices=CONNECTIVITY_MODES, default=list(CONNECTIVITY_MODES))
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(int(args.child[0]), args.child[1])))
+        return
+
+    print(f"{'spokes':>7} {'mode':<10} {'resources':>10} {'peerings':>9} {'seconds':>8}")
+    for count in args.spokes:
+        for mode in args.modes:
+            out = subprocess.run([sys.executable, __file__, "--child", str(count), mode],
+                                 check=True, capture_output=True, text=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['spokes']:>7} {r['mode']:<10} {r['resources']:>10} {r['peerings']:>9} {r['seconds']:>8}")
+
+
+if __name__ == "__main__":
+    main()
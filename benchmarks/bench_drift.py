@@ -0,0 +1,131 @@
+"""Drift engine throughput on a synthetic estate of peerings and route tables.
+
+    python benchmarks/bench_drift.py [--peerings 5000] [--drift 0.01]
+
+Desired and observed state are generated directly (no program evaluation);
+observed objects are ARM-shaped, with etags and provisioning state, the way
+``az network vnet peering list`` returns them. A first (cold) run diffs
+everything; the second run, after a few etags and one route change, only
+re-diffs the resources whose normalized content changed: the route change,
+not the new etags. Fails if the warm run re-diffs anything else.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drift import PEERING, ROUTE_TABLE, DriftEngine, resource_key  # noqa: E402
+
+SUB = "/subscriptions/00000000-0000-0000-0000-000000000000"
+
+
+def _vnet_id(name):
+    return f"{SUB}/resourceGroups/{name}-rg/providers/Microsoft.Network/virtualNetworks/{name}"
+
+
+def _arm_peering(vnet, name, remote, transit, remote_gw):
+    return {
+        "name": name,
+        "id": f"{_vnet_id(vnet)}/virtualNetworkPeerings/{name}",
+        "etag": f'W/"{uuid.uuid4()}"',
+        "type": "Microsoft.Network/virtualNetworks/virtualNetworkPeerings",
+        "properties": {
+            "provisioningState": "Succeeded",
+            "resourceGuid": str(uuid.uuid4()),
+            "peeringState": "Connected",
+            "remoteVirtualNetwork": {"id": _vnet_id(remote)},
+            "allowVirtualNetworkAccess": True,
+            "allowForwardedTraffic": True,
+            "allowGatewayTransit": transit,
+            "useRemoteGateways": remote_gw,
+        },
+    }
+
+
+def _route_table_id(name):
+    return f"{SUB}/resourceGroups/hub-nva-rg/providers/Microsoft.Network/routeTables/{name}"
+
+
+def _arm_route_table(name, prefixes):
+    return {
+        "name": name,
+        "id": _route_table_id(name),
+        "etag": f'W/"{uuid.uuid4()}"',
+        "type": "Microsoft.Network/routeTables",
+        "properties": {
+            "provisioningState": "Succeeded",
+            "disableBgpRoutePropagation": False,
+            "routes": [{
+                "name": f"to-{i}",
+                "etag": f'W/"{uuid.uuid4()}"',
+                "properties": {"provisioningState": "Succeeded", "addressPrefix": p,
+                               "nextHopType": "VirtualAppliance", "nextHopIpAddress": "10.0.0.36",
+                               "hasBgpOverride": False},
+            } for i, p in reversed(list(enumerate(prefixes)))],
+        },
+    }
+
+
+def estate(peering_pairs):
+    desired, observed = {}, {}
+    for i in range(peering_pairs):
+        spoke = f"spoke{i}"
+        for vnet, name, remote, transit, remote_gw in ((spoke, f"{spoke}-hub-peer", "hub-vnet", False, True),
+                                                       ("hub-vnet", f"hub-{spoke}-peer", spoke, True, False)):
+            key = resource_key(PEERING, f"{_vnet_id(vnet)}/virtualNetworkPeerings/{name}")
+            desired[key] = {"remoteVirtualNetwork": {"id": _vnet_id(remote)},
+                            "allowVirtualNetworkAccess": True, "allowForwardedTraffic": True,
+                            "allowGatewayTransit": transit, "useRemoteGateways": remote_gw}
+            observed[key] = _arm_peering(vnet, name, remote, transit, remote_gw)
+        if i % 10 == 0:
+            prefixes = [f"10.{(i + j) % 250}.0.0/16" for j in range(1, 6)]
+            key = resource_key(ROUTE_TABLE, _route_table_id(f"{spoke}-rt"))
+            desired[key] = {"disableBgpRoutePropagation": False,
+                            "routes": [{"name": f"to-{j}", "addressPrefix": p, "nextHopType": "VirtualAppliance",
+                                        "nextHopIpAddress": "10.0.0.36"} for j, p in enumerate(prefixes)]}
+            observed[key] = _arm_route_table(f"{spoke}-rt", prefixes)
+    return desired, observed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peerings", type=int, default=5000, help="number of hub/spoke peering pairs")
+    parser.add_argument("--drift", type=float, default=0.01, help="fraction of peerings to drift")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    desired, observed = estate(args.peerings)
+    peerings = [k for k in observed if k[0] == "peering"]
+    for key in rng.sample(peerings, int(len(peerings) * args.drift)):
+        observed[key]["properties"]["allowForwardedTraffic"] = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = DriftEngine(os.path.join(tmp, "cache.json"))
+        start = time.perf_counter()
+        drifts = engine.run(desired, observed)
+        cold = time.perf_counter() - start
+        print(f"cold: {len(desired)} resources, {len(drifts)} drifted fields, "
+              f"{engine.rediffed} diffed in {cold:.2f}s")
+
+        for key in rng.sample(peerings, 10):
+            observed[key]["etag"] = f'W/"{uuid.uuid4()}"'
+        table = next(k for k in observed if k[0] == "routeTable")
+        observed[table]["properties"]["routes"][0]["properties"]["nextHopIpAddress"] = "10.0.0.37"
+
+        engine = DriftEngine(os.path.join(tmp, "cache.json"))
+        start = time.perf_counter()
+        drifts = engine.run(desired, observed)
+        warm = time.perf_counter() - start
+        print(f"warm: {len(desired)} resources, {len(drifts)} drifted fields, "
+              f"{engine.rediffed} re-diffed in {warm:.2f}s")
+    sys.exit(0 if engine.rediffed == 1 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Check engine_timings.py against a synthetic pair of deployments.
+
+    python benchmarks/bench_engine_timings.py
+
+``benchmarks/fixtures/engine_timings`` holds two hand-written runs of the hub
+and on-prem gateway chain: ``events.jsonl`` in ``EventLog``'s format and
+``event-log.json`` in the format of a raw ``pulumi up --event-log`` file. Their
+timings are made up, not captured from a deployment. In the first run the
+hub gateway finishes last, and in the second the on-prem one does.
+``expected.json`` lists the step count, the p50/p95 per resource type and
+each run's realized critical path, all worked out by hand from the logs.
+The dependencies come from the program evaluated offline. Fails on any
+mismatch.
+"""
+
+import json
+import math
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine_timings import (DEFAULT_OPS, percentile, program_dependencies, read_log,  # noqa: E402
+                            realized_critical_path, steps_from_records)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "engine_timings")
+LOGS = ("events.jsonl", "event-log.json")
+
+
+def main():
+    with open(os.path.join(FIXTURES, "expected.json")) as f:
+        expected = json.load(f)
+    records = (r for name in LOGS for r in read_log(os.path.join(FIXTURES, name)))
+    steps = [s for s in steps_from_records(records) if s.op in DEFAULT_OPS]
+    failures = []
+    if len(steps) != expected["steps"]:
+        failures.append(f"{len(steps)} steps, expected {expected['steps']}")
+
+    by_type, runs = defaultdict(list), defaultdict(list)
+    for step in steps:
+        by_type[step.typ].append(step.duration)
+        runs[step.run].append(step)
+    if set(by_type) != set(expected["durations"]):
+        failures.append(f"resource types {sorted(by_type)}, expected {sorted(expected['durations'])}")
+    for typ, want in sorted(expected["durations"].items()):
+        for key, q in (("p50", 0.5), ("p95", 0.95)):
+            got = percentile(by_type.get(typ, [math.nan]), q)
+            print(f"{typ:<54} {key} {got:>8.2f}  expected {want[key]:>8.2f}")
+            if not math.isclose(got, want[key], abs_tol=1e-6):
+                failures.append(f"{typ} {key} {got:g}, expected {want[key]:g}")
+
+    dependencies = program_dependencies()
+    for run, want in sorted(expected["critical_paths"].items()):
+        got = [step.name for step in realized_critical_path(runs.get(run, []), dependencies)]
+        print(f"{run}: {' -> '.join(got)}")
+        if got != want:
+            failures.append(f"critical path of {run} is {' -> '.join(got)}, expected {' -> '.join(want)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
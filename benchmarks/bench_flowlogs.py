@@ -0,0 +1,120 @@
+"""Flow-log analyzer throughput against worker count, on synthetic logs.
+
+    python benchmarks/bench_flowlogs.py [--blobs 16] [--tuples 200000] [--workers 1 4] [--keep DIR]
+        [--config nvaCount=3]
+
+Writes --blobs ``PT1H.json`` blobs of --tuples flow tuples each, half as VNet
+flow logs and half as NSG flow logs, with traffic between the program's
+subnets, the NVA and the internet, some of it logged on the NVA NICs. Every
+--workers count analyzes the same blobs; the totals must agree and match
+what was written.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from ipaddress import ip_network
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flowlogs  # noqa: E402
+import offline  # noqa: E402
+from reachability import SUBNET, model_from_registrations  # noqa: E402
+
+TUPLES_PER_RECORD = 2000
+MOCK_RESOURCE = "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg/providers/Microsoft.Network"
+
+
+def _vnet_record(target, tuples):
+    return {"time": "2024-01-01T00:00:00Z", "flowLogVersion": 4, "category": "FlowLogFlowEvent",
+            "targetResourceID": target, "macAddress": "000D3A000001",
+            "flowRecords": {"flows": [{"aclID": "acl", "flowGroups": [
+                {"rule": "DefaultRule_AllowVnetOutBound", "flowTuples": tuples}]}]}}
+
+
+def _nsg_record(target, tuples):
+    return {"time": "2024-01-01T00:00:00Z", "category": "NetworkSecurityGroupFlowEvent", "resourceId": target,
+            "properties": {"Version": 2, "flows": [{"rule": "DefaultRule_AllowVnetInBound",
+                                                    "flows": [{"mac": "000D3A000002", "flowTuples": tuples}]}]}}
+
+
+def write_blobs(directory, registrations, blobs, tuples, rng):
+    """Write the synthetic blobs and return (tuples, flows, bytes) written."""
+    hosts = [str(ip_network((r.inputs.get("addressPrefixes") or [r.inputs["addressPrefix"]])[0]).network_address + 4)
+             for r in registrations if r.typ == SUBNET]
+    hosts += ["8.8.8.8", "20.50.1.2"]
+    model = model_from_registrations(registrations)
+    targets = [f"{MOCK_RESOURCE}/networkInterfaces/{name}" for name in flowlogs.nva_interfaces(registrations, model)]
+    targets.append(f"{MOCK_RESOURCE}/virtualNetworks/hub-vnet")
+    written = [0, 0, 0]
+    for blob in range(blobs):
+        vnet_log = blob % 2 == 0
+        records = []
+        for start in range(0, tuples, TUPLES_PER_RECORD):
+            batch = []
+            for _ in range(min(TUPLES_PER_RECORD, tuples - start)):
+                source, destination = rng.sample(hosts, 2)
+                state = rng.choice("BCE")
+                size = 0 if state == "B" else rng.randrange(100, 100_000)
+                counters = f"{size // 500},{size},{size // 1000},{size // 2}" if state != "B" else "0,0,0,0"
+                if vnet_log:
+                    batch.append(f"1704067200000,{source},{destination},{rng.randrange(1024, 65536)},443,6,O,"
+                                 f"{state},NX,{counters}")
+                else:
+                    batch.append(f"1704067200,{source},{destination},{rng.randrange(1024, 65536)},443,T,I,A,"
+                                 f"{state},{counters}")
+                written[0] += 1
+                written[1] += state == "B"
+                written[2] += size + size // 2
+            record = (_vnet_record if vnet_log else _nsg_record)(rng.choice(targets), batch)
+            records.append(record)
+        path = os.path.join(directory, f"blob{blob}", "y=2024", "m=01", "d=01", "h=00", "m=00", "PT1H.json")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump({"records": records}, f)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blobs", type=int, default=16)
+    parser.add_argument("--tuples", type=int, default=200_000, help="flow tuples per blob")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    parser.add_argument("--keep", help="write the blobs here and keep them")
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    args = parser.parse_args()
+
+    registrations = offline.run_program(config=dict(item.split("=", 1) for item in args.config))
+    directory = args.keep or tempfile.mkdtemp(prefix="flowlogs-")
+    try:
+        tuples, flows, size = write_blobs(directory, registrations, args.blobs, args.tuples, random.Random(0))
+        megabytes = sum(os.path.getsize(os.path.join(root, f))
+                        for root, _, files in os.walk(directory) for f in files) / 2 ** 20
+        print(f"{args.blobs} blobs, {megabytes:.0f} MB, {tuples} tuples")
+        print(f"{'workers':>8} {'seconds':>8} {'MB/s':>7} {'tuples/s':>10}")
+        failures = []
+        for workers in args.workers:
+            start = time.perf_counter()
+            aggregate, _ = flowlogs.analyze(flowlogs.LocalSource(directory), registrations, workers)
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {elapsed:>8.2f} {megabytes / elapsed:>7.1f} {round(aggregate.tuples / elapsed):>10}")
+            totals = (aggregate.tuples, sum(p[0] for p in aggregate.paths.values()),
+                      sum(p[2] for p in aggregate.paths.values()))
+            if totals != (tuples, flows, size):
+                failures.append(f"{workers} workers counted (tuples, flows, bytes) {totals}, "
+                                f"wrote {(tuples, flows, size)}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
+    for failure in failures:
+        print(f"MISMATCH: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
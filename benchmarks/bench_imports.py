@@ -0,0 +1,98 @@
+"""Program startup cost: import time (``-X importtime``) and peak RSS.
+
+    python benchmarks/bench_imports.py [--update-baseline] [--tolerance 0.25]
+
+Runs the import statements of ``__main__.py`` in fresh interpreters, forcing
+lazily imported modules to load, and compares the median wall time and peak
+RSS against ``baselines/imports.json``. Exits non-zero when either grows by
+more than the tolerance. The ``-X importtime`` breakdown shows where the time
+went.
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROGRAM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "imports.json")
+
+PROBE_START = "import time as _time\n_start = _time.perf_counter()\n"
+
+# Touch every imported module so lazily imported SDK packages are charged to
+# startup rather than to the first resource that uses them.
+PROBE_END = """
+import resource as _resource, types as _types
+for _value in list(globals().values()):
+    if isinstance(_value, _types.ModuleType):
+        getattr(_value, "__all__", None)
+print(_time.perf_counter() - _start, _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def program_imports():
+    with open(os.path.join(PROGRAM_DIR, "__main__.py")) as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def parse_importtime(stderr):
+    """Return [(self us, module)] from ``-X importtime`` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        modules.append((int(self_us), name.strip()))
+    return modules
+
+
+def measure():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE_START + program_imports() + PROBE_END],
+                            cwd=PROGRAM_DIR, capture_output=True, text=True, check=True)
+    seconds, rss_kb = result.stdout.split()[-2:]
+    return float(seconds), int(rss_kb) / 1024, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    seconds = statistics.median(r[0] for r in runs)
+    rss_mb = statistics.median(r[1] for r in runs)
+    modules = runs[-1][2]
+
+    print(f"startup: {seconds:.3f}s  peak RSS: {rss_mb:.1f}MB  modules: {len(modules)}")
+    print("heaviest modules (self time):")
+    for self_us, name in sorted(modules, reverse=True)[:10]:
+        print(f"  {self_us / 1000:8.1f}ms  {name}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        with open(BASELINE, "w") as f:
+            json.dump({"startup_seconds": round(seconds, 3), "peak_rss_mb": round(rss_mb, 1)}, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {os.path.relpath(BASELINE, PROGRAM_DIR)}")
+        return
+
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    failures = []
+    for label, value, limit in (("startup time", seconds, baseline["startup_seconds"]),
+                                ("peak RSS", rss_mb, baseline["peak_rss_mb"])):
+        if value > limit * (1 + args.tolerance):
+            failures.append(f"{label} {value:.3f} exceeds baseline {limit} by more than {args.tolerance:.0%}")
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Gateway pool lease contention.
+
+    python benchmarks/bench_leases.py [--pairs 4] [--stacks 16]
+
+Starts --stacks processes that acquire a lease from one store of --pairs
+gateway pairs at the same moment. Fails if a pair is leased twice, if a
+free pair is left while a stack went without, or if acquiring again does
+not return the same lease. Then races --stacks processes acquiring for one
+holder on a store whose lease files were left empty or truncated, and fails
+unless they all get the same, reclaimed pair.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leases import LeaseError, LocalLeaseStore  # noqa: E402
+
+
+def acquire(store_path, holder, start, results):
+    while time.time() < start:
+        pass
+    begin = time.perf_counter()
+    try:
+        pair = LocalLeaseStore(store_path).acquire(holder).pair
+    except LeaseError:
+        pair = None
+    results.put((holder, pair, (time.perf_counter() - begin) * 1000))
+
+
+def race(store_path, holders):
+    results = multiprocessing.Queue()
+    start = time.time() + 0.5
+    workers = [multiprocessing.Process(target=acquire, args=(store_path, holder, start, results))
+               for holder in holders]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=4)
+    parser.add_argument("--stacks", type=int, default=16)
+    args = parser.parse_args()
+
+    store_path = tempfile.mkdtemp(prefix="gateway-leases-")
+    store = LocalLeaseStore(store_path)
+    store.init([f"pair{i}" for i in range(1, args.pairs + 1)])
+
+    outcomes = race(store_path, [f"stack{i}" for i in range(args.stacks)])
+
+    errors = []
+    granted = [(holder, pair) for holder, pair, _ in outcomes if pair]
+    pairs = [pair for _, pair in granted]
+    if len(set(pairs)) != len(pairs):
+        errors.append(f"pairs leased twice: {sorted(p for p in set(pairs) if pairs.count(p) > 1)}")
+    if len(granted) != min(args.pairs, args.stacks):
+        errors.append(f"{len(granted)} lease(s) granted for {args.pairs} pair(s) and {args.stacks} stack(s)")
+    for holder, pair in granted:
+        if store.acquire(holder).pair != pair:
+            errors.append(f"{holder} was given a second lease")
+
+    retry_path = tempfile.mkdtemp(prefix="gateway-leases-")
+    retry_store = LocalLeaseStore(retry_path)
+    retry_store.init([f"pair{i}" for i in range(1, args.pairs + 1)])
+    for i, stale in enumerate(("", '{"pair": "pair')[:args.pairs], start=1):
+        with open(os.path.join(retry_path, f"pair{i}.lease"), "w") as f:
+            f.write(stale)
+    retried = {pair for _, pair, _ in race(retry_path, ["retried"] * args.stacks)}
+    held = [lease.pair for lease in retry_store.leases().values() if lease.holder == "retried"]
+    if len(retried) != 1 or held != [retry_store.pairs()[0]] or retried != set(held):
+        errors.append(f"one holder racing itself got {sorted(map(str, retried))} and holds {held}")
+
+    latencies = sorted(ms for _, _, ms in outcomes)
+    print(f"{'pairs':>6} {'stacks':>7} {'granted':>8} {'p50 ms':>7} {'max ms':>7}")
+    print(f"{args.pairs:>6} {args.stacks:>7} {len(granted):>8} {latencies[len(latencies) // 2]:>7.2f} "
+          f"{latencies[-1]:>7.2f}")
+    for error in errors:
+        print(error, file=sys.stderr)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Check that a second ``up`` over unchanged inputs updates nothing, under mocks.
+
+    python benchmarks/bench_noop_update.py [--config KEY=VALUE ...] [--verbose]
+
+Evaluates ``__main__.py`` offline, then fakes what a refresh writes into
+state. ``benchmarks/fixtures/arm_get`` holds ARM GET responses for each
+network type, some in more than one variant (a static and a dynamic NIC,
+say). Each is unwrapped from its ``properties`` envelopes and cut down to the
+resource's input properties, as listed by the azure-native SDK; the provider
+only diffs inputs, so output-only fields never reach a diff. The resource's
+own inputs are overlaid on the closest variant (ARM echoes what was set),
+and each item of an input list on the closest recorded item. The resource's
+id, name and location come from its URL and resource group and are not
+compared, and an empty list or object counts as unset.
+
+A second evaluation is diffed against that state, honouring each
+resource's ``ignore_changes``, and once more with the fields added by
+``volatile.py`` taken out to show how many updates they suppress. Fails if
+any resource would still be updated. Neither the fixtures nor the schema
+come from ``volatile.py``, so a field missing from its table shows up as an
+update here. Types without a recorded response are listed and skipped.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import offline  # noqa: E402
+from azure_sdk import network  # noqa: E402
+from volatile import NETWORK_TYPE_PREFIX, volatile_fields  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "arm_get")
+ADDRESSING = ("id", "name", "location")
+ARGS_REF = re.compile(r"ForwardRef\('(\w+Args)'\)")
+
+
+def recorded_responses():
+    """Recorded response variants by type."""
+    responses = {}
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith(".json"):
+            with open(os.path.join(FIXTURES, name)) as f:
+                recorded = json.load(f)
+            responses[name[:-len(".json")]] = recorded if isinstance(recorded, list) else [recorded]
+    return responses
+
+
+def _schema(args_type, seen=()):
+    """Input property names of an SDK ``*Args`` class, nested types expanded; None for a leaf."""
+    schema = {}
+    for attr in dir(args_type):
+        name = getattr(getattr(getattr(args_type, attr, None), "fget", None), "_pulumi_name", None)
+        if not name:
+            continue
+        refs = ARGS_REF.findall(str(getattr(args_type, attr).fget.__annotations__.get("return", "")))
+        nested = None
+        if refs and refs[0] not in seen:
+            nested = _schema(getattr(sys.modules[f"{network.__name__}._inputs"], refs[0]), seen + (refs[0],))
+        schema[name] = nested
+    return schema
+
+
+def input_schema(short_type, cache={}):
+    if short_type not in cache:
+        module = sys.modules[getattr(network, short_type).__module__]
+        args_type = getattr(module, f"{short_type}Args", None) or getattr(module, f"{short_type}InitArgs")
+        cache[short_type] = _schema(args_type)
+    return cache[short_type]
+
+
+def unwrap(value):
+    """An ARM body with every ``properties`` envelope flattened into its parent, as azure-native shapes it."""
+    if isinstance(value, dict):
+        flat = {k: v for k, v in value.items() if k != "properties"}
+        flat.update(value.get("properties") or {})
+        return {k: unwrap(v) for k, v in flat.items()}
+    if isinstance(value, list):
+        return [unwrap(v) for v in value]
+    return value
+
+
+def project(value, schema):
+    """``value`` with everything outside ``schema`` dropped."""
+    if schema is None:
+        return value
+    if isinstance(value, list):
+        return [project(v, schema) for v in value]
+    if isinstance(value, dict):
+        return {k: project(v, schema[k]) for k, v in value.items() if k in schema}
+    return value
+
+
+def overlay(recorded, inputs):
+    """``recorded`` with the program's ``inputs`` on top."""
+    if isinstance(inputs, dict) and isinstance(recorded, dict):
+        merged = dict(recorded)
+        merged.update({k: overlay(recorded.get(k), v) for k, v in inputs.items()})
+        return merged
+    if isinstance(inputs, list) and isinstance(recorded, list) and all(isinstance(r, dict) for r in recorded):
+        return [closest(recorded, item) for item in inputs]
+    return inputs
+
+
+def closest(candidates, inputs):
+    """``inputs`` overlaid on whichever candidate leaves the fewest differences."""
+    merged = [overlay(candidate, inputs) for candidate in candidates] or [inputs]
+    return min(merged, key=lambda m: len(diff(m, inputs, ())))
+
+
+def refreshed(short_type, inputs, responses):
+    """``inputs`` as a refresh would leave them in state."""
+    schema = input_schema(short_type)
+    bodies = [project({k: v for k, v in unwrap(r).items() if k not in ADDRESSING}, schema) for r in responses]
+    return closest(bodies, inputs)
+
+
+def segments(path):
+    return [s for s in re.split(r"[.\[\]]+", path) if s]
+
+
+def flatten(value, prefix=()):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, prefix + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from flatten(item, prefix + (index,))
+    elif value is not None:
+        yield prefix, value
+
+
+def ignored(path, ignore_changes):
+    for pattern in ignore_changes:
+        parts = segments(pattern)
+        if len(parts) <= len(path) and all(
+                part == "*" and isinstance(seg, int) or part == str(seg) for part, seg in zip(parts, path)):
+            return True
+    return False
+
+
+def diff(state, inputs, ignore_changes):
+    """Leaf paths whose value differs between ``state`` and ``inputs``, outside ``ignore_changes``."""
+    old, new = dict(flatten(state)), dict(flatten(inputs))
+    return sorted((path for path in old.keys() | new.keys()
+                   if old.get(path) != new.get(path) and not ignored(path, ignore_changes)), key=str)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--verbose", action="store_true", help="list the suppressed diffs too")
+    args = parser.parse_args()
+    config = dict(item.split("=", 1) for item in args.config)
+    responses = recorded_responses()
+
+    first = offline.run_program(config=config)
+    state, unrecorded = {}, set()
+    for r in first:
+        if not (r.custom and r.typ.startswith(NETWORK_TYPE_PREFIX)):
+            continue
+        short = r.typ[len(NETWORK_TYPE_PREFIX):]
+        if short in responses:
+            state[r.urn] = refreshed(short, r.inputs, responses[short])
+        else:
+            unrecorded.add(short)
+    second = [r for r in offline.run_program(config=config) if r.urn in state]
+    if len(second) != len(state):
+        sys.exit(f"second evaluation registered {len(second)} network resources, the first {len(state)}")
+
+    updates, suppressed = [], 0
+    for r in second:
+        own = [path for path in r.ignore_changes if path not in volatile_fields(r.typ)]
+        noise = diff(state[r.urn], r.inputs, own)
+        changes = diff(state[r.urn], r.inputs, r.ignore_changes)
+        suppressed += bool(noise) and not changes
+        if changes:
+            updates.append(f"{r.name}: {', '.join('.'.join(map(str, p)) for p in changes)}")
+        elif noise and args.verbose:
+            print(f"suppressed {r.name}: {', '.join('.'.join(map(str, p)) for p in noise)}")
+
+    print(f"network resources: {len(second)} (no recorded response for {', '.join(sorted(unrecorded)) or 'none'})")
+    print(f"updates without volatile.py: {suppressed + len(updates)}")
+    print(f"updates: {len(updates)}")
+    for update in updates:
+        print(f"UPDATE: {update}", file=sys.stderr)
+    sys.exit(1 if updates else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""NSG evaluator throughput and lint time against rule count, on synthetic rule sets.
+
+    python benchmarks/bench_nsg.py [--rules 50 500] [--flows 1000000] [--check 20000]
+
+Every rule set is compiled, checked against a linear scan in priority order
+on --check random flows, and then timed on --flows random flows. Each
+shadowed or redundant rule it reports is removed in turn and the sample
+re-evaluated, which must not change any decision. Fails on a mismatch.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from ipaddress import ip_network
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nsg  # noqa: E402
+
+VNET_PREFIXES = ["10.0.0.0/8", "192.168.0.0/16"]
+PREFIX_LENGTHS = (8, 16, 20, 24, 28, 32)
+PORTS = ("22", "53", "80", "443", "3389", "1024-65535", "8000-8999")
+
+
+def synthetic_rules(count, rng):
+    """``count`` rules per direction in the shape of ``SecurityRuleArgs`` inputs."""
+    def prefix():
+        if rng.random() < 0.1:
+            return rng.choice(("*", "VirtualNetwork", "Internet"))
+        length = rng.choice(PREFIX_LENGTHS)
+        return str(ip_network(f"10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(256)}/{length}",
+                              strict=False))
+
+    rules = []
+    for direction in (nsg.INBOUND, nsg.OUTBOUND):
+        for i in range(count):
+            ports = rng.sample(PORTS, rng.randint(1, 3))
+            rules.append({
+                "name": f"{direction.lower()}-{i}",
+                "priority": 100 + i,
+                "direction": direction,
+                "access": rng.choice((nsg.ALLOW, nsg.DENY)),
+                "protocol": rng.choice(("Tcp", "Tcp", "Udp", "*")),
+                "sourceAddressPrefixes": [prefix() for _ in range(rng.randint(1, 3))],
+                "sourcePortRange": "*",
+                "destinationAddressPrefix": prefix(),
+                "destinationPortRanges": ["*"] if rng.random() < 0.1 else ports,
+            })
+    return rules
+
+
+def synthetic_flows(count, rng):
+    protocols = ("Tcp", "Tcp", "Tcp", "Udp", "Icmp")
+    ten = int(ip_network("10.0.0.0/8").network_address)
+    addresses = [ten + rng.getrandbits(18) for _ in range(4096)] + [rng.getrandbits(32) for _ in range(1024)]
+    ports = [22, 53, 80, 443, 3389, 8080, 8443, 50000]
+    return [(rng.choice(protocols), rng.choice(addresses), rng.randrange(1024, 65536),
+             rng.choice(addresses), rng.choice(ports)) for _ in range(count)]
+
+
+def linear_scan(rules):
+    """Reference matcher: the first rule in priority order that matches every field."""
+    def ranges(prefixes):
+        return [(int(net.network_address), int(net.broadcast_address)) for net in map(ip_network, prefixes)]
+
+    compiled = [(rule, ranges(rule.source_prefixes), ranges(rule.destination_prefixes)) for rule in rules]
+
+    def decide(flow):
+        protocol, source, source_port, destination, destination_port = flow
+        for rule, sources, destinations in compiled:
+            if (rule.protocol in (nsg.ANY, protocol)
+                    and any(low <= source <= high for low, high in sources)
+                    and any(low <= destination <= high for low, high in destinations)
+                    and any(low <= source_port <= high for low, high in rule.source_ports)
+                    and any(low <= destination_port <= high for low, high in rule.destination_ports)):
+                return rule
+    return decide
+
+
+def measure(count, flows, check):
+    rng = random.Random(count)
+    tags = nsg.service_tags(VNET_PREFIXES)
+    raw = synthetic_rules(count, rng)
+
+    start = time.perf_counter()
+    compiled = nsg.compile_nsg(raw, tags)[nsg.INBOUND]
+    built = time.perf_counter()
+
+    errors = []
+    sample = synthetic_flows(check, rng)
+    decided = compiled.evaluate(sample)
+    reference = linear_scan(compiled.rules)
+    for flow, rule in zip(sample, decided):
+        expected = reference(flow)
+        if rule is not expected:
+            errors.append(f"{flow}: compiled {rule}, linear scan {expected}")
+            break
+
+    lint_start = time.perf_counter()
+    findings = list(compiled.findings())
+    lint_seconds = time.perf_counter() - lint_start
+    for rule, kind, _ in findings:
+        without = nsg.CompiledRules(r for r in compiled.rules if r is not rule)
+        for flow, before, after in zip(sample, decided, without.evaluate(sample)):
+            if before.access != after.access:
+                errors.append(f"{rule} is reported {kind} but decides {flow}")
+                break
+
+    batch = synthetic_flows(min(flows, 1_000_000), rng)
+    batch = (batch * (flows // len(batch) + 1))[:flows]
+    query_start = time.perf_counter()
+    compiled.evaluate(batch)
+    query_seconds = time.perf_counter() - query_start
+    return {
+        "rules": count,
+        "build_seconds": round(built - start, 3),
+        "flows_per_second": round(flows / query_seconds),
+        "lint_seconds": round(lint_seconds, 3),
+        "shadowed": sum(kind == nsg.SHADOWED for _, kind, _ in findings),
+        "redundant": sum(kind == nsg.REDUNDANT for _, kind, _ in findings),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--flows", type=int, default=1_000_000)
+    parser.add_argument("--check", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'rules':>6} {'build s':>8} {'flows/s':>10} {'lint s':>7} {'shadowed':>9} {'redundant':>10}")
+    failed = False
+    for count in args.rules:
+        r = measure(count, args.flows, args.check)
+        print(f"{r['rules']:>6} {r['build_seconds']:>8} {r['flows_per_second']:>10} {r['lint_seconds']:>7} "
+              f"{r['shadowed']:>9} {r['redundant']:>10}")
+        for error in r["errors"]:
+            print(f"MISMATCH: {error}", file=sys.stderr)
+        failed = failed or bool(r["errors"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Stack ordering, failure propagation and retries in orchestrate.py, offline.
+
+    python benchmarks/bench_orchestrate.py [--concurrency 4]
+
+Runs ``benchmarks/fixtures/orchestrate/stacks.yaml`` (a hub, two spokes, a
+stack that always fails and one that depends on it) through
+``orchestrate.runner`` with ``--offline``. Every stack is evaluated for real
+under the mocks. The only stand-in is a throttling error injected in front of
+the first attempt of spoke1, and of every attempt in the deadline check. Fails
+if a spoke starts before the hub has finished, if ``destroy`` takes the hub
+down before its spokes, if a status or attempt count differs from the
+expected one, if retries run past the per-stack ``--timeout``, or if an error
+that only mentions 429 in a name or address is retried.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orchestrate  # noqa: E402
+from orchestrate import FAILED, SKIPPED, SUCCEEDED  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "orchestrate", "stacks.yaml")
+PREFIX = "org/network-peering-drift-code/"
+THROTTLED = {"status": FAILED, "error": "429 TooManyRequests", "transient": True}
+
+# Error line: whether orchestrate.TRANSIENT_ERRORS retries it.
+ERRORS = {
+    'Status=429 Code="TooManyRequests"': True,
+    "unexpected status code: 429": True,
+    "ConcurrentUpdateError: another update is currently in progress": True,
+    "resource 'vm-429' not found": False,
+    "subnet 10.0.4.29/32 overlaps spoke429": False,
+}
+
+# Stack: (status, attempts) after `up`.
+EXPECTED_UP = {
+    "hub": (SUCCEEDED, 1),
+    "spoke1": (SUCCEEDED, 2),
+    "spoke2": (SUCCEEDED, 1),
+    "bad-mode": (FAILED, 1),
+    "after-bad-mode": (SKIPPED, 0),
+}
+
+
+class Recorder:
+    """Stands in for ``orchestrate.run_child``: records each attempt and throttles the first ``throttled`` ones."""
+
+    def __init__(self, throttled=None, attempt_seconds=0.0):
+        self.throttled = dict(throttled or {})
+        self.attempt_seconds = attempt_seconds
+        self.attempts = []
+        self.lock = threading.Lock()
+        self.run_child = orchestrate.run_child
+
+    def __call__(self, request, timeout):
+        name = request["stack"][len(PREFIX):]
+        start = time.perf_counter()
+        with self.lock:
+            throttle = self.throttled.get(name, 0) > 0
+            if throttle:
+                self.throttled[name] -= 1
+        if throttle:
+            time.sleep(self.attempt_seconds)
+            result = dict(THROTTLED)
+        else:
+            result = self.run_child(request, timeout)
+        self.attempts.append((name, start, time.perf_counter(), timeout))
+        return result
+
+    def span(self, name):
+        mine = [(start, end) for stack, start, end, _ in self.attempts if stack == name]
+        return min(start for start, _ in mine), max(end for _, end in mine)
+
+
+def run(specs, operation, recorder, concurrency, retries=2, backoff=0.01, timeout=600.0):
+    args = argparse.Namespace(offline=True, backend=None, event_log=None, retries=retries, backoff=backoff,
+                              timeout=timeout)
+    orchestrate.run_child = recorder
+    try:
+        return orchestrate.orchestrate(specs, orchestrate.runner(operation, args), concurrency,
+                                       reverse=operation == "destroy")
+    finally:
+        orchestrate.run_child = recorder.run_child
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    specs = orchestrate.load_stacks(FIXTURE)
+    checks = []
+
+    def check(ok, description, detail=""):
+        print(f"{'ok' if ok else 'FAIL':<5} {description:<44} {detail}")
+        checks.append(ok)
+
+    up = Recorder(throttled={"spoke1": 1})
+    results = {result.name[len(PREFIX):]: result for result in run(specs, "up", up, args.concurrency)}
+    for name, expected in EXPECTED_UP.items():
+        actual = (results[name].status, results[name].attempts)
+        check(actual == expected, f"up {name}", f"{actual[0]} after {actual[1]} attempt(s)")
+    hub_done = up.span("hub")[1]
+    for spoke in ("spoke1", "spoke2"):
+        check(up.span(spoke)[0] >= hub_done, f"{spoke} starts after the hub finishes")
+    timeouts = [timeout for name, _, _, timeout in up.attempts if name == "spoke1"]
+    check(timeouts[1] < timeouts[0] <= 600, "spoke1 retry gets the time left",
+          f"{timeouts[0]:.3f}s, then {timeouts[1]:.3f}s")
+
+    destroy = Recorder()
+    results = run(specs, "destroy", destroy, args.concurrency)
+    check(all(result.status == SUCCEEDED for result in results), "destroy every stack")
+    hub_start = destroy.span("hub")[0]
+    for spoke in ("spoke1", "spoke2"):
+        check(destroy.span(spoke)[1] <= hub_start, f"destroy {spoke} before the hub")
+    check(destroy.span("after-bad-mode")[1] <= destroy.span("bad-mode")[0], "destroy after-bad-mode first")
+
+    # Throttled on every attempt, each taking 0.3s, with a 0.5s budget: the
+    # second attempt gets the 0.2s left and no third one starts.
+    deadline = Recorder(throttled={"hub": 10}, attempt_seconds=0.3)
+    [result] = run([spec for spec in specs if spec.name == PREFIX + "hub"], "up", deadline, args.concurrency,
+                   retries=5, backoff=0.0, timeout=0.5)
+    check(result.status == FAILED and result.attempts == 2, "retries stop at the stack's --timeout",
+          f"{result.status} after {result.attempts} attempt(s) in {result.seconds:.2f}s")
+
+    for error, transient in ERRORS.items():
+        check(bool(orchestrate.TRANSIENT_ERRORS.search(error)) == transient,
+              f"{'retry' if transient else 'do not retry'} {error[:30]!r}")
+
+    sys.exit(0 if all(checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Preview cache behaviour and hit latency, offline.
+
+    python benchmarks/bench_preview_cache.py
+
+Copies the program's inputs into a scratch directory and evaluates the
+program once offline to write a stack export and a matching ARM export.
+Every resource gets a random suffix on its physical name, the way Pulumi
+auto-names them, so the cache only ever sees the physical names.
+``preview_cache.cached_preview`` is then driven with a stand-in preview that
+counts its calls, through a sequence of edits: repeat runs, an etag-only
+refresh, drift in the export, topology, config and ``uv.lock`` changes,
+invalidation, a preview with changes, and LRU eviction. Fails if any step
+hits or misses when it should not. Also reports the time a hit takes (the
+key plus hashing the observed export), which is what a clean CI run pays
+instead of a preview.
+"""
+
+import copy
+import glob
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import drift  # noqa: E402
+import offline  # noqa: E402
+import preview_cache  # noqa: E402
+
+ARM_TYPES = {drift.PEERING: "Microsoft.Network/virtualNetworks/virtualNetworkPeerings",
+             drift.ROUTE_TABLE: "Microsoft.Network/routeTables"}
+SUB = "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg/providers/Microsoft.Network"
+
+
+def fixture(registrations, rng):
+    """A stack export and a matching ARM export of the program's peerings and route tables, physically named."""
+    physical = {r.name: f"{r.name}{rng.getrandbits(28):07x}" for r in registrations}
+    resources, objects = [], []
+    for r in registrations:
+        if r.typ not in ARM_TYPES:
+            continue
+        inputs = {k: physical.get(v, v) if k.endswith("Name") else v for k, v in r.inputs.items()}
+        name = physical[r.name]
+        group = f"{SUB}/resourceGroups/{inputs['resourceGroupName']}/providers/Microsoft.Network"
+        if r.typ == drift.PEERING:
+            arm_id = f"{group}/virtualNetworks/{inputs['virtualNetworkName']}/virtualNetworkPeerings/{name}"
+        else:
+            arm_id = f"{group}/routeTables/{name}"
+        resources.append({"urn": r.urn, "type": r.typ, "id": arm_id, "inputs": inputs,
+                          "outputs": dict(inputs, name=name, id=arm_id)})
+        objects.append({"name": name, "id": arm_id, "type": ARM_TYPES[r.typ], "etag": 'W/"1"',
+                        "properties": dict(drift._desired_props(inputs), provisioningState="Succeeded")})
+    return {"version": 3, "deployment": {"resources": resources}}, objects
+
+
+def write_observed(path, objects, etag='W/"1"', route_prefix=None):
+    """Write ``objects`` as an ARM export; ``route_prefix`` changes the first route it finds."""
+    objects = copy.deepcopy(objects)
+    for obj in objects:
+        obj["etag"] = etag
+        routes = obj["properties"].get("routes")
+        if route_prefix and routes:
+            routes[0]["addressPrefix"] = route_prefix
+            route_prefix = None
+    with open(path, "w") as f:
+        json.dump({"value": objects}, f)
+
+
+def append(path, text):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def main():
+    scratch = tempfile.mkdtemp(prefix="preview-cache-")
+    program = os.path.join(scratch, "program")
+    os.makedirs(program)
+    for pattern in (*preview_cache.PROGRAM_FILES, "Pulumi.*.yaml", "topology.yaml", "uv.lock"):
+        for path in glob.glob(os.path.join(offline.PROGRAM_DIR, pattern)):
+            shutil.copy(path, program)
+    registrations = offline.run_program()
+    export, objects = fixture(registrations, random.Random(0))
+    clean, refreshed, drifted = (os.path.join(scratch, f"{name}.json") for name in ("observed", "refreshed", "drifted"))
+    write_observed(clean, objects)
+    write_observed(refreshed, objects, etag='W/"2"')
+    write_observed(drifted, objects, route_prefix="10.99.0.0/16")
+
+    cache = preview_cache.PreviewCache(os.path.join(scratch, "cache"))
+    previews = []
+    summary = {"same": sum(r.custom for r in registrations)}
+
+    def run_preview():
+        previews.append(time.perf_counter())
+        return dict(summary)
+
+    def step(description, expect_hit, observed=clean, stack="dev"):
+        start = time.perf_counter()
+        outcome = preview_cache.cached_preview(cache, stack, run_preview, observed, lambda: export,
+                                               program_dir=program)
+        elapsed = time.perf_counter() - start
+        ok = outcome.hit == expect_hit
+        print(f"{'ok' if ok else 'FAIL':<5} {description:<44} {'hit' if outcome.hit else 'miss':<5} "
+              f"{elapsed:>6.2f}s  {outcome.reason}")
+        return ok, elapsed
+
+    results = []
+    try:
+        results.append(step("first preview", False))
+        results.append(step("same inputs, no drift", True))
+        hit_seconds = results[-1][1]
+        covered = len(cache.get(cache.entries()[0][0])["observed"])
+        print(f"{'ok' if covered == len(objects) else 'FAIL':<5} {'resources checked on a hit':<44} "
+              f"{covered} of {len(objects)}")
+        results.append((covered == len(objects), 0))
+        results.append(step("same inputs, etags refreshed", True, observed=refreshed))
+        results.append(step("same inputs, no observed state", False, observed=None))
+        results.append(step("same inputs, drifted route", False, observed=drifted))
+        results.append(step("same inputs, drifted route, again", False, observed=drifted))
+        append(os.path.join(program, "topology.yaml"), "\n# edited\n")
+        results.append(step("topology edited", False))
+        results.append(step("topology edited, again", True))
+        append(os.path.join(program, "Pulumi.dev.yaml"), "  network-peering-drift-code:nvaCount: 1\n")
+        results.append(step("stack config edited", False))
+        with open(os.path.join(program, "uv.lock")) as f:
+            lock = f.read()
+        with open(os.path.join(program, "uv.lock"), "w") as f:
+            f.write(lock.replace('name = "pulumi"\nversion = "', 'name = "pulumi"\nversion = "0.', 1))
+        results.append(step("locked package version changed", False))
+        append(os.path.join(program, "uv.lock"), "\n# comment only\n")
+        results.append(step("uv.lock edited, same versions", True))
+        append(os.path.join(program, "hub.py"), "\n")
+        results.append(step("program module edited", False))
+        cache.invalidate()
+        results.append(step("after invalidating everything", False))
+        summary["update"] = 1
+        append(os.path.join(program, "hub.py"), "\n")
+        results.append(step("preview with changes", False))
+        results.append(step("preview with changes, again", False))
+        del summary["update"]
+
+        cache.max_entries = 2
+        for i in range(3):
+            append(os.path.join(program, "Pulumi.dev.yaml"), f"  network-peering-drift-code:lru{i}: x\n")
+            results.append(step(f"LRU entry {i + 1} of 3", False))
+        kept = len(cache.entries())
+        print(f"{'ok' if kept == 2 else 'FAIL':<5} {'entries kept with max_entries=2':<44} {kept}")
+        results.append((kept == 2, 0))
+    finally:
+        shutil.rmtree(scratch)
+
+    print(f"{len(previews)} previews run for {len(results) - 2} lookups; a hit took {hit_seconds:.2f}s")
+    sys.exit(0 if all(ok for ok, _ in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Program evaluation benchmark and regression check, under mocks.
+
+    python benchmarks/bench_program.py [--runs 5] [--update-baseline]
+
+Evaluates ``__main__.py`` offline in fresh interpreters and records the
+number of resources registered, the time spent running the program body
+(``evaluate``), the time spent afterwards resolving the ``Output`` graph
+(``resolve``), the slowest fan-out of a shared output such as ``pw.result``
+or ``shared_key.result`` to its consumers, and peak RSS. The medians are
+printed for comparison between runs on one machine; wall-clock numbers from
+another machine mean little, so they never fail the check. It fails when the
+resource count differs from ``baselines/program.json`` or when a structural
+invariant (peering pairs, gateway transit flags, route table attachment, NVA
+next hops, load balancer pool membership, NVA cloud-init, gateway
+active-active/BGP wiring) is broken.
+
+``--invariants-only`` skips the timings and the resource count, so the invariants can be checked
+for other configurations too::
+
+    python benchmarks/bench_program.py --invariants-only --config nvaCount=4
+    python benchmarks/bench_program.py --invariants-only \
+        --config 'gateway={"sku": "VpnGw2AZ", "mode": "active-active"}'
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+
+PROGRAM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "program.json")
+
+sys.path.insert(0, PROGRAM_DIR)
+
+PEERING = "azure-native:network:VirtualNetworkPeering"
+VNET = "azure-native:network:VirtualNetwork"
+SUBNET = "azure-native:network:Subnet"
+ROUTE_TABLE = "azure-native:network:RouteTable"
+GATEWAY = "azure-native:network:VirtualNetworkGateway"
+CONNECTION = "azure-native:network:VirtualNetworkGatewayConnection"
+PUBLIC_IP = "azure-native:network:PublicIPAddress"
+NIC = "azure-native:network:NetworkInterface"
+VM = "azure-native:compute:VirtualMachine"
+
+TIMED = ("evaluate_seconds", "resolve_seconds", "fanout_seconds", "peak_rss_mb")
+
+
+def fanout_latencies(registrations):
+    """Seconds from registering a resource to registering the last resource that consumes its outputs.
+
+    Only resources with more than one consumer are reported.
+    """
+    consumers = {}
+    for registration in registrations:
+        for urn in registration.dependencies:
+            consumers.setdefault(urn, []).append(registration)
+    latencies = {}
+    for registration in registrations:
+        users = consumers.get(registration.urn, ())
+        if len(users) > 1:
+            latencies[registration.name] = max(u.registered_at for u in users) - registration.registered_at
+    return latencies
+
+
+def gateway_errors(custom, settings):
+    """Check the VPN gateways and connections against the ``gateway`` config."""
+    from offline import name_from_id
+
+    errors = []
+    gateways = {r.name: r for r in custom if r.typ == GATEWAY}
+    public_ips = {r.name: r for r in custom if r.typ == PUBLIC_IP}
+    for gateway in gateways.values():
+        inputs = gateway.inputs
+        pips = [name_from_id(c["publicIPAddress"]["id"]) for c in inputs["ipConfigurations"]]
+        if inputs["sku"]["name"] != settings.sku:
+            errors.append(f"gateway {gateway.name!r} has SKU {inputs['sku']['name']}, expected {settings.sku}")
+        if bool(inputs.get("activeActive")) != settings.active_active:
+            errors.append(f"gateway {gateway.name!r} activeActive does not match gateway.mode {settings.mode}")
+        expected_ips = 2 if settings.active_active else 1
+        if len(set(pips)) != expected_ips:
+            errors.append(f"gateway {gateway.name!r} has {len(set(pips))} distinct public IPs, expected {expected_ips}")
+        if bool(inputs.get("enableBgp")) != settings.bgp:
+            errors.append(f"gateway {gateway.name!r} enableBgp does not match gateway.bgp")
+        if settings.bgp and not inputs.get("bgpSettings", {}).get("asn"):
+            errors.append(f"gateway {gateway.name!r} has BGP enabled but no ASN")
+        for pip in pips:
+            pip_inputs = public_ips.get(pip, {}).inputs if pip in public_ips else {}
+            if settings.zone_redundant and (pip_inputs.get("sku", {}).get("name") != "Standard"
+                                            or len(pip_inputs.get("zones") or ()) < 3):
+                errors.append(f"public IP {pip!r} of zone-redundant gateway {gateway.name!r} "
+                              f"must be a Standard SKU in three zones")
+
+    connections = {}
+    for connection in (r for r in custom if r.typ == CONNECTION):
+        local = name_from_id(connection.inputs["virtualNetworkGateway1"]["id"])
+        remote = name_from_id(connection.inputs["virtualNetworkGateway2"]["id"])
+        connections[(local, remote)] = connection
+        if bool(connection.inputs.get("enableBgp")) != settings.bgp:
+            errors.append(f"connection {connection.name!r} enableBgp does not match gateway.bgp")
+    for (local, remote), connection in connections.items():
+        if (remote, local) not in connections:
+            errors.append(f"connection {connection.name!r} ({local} -> {remote}) has no reverse connection")
+        if settings.bgp and local in gateways and remote in gateways:
+            asns = [gateways[g].inputs.get("bgpSettings", {}).get("asn") for g in (local, remote)]
+            if asns[0] == asns[1]:
+                errors.append(f"connection {connection.name!r} joins two gateways with ASN {asns[0]}")
+    return errors
+
+
+def cloud_init_errors(custom):
+    """Check that every NVA VM turns on IP forwarding from its cloud-init custom data."""
+    import base64
+
+    import yaml
+
+    from offline import name_from_id
+
+    errors = []
+    appliance_nics = {r.name for r in custom if r.typ == NIC and r.inputs.get("enableIPForwarding")
+                      and any(c.get("privateIPAddress") or c.get("loadBalancerBackendAddressPools")
+                              for c in r.inputs.get("ipConfigurations", ()))}
+    for vm in (r for r in custom if r.typ == VM):
+        nics = {name_from_id(n["id"]) for n in vm.inputs["networkProfile"]["networkInterfaces"]}
+        if not nics & appliance_nics:
+            continue
+        custom_data = vm.inputs["osProfile"].get("customData")
+        if not custom_data:
+            errors.append(f"NVA VM {vm.name!r} has no cloud-init custom data")
+            continue
+        cloud_config = yaml.safe_load(base64.b64decode(custom_data))
+        files = "\n".join(f.get("content", "") for f in cloud_config.get("write_files", ()))
+        if "net.ipv4.ip_forward = 1" not in files:
+            errors.append(f"cloud-init of NVA VM {vm.name!r} does not enable IP forwarding")
+    return errors
+
+
+def invariant_errors(registrations):
+    """Return a list of structural problems in the registered resources.
+
+    Call after ``offline.run_program`` so the topology is read with the same config.
+    """
+    from pulumi import Config
+
+    import reachability
+    from gateways import gateway_settings
+    from offline import name_from_id
+    from topology import load_topology
+
+    errors = []
+    custom = [r for r in registrations if r.custom]
+    seen = set()
+    for registration in custom:
+        key = (registration.typ, registration.name)
+        if key in seen:
+            errors.append(f"{registration.typ} {registration.name!r} is registered twice")
+        seen.add(key)
+
+    vnets = {r.name for r in custom if r.typ == VNET}
+    gateways = {r.urn for r in custom if r.typ == GATEWAY}
+    peerings = {(r.inputs.get("virtualNetworkName"), name_from_id(r.inputs["remoteVirtualNetwork"]["id"])): r
+                for r in custom if r.typ == PEERING}
+
+    for (local, remote), peering in peerings.items():
+        if remote not in vnets:
+            errors.append(f"peering {peering.name!r} points at unknown VNet {remote!r}")
+        if (remote, local) not in peerings:
+            errors.append(f"peering {peering.name!r} ({local} -> {remote}) has no reverse peering")
+        if not (peering.inputs.get("allowVirtualNetworkAccess") and peering.inputs.get("allowForwardedTraffic")):
+            errors.append(f"peering {peering.name!r} must allow VNet access and forwarded traffic")
+        if peering.inputs.get("allowGatewayTransit") and peering.inputs.get("useRemoteGateways"):
+            errors.append(f"peering {peering.name!r} both offers and uses gateway transit")
+        if peering.inputs.get("useRemoteGateways"):
+            reverse = peerings.get((remote, local))
+            if reverse is not None and not reverse.inputs.get("allowGatewayTransit"):
+                errors.append(f"peering {peering.name!r} uses remote gateways but {reverse.name!r} "
+                              f"does not allow gateway transit")
+            if not gateways & set(peering.dependencies):
+                errors.append(f"peering {peering.name!r} uses remote gateways but does not wait for a gateway")
+
+    config = Config()
+    model = reachability.model_from_registrations(registrations)
+    for table in (r for r in custom if r.typ == ROUTE_TABLE):
+        for route in table.inputs.get("routes", ()):
+            next_hop = route.get("nextHopIpAddress")
+            if route["nextHopType"] == "VirtualAppliance" and next_hop not in model.appliances:
+                errors.append(f"route {table.name}/{route['name']} points at {next_hop}, "
+                              f"which is neither an IP-forwarding NIC nor an HA ports frontend")
+
+    nva_count = config.get_int("nvaCount") or 1
+    if nva_count > 1:
+        members = reachability.pool_members(registrations)
+        ha_pools = {name_from_id(rule["backendAddressPool"]["id"])
+                    for lb in custom if lb.typ == reachability.LOAD_BALANCER
+                    for rule in lb.inputs.get("loadBalancingRules", ()) if reachability.is_ha_ports(rule)}
+        if len(ha_pools) != 1:
+            errors.append(f"expected one HA ports backend pool for {nva_count} NVAs, found {len(ha_pools)}")
+        for pool in ha_pools:
+            if len(members.get(pool, ())) != nva_count:
+                errors.append(f"backend pool {pool!r} has {len(members.get(pool, ()))} IP-forwarding members, "
+                              f"expected {nva_count}")
+
+    errors += cloud_init_errors(custom)
+    errors += gateway_errors(custom, gateway_settings(config))
+
+    topology = load_topology(config)
+    hub_vnet = f"{topology.hub.name}-vnet"
+    subnets = {r.name: r for r in custom if r.typ == SUBNET}
+    for spoke in topology.spokes:
+        spoke_vnet = f"{spoke.name}-vnet"
+        # Peering resources or, with Virtual Network Manager, the peerings it creates.
+        outbound, inbound = model.peerings.get((spoke_vnet, hub_vnet)), model.peerings.get((hub_vnet, spoke_vnet))
+        if outbound is None or inbound is None:
+            errors.append(f"spoke {spoke.name!r} is not peered both ways with {hub_vnet!r}")
+            continue
+        if not outbound.use_remote_gateways:
+            errors.append(f"peering {spoke_vnet} -> {hub_vnet} must use the hub's gateways")
+        if not inbound.allow_gateway_transit:
+            errors.append(f"peering {hub_vnet} -> {spoke_vnet} must allow gateway transit")
+        for subnet in spoke.subnets:
+            registered = subnets.get(f"{spoke.name}-{subnet.name}")
+            if registered is None:
+                errors.append(f"subnet {spoke.name}-{subnet.name} is missing")
+            elif subnet.route_table != bool(registered.inputs.get("routeTable")):
+                errors.append(f"subnet {registered.name!r} route table attachment does not match the topology")
+    return errors
+
+
+def measure(config=None):
+    import azure_sdk  # noqa: F401  keep SDK import cost out of the timing
+    import offline
+
+    timings = {}
+    registrations = offline.run_program(config=config, timings=timings)
+    return {
+        "resources": sum(r.custom for r in registrations),
+        "evaluate_seconds": timings["evaluate"],
+        "resolve_seconds": timings["resolve"],
+        "fanout_seconds": max(fanout_latencies(registrations).values(), default=0.0),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "errors": invariant_errors(registrations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--invariants-only", action="store_true", help="check invariants without timing or baselines")
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    config = dict(item.split("=", 1) for item in args.config)
+
+    if args.child:
+        print(json.dumps(measure(config)))
+        return
+
+    if args.invariants_only:
+        errors = measure(config)["errors"]
+        for error in errors:
+            print(f"INVARIANT: {error}", file=sys.stderr)
+        print(f"{len(errors)} invariant violation(s)")
+        sys.exit(1 if errors else 0)
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, __file__, "--child", "--config", *args.config],
+                             cwd=PROGRAM_DIR, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    result = {"resources": runs[-1]["resources"]}
+    result.update((key, round(statistics.median(r[key] for r in runs), 3)) for key in TIMED)
+
+    print(f"resources: {result['resources']}")
+    for key in TIMED:
+        print(f"{key}: {result[key]}")
+
+    failures = [f"invariant: {error}" for error in runs[-1]["errors"]]
+
+    if args.update_baseline and not failures:
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        with open(BASELINE, "w") as f:
+            json.dump({"resources": result["resources"]}, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {os.path.relpath(BASELINE, PROGRAM_DIR)}")
+        return
+
+    if not args.update_baseline:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        if result["resources"] != baseline["resources"]:
+            failures.append(f"resource count {result['resources']} differs from baseline {baseline['resources']} "
+                            f"(run with --update-baseline if the change is intended)")
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Reachability simulator throughput against spoke count, under mocks.
+
+    python benchmarks/bench_reachability.py [--spokes 10 100] [--queries 1000000]
+
+Reports the time to build the simulator (effective routes and compiled
+tables for every subnet), the time to trace every subnet pair, and batch
+query throughput for random destination addresses from one subnet.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_spokes import synthetic_topology  # noqa: E402
+
+
+def measure(count, queries):
+    import offline
+    import reachability
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(synthetic_topology(count), f)
+    try:
+        model = reachability.model_from_registrations(offline.run_program(config={"topologyFile": f.name}))
+    finally:
+        os.unlink(f.name)
+
+    start = time.perf_counter()
+    simulator = reachability.Simulator(model)
+    built = time.perf_counter()
+    pairs = sum(1 for _ in simulator.matrix())
+    traced = time.perf_counter()
+
+    rng = random.Random(0)
+    addresses = [rng.getrandbits(32) for _ in range(queries)]
+    source = sorted(model.subnets)[-1]
+    query_start = time.perf_counter()
+    simulator.query(source, addresses)
+    query_seconds = time.perf_counter() - query_start
+    return {
+        "spokes": count,
+        "subnets": len(model.subnets),
+        "build_seconds": round(built - start, 3),
+        "pairs": pairs,
+        "matrix_seconds": round(traced - built, 3),
+        "queries_per_second": round(queries / query_seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spokes", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--queries", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{'spokes':>8} {'subnets':>8} {'build s':>8} {'pairs':>8} {'matrix s':>9} {'queries/s':>12}")
+    for count in args.spokes:
+        r = measure(count, args.queries)
+        print(f"{r['spokes']:>8} {r['subnets']:>8} {r['build_seconds']:>8} {r['pairs']:>8} "
+              f"{r['matrix_seconds']:>9} {r['queries_per_second']:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Program evaluation time and memory against spoke count, under mocks.
+
+    python benchmarks/bench_spokes.py [--spokes 10 100 390]
+
+Each spoke count is evaluated in a fresh interpreter so peak RSS is not
+polluted by the previous run. The synthetic spokes are packed into one
+pool and summarize to routes less specific than any of them, so every spoke
+must share one route table; fails if they compile to more.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SPOKE_POOL = ipaddress.ip_network("10.64.0.0/10")
+
+
+def synthetic_topology(count, new_prefix=20):
+    spokes = []
+    for i, net in zip(range(count), SPOKE_POOL.subnets(new_prefix=new_prefix)):
+        mgmt, workload = list(net.subnets(new_prefix=24))[:2]
+        spokes.append({
+            "name": f"spoke{i + 1}",
+            "address_prefixes": [str(net)],
+            "subnets": [
+                {"name": "mgmt", "address_prefix": str(mgmt)},
+                {"name": "workload", "address_prefix": str(workload)},
+            ],
+        })
+    return {"spoke_pool": str(SPOKE_POOL), "spokes": spokes}
+
+
+def measure(count):
+    import offline
+    import azure_sdk  # noqa: F401  keep SDK import cost out of the timing
+    from routes import spoke_route_tables
+    from topology import parse_topology
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(synthetic_topology(count), f)
+    try:
+        start = time.perf_counter()
+        registrations = offline.run_program(config={"topologyFile": f.name})
+        elapsed = time.perf_counter() - start
+    finally:
+        os.unlink(f.name)
+    return {
+        "spokes": count,
+        "resources": len(registrations),
+        "route_tables": len(spoke_route_tables(parse_topology(synthetic_topology(count)), "10.0.0.36")),
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spokes", type=int, nargs="+", default=[10, 100, 390])
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child)))
+        return
+
+    print(f"{'spokes':>8} {'resources':>10} {'tables':>7} {'seconds':>9} {'s/spoke':>9} {'peak MB':>9}")
+    shared = True
+    for count in args.spokes:
+        out = subprocess.run([sys.executable, __file__, "--child", str(count)],
+                             check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['spokes']:>8} {r['resources']:>10} {r['route_tables']:>7} {r['seconds']:>9} "
+              f"{r['seconds'] / r['spokes']:>9.4f} {r['peak_rss_mb']:>9}")
+        if r["route_tables"] != 1:
+            print(f"FAIL: {count} spokes compiled to {r['route_tables']} route tables, expected 1 shared",
+                  file=sys.stderr)
+            shared = False
+    sys.exit(0 if shared else 1)
+
+
+if __name__ == "__main__":
+    main()
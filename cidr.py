@@ -0,0 +1,114 @@
+"""Offline address planning: a prefix allocator and an overlap index.
+
+CIDR blocks are either nested or disjoint, so sorting them by (start, -end)
+and sweeping with a stack of open blocks finds every overlap in
+O(n log n + overlaps) rather than comparing every pair.
+"""
+
+import bisect
+from ipaddress import ip_network
+from typing import NamedTuple
+
+
+class AllocationError(ValueError):
+    pass
+
+
+class Overlap(NamedTuple):
+    outer: str
+    outer_prefix: str
+    inner: str
+    inner_prefix: str
+
+    def __str__(self):
+        return f"{self.inner} ({self.inner_prefix}) overlaps {self.outer} ({self.outer_prefix})"
+
+
+class PrefixAllocator:
+    """Buddy allocator handing out non-overlapping prefixes from ``pool``.
+
+    Free blocks are kept per prefix length as sorted network addresses, so
+    ``allocate`` always returns the lowest free block of the requested size.
+    """
+
+    def __init__(self, pool):
+        self.pool = ip_network(pool)
+        self._free = {self.pool.prefixlen: [int(self.pool.network_address)]}
+
+    def _take(self, prefixlen, address):
+        blocks = self._free.get(prefixlen, [])
+        i = bisect.bisect_left(blocks, address)
+        if i < len(blocks) and blocks[i] == address:
+            del blocks[i]
+            return True
+        return False
+
+    def _give(self, prefixlen, address):
+        bisect.insort(self._free.setdefault(prefixlen, []), address)
+
+    def _split(self, prefixlen, address, target):
+        """Split the free block at ``prefixlen`` down to the one holding ``target``."""
+        width = self.pool.max_prefixlen
+        while prefixlen < target.prefixlen:
+            prefixlen += 1
+            upper = address + (1 << (width - prefixlen))
+            if int(target.network_address) >= upper:
+                self._give(prefixlen, address)
+                address = upper
+            else:
+                self._give(prefixlen, upper)
+
+    def reserve(self, prefix):
+        net = ip_network(prefix)
+        if net.version != self.pool.version or not net.subnet_of(self.pool):
+            raise AllocationError(f"{net} is outside pool {self.pool}")
+        for prefixlen in range(net.prefixlen, self.pool.prefixlen - 1, -1):
+            block = net.supernet(new_prefix=prefixlen)
+            if self._take(prefixlen, int(block.network_address)):
+                self._split(prefixlen, int(block.network_address), net)
+                return net
+        raise AllocationError(f"{net} overlaps an existing allocation in {self.pool}")
+
+    def allocate(self, prefixlen):
+        if prefixlen < self.pool.prefixlen or prefixlen > self.pool.max_prefixlen:
+            raise AllocationError(f"/{prefixlen} does not fit in pool {self.pool}")
+        for length in range(prefixlen, self.pool.prefixlen - 1, -1):
+            blocks = self._free.get(length)
+            if blocks:
+                address = blocks.pop(0)
+                net = ip_network((address, prefixlen))
+                self._split(length, address, net)
+                return net
+        raise AllocationError(f"pool {self.pool} has no free /{prefixlen}")
+
+
+def find_overlaps(prefixes):
+    """Return every overlapping pair among ``prefixes``, an iterable of (label, prefix)."""
+    entries = []
+    for label, prefix in prefixes:
+        net = ip_network(prefix)
+        start = int(net.network_address)
+        entries.append((net.version, start, -(start + net.num_addresses - 1), label, str(net)))
+    entries.sort()
+
+    overlaps = []
+    open_blocks = []
+    for version, start, neg_end, label, prefix in entries:
+        while open_blocks and (open_blocks[-1][0] != version or -open_blocks[-1][1] < start):
+            open_blocks.pop()
+        for _, _, outer, outer_prefix in open_blocks:
+            overlaps.append(Overlap(outer, outer_prefix, label, prefix))
+        open_blocks.append((version, neg_end, label, prefix))
+    return overlaps
+
+
+def duplicate_prefixes(prefixes):
+    """Return (label, prefix) pairs whose prefix was already seen earlier in ``prefixes``."""
+    seen = set()
+    duplicates = []
+    for label, prefix in prefixes:
+        net = ip_network(prefix)
+        if net in seen:
+            duplicates.append((label, str(net)))
+        seen.add(net)
+    return duplicates
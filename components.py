@@ -0,0 +1,62 @@
+from pulumi import ROOT_STACK_RESOURCE, Alias, ComponentResource, ResourceOptions
+
+from azure_sdk import compute
+
+TYPE_PREFIX = "hubspoke:index"
+
+
+class NetworkComponent(ComponentResource):
+    """Base for the program's components.
+
+    Children used to be declared at the top level of the stack; the alias to
+    the root stack keeps existing resources from being replaced now that they
+    have a parent.
+    """
+
+    def __init__(self, typ, name, opts=None):
+        super().__init__(f"{TYPE_PREFIX}:{typ}", name, None, opts)
+
+    def child_opts(self, **kwargs):
+        return ResourceOptions(parent=self, aliases=[Alias(parent=ROOT_STACK_RESOURCE)], **kwargs)
+
+
+def linux_vm(name, resource_group_name, nic_id, computer_name, admin_password, opts, os_disk_name=None,
+             custom_data=None, tags=None):
+    return compute.VirtualMachine(name,
+                                  resource_group_name=resource_group_name,
+                                  tags=tags,
+                                  hardware_profile=compute.HardwareProfileArgs(
+                                      vm_size=compute.VirtualMachineSizeTypes.STANDARD_DS1_V2
+                                  ),
+                                  storage_profile=compute.StorageProfileArgs(
+                                      image_reference=compute.ImageReferenceArgs(
+                                          offer="ubuntu-24_04-lts",
+                                          publisher="Canonical",
+                                          sku="server",
+                                          version="latest"
+                                      ),
+                                      os_disk=compute.OSDiskArgs(
+                                          name=os_disk_name,
+                                          caching=compute.CachingTypes.READ_WRITE,
+                                          create_option="FromImage",
+                                          managed_disk=compute.ManagedDiskParametersArgs(
+                                              storage_account_type=compute.StorageAccountTypes.STANDARD_LRS
+                                          )
+                                      ),
+                                  ),
+                                  os_profile=compute.OSProfileArgs(
+                                      computer_name=computer_name,
+                                      admin_password=admin_password,
+                                      admin_username="pk-admin",
+                                      custom_data=custom_data,
+                                      linux_configuration=compute.LinuxConfigurationArgs(
+                                          disable_password_authentication=False
+                                      )
+                                  ),
+                                  network_profile=compute.NetworkProfileArgs(
+                                      network_interfaces=[compute.NetworkInterfaceReferenceArgs(
+                                          id=nic_id
+                                      )]
+                                  ),
+                                  opts=opts
+                                  )
@@ -0,0 +1,162 @@
+"""Estimate ``pulumi up`` wall-clock time from the program's resource graph.
+
+    python critical_path.py [--durations durations.json] [--config key=value ...]
+
+The program is evaluated offline (see ``offline.py``); every resource gets an
+estimated create time from a per-type duration table and the longest path
+through the dependency graph is the deployment's critical path. Explicit
+``depends_on`` edges that hold a resource back without being required are
+reported together with how much total time dropping them would save.
+"""
+
+import argparse
+import json
+from collections import deque
+from typing import NamedTuple
+
+import offline
+
+GATEWAY = "azure-native:network:VirtualNetworkGateway"
+PEERING = "azure-native:network:VirtualNetworkPeering"
+
+# Typical create times in minutes.
+DEFAULT_DURATIONS = {
+    GATEWAY: 35.0,
+    "azure-native:network:VirtualNetworkGatewayConnection": 2.0,
+    "azure-native:compute:VirtualMachine": 4.0,
+    "azure-native:compute:VirtualMachineExtension": 3.0,
+    PEERING: 1.0,
+    "azure-native:network:VirtualNetwork": 0.5,
+    "azure-native:network:Subnet": 0.5,
+    "azure-native:network:NetworkInterface": 0.5,
+    "azure-native:network:PublicIPAddress": 0.5,
+    "azure-native:network:RouteTable": 0.5,
+    "azure-native:network:NetworkSecurityGroup": 0.5,
+    "azure-native:resources:ResourceGroup": 0.25,
+    "random:index/randomPassword:RandomPassword": 0.0,
+    "random:index/randomUuid:RandomUuid": 0.0,
+}
+DEFAULT_DURATION = 0.5
+
+
+class Node(NamedTuple):
+    urn: str
+    name: str
+    typ: str
+    inputs: dict
+    duration: float
+    dependencies: frozenset
+    explicit: frozenset
+
+
+class Schedule(NamedTuple):
+    total: float
+    path: list
+    finish: dict
+
+
+class PrunableEdge(NamedTuple):
+    resource: str
+    depends_on: str
+    saving: float
+
+
+def _requires_remote_gateway(node, dependency):
+    return node.typ == PEERING and bool(node.inputs.get("useRemoteGateways")) and dependency.typ == GATEWAY
+
+
+# (dependent, dependency) -> True when the explicit depends_on edge must stay.
+REQUIRED_DEPENDS_ON = [_requires_remote_gateway]
+
+
+def build_graph(registrations, durations=None):
+    durations = {**DEFAULT_DURATIONS, **(durations or {})}
+    graph = {}
+    for r in registrations:
+        from_inputs = {urn for urns in r.property_dependencies.values() for urn in urns}
+        duration = durations.get(r.typ, DEFAULT_DURATION) if r.custom else 0.0
+        graph[r.urn] = Node(urn=r.urn, name=r.name, typ=r.typ, inputs=r.inputs, duration=duration,
+                            dependencies=frozenset(r.dependencies),
+                            explicit=frozenset(set(r.dependencies) - from_inputs))
+    return graph
+
+
+def schedule(graph, without=None):
+    """Earliest finish time of every resource, optionally ignoring one (resource, dependency) edge."""
+    dependents = {urn: [] for urn in graph}
+    pending = {}
+    for node in graph.values():
+        deps = [d for d in node.dependencies if d in graph and (node.urn, d) != without]
+        pending[node.urn] = len(deps)
+        for d in deps:
+            dependents[d].append(node.urn)
+
+    finish, via = {}, {}
+    ready = deque(urn for urn, count in pending.items() if count == 0)
+    while ready:
+        urn = ready.popleft()
+        node = graph[urn]
+        start, before = 0.0, None
+        for d in node.dependencies:
+            if d in finish and (urn, d) != without and finish[d] > start:
+                start, before = finish[d], d
+        finish[urn], via[urn] = start + node.duration, before
+        for dependent in dependents[urn]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+    if len(finish) != len(graph):
+        raise ValueError("resource graph has a cycle")
+
+    end = max(finish, key=finish.get, default=None)
+    path = []
+    while end is not None:
+        path.append(graph[end])
+        end = via[end]
+    return Schedule(total=max(finish.values(), default=0.0), path=path[::-1], finish=finish)
+
+
+def prunable_depends_on(graph, baseline=None):
+    """Explicit depends_on edges that delay their resource and are not required."""
+    baseline = baseline or schedule(graph)
+    edges = []
+    for node in graph.values():
+        start = baseline.finish[node.urn] - node.duration
+        for d in node.explicit:
+            if d not in graph or baseline.finish[d] < start:
+                continue
+            if any(rule(node, graph[d]) for rule in REQUIRED_DEPENDS_ON):
+                continue
+            pruned = schedule(graph, without=(node.urn, d))
+            edges.append(PrunableEdge(node.name, graph[d].name, baseline.total - pruned.total))
+    return sorted(edges, key=lambda e: -e.saving)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", help="JSON object of resource type -> minutes, overriding the defaults")
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    args = parser.parse_args()
+
+    durations = None
+    if args.durations:
+        with open(args.durations) as f:
+            durations = json.load(f)
+    config = dict(item.split("=", 1) for item in args.config)
+
+    graph = build_graph(offline.run_program(config=config), durations)
+    result = schedule(graph)
+
+    print(f"Estimated wall-clock time: {result.total:.2f} min ({len(graph)} resources)\n")
+    print("Critical path:")
+    for node in result.path:
+        print(f"  {result.finish[node.urn]:7.2f}  {node.name}  ({node.typ}, {node.duration:g} min)")
+
+    edges = prunable_depends_on(graph, result)
+    print(f"\nUnrequired depends_on edges holding resources back: {len(edges)}")
+    for e in edges:
+        print(f"  {e.resource} -> {e.depends_on}: saves {e.saving:.2f} min")
+
+
+if __name__ == "__main__":
+    main()
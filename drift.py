@@ -0,0 +1,228 @@
+"""Drift detection for VNet peerings and route tables.
+
+    python drift.py STATE OBSERVED [--cache .drift-cache.json]
+
+Desired state comes from a ``pulumi stack export`` file, since only the
+stack knows the physical (auto-named) names Azure has. Observed state is an
+Azure-style JSON export: a file or directory of ARM resource objects, either
+bare, as a list or wrapped in ``{"value": [...]}``. Both sides are keyed on
+the ARM resource id.
+
+Both sides are normalized before comparing: etags, provisioning state,
+resource GUIDs and ids are dropped, ARM ``properties`` envelopes are
+flattened, named lists are compared as sets and resource references are
+compared by name. Only fields the program sets are checked, except for route
+lists, where an extra route is drift too.
+
+Every resource pair is content-hashed after normalizing, so a refresh that
+only moves etags or provisioning state hashes the same; with a cache file, a
+repeat run only re-diffs the pairs whose hash changed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import NamedTuple
+
+from offline import name_from_id
+
+PEERING = "azure-native:network:VirtualNetworkPeering"
+ROUTE_TABLE = "azure-native:network:RouteTable"
+
+ARM_TYPES = {
+    "microsoft.network/virtualnetworks/virtualnetworkpeerings": PEERING,
+    "microsoft.network/routetables": ROUTE_TABLE,
+}
+
+VOLATILE_FIELDS = {"etag", "provisioningState", "resourceGuid", "id", "type"}
+
+# Resource inputs that only locate the resource; the id they make up is the key.
+LOCATION_FIELDS = {"resourceGroupName", "virtualNetworkName", "virtualNetworkPeeringName",
+                   "routeTableName", "location", "name"}
+
+
+class Drift(NamedTuple):
+    key: tuple
+    path: str
+    desired: object
+    observed: object
+
+    def __str__(self):
+        if not self.path:
+            return f"{'/'.join(self.key[1:])}: missing from observed state"
+        return f"{'/'.join(self.key[1:])}: {self.path}: desired {self.desired!r}, observed {self.observed!r}"
+
+
+def resource_key(typ, arm_id):
+    """(kind, resource group, [vnet,] name) from an ARM resource id, lowercased."""
+    parts = arm_id.lower().split("/")
+    group = parts[parts.index("resourcegroups") + 1]
+    if typ == PEERING:
+        return ("peering", group, parts[parts.index("virtualnetworks") + 1], parts[-1])
+    return ("routeTable", group, parts[-1])
+
+
+def _is_reference(value):
+    return isinstance(value, dict) and set(value) == {"id"}
+
+
+def normalize(value):
+    """Canonical form of a desired or observed property tree."""
+    if _is_reference(value):
+        return {"id": name_from_id(value["id"]).lower()} if isinstance(value["id"], str) else None
+    if isinstance(value, dict):
+        flat = {k: v for k, v in value.items() if k != "properties"}
+        flat.update(value.get("properties") or {})
+        return {k: normalize(v) for k, v in flat.items() if k not in VOLATILE_FIELDS and v is not None}
+    if isinstance(value, list):
+        items = [normalize(v) for v in value]
+        if all(isinstance(i, dict) and "name" in i for i in items):
+            return sorted(items, key=lambda i: str(i["name"]).lower())
+        return sorted(items, key=lambda i: json.dumps(i, sort_keys=True).lower())
+    return value
+
+
+def _equal(desired, observed):
+    if isinstance(desired, str) and isinstance(observed, str):
+        return desired.casefold() == observed.casefold()
+    return desired == observed
+
+
+def diff(key, desired, observed, path=""):
+    """Differences between normalized ``desired`` and ``observed``, checking only what desired sets."""
+    if isinstance(desired, dict) and isinstance(observed, dict):
+        drifts = []
+        for k, v in desired.items():
+            drifts += diff(key, v, observed.get(k), f"{path}.{k}" if path else k)
+        return drifts
+    if isinstance(desired, list) and isinstance(observed, list):
+        if all(isinstance(i, dict) and "name" in i for i in desired + observed):
+            by_name = {str(i["name"]).lower(): i for i in observed}
+            drifts = []
+            for item in desired:
+                name = str(item["name"]).lower()
+                drifts += diff(key, item, by_name.pop(name, None), f"{path}[{item['name']}]")
+            drifts += [Drift(key, f"{path}[{i['name']}]", None, i) for i in by_name.values()]
+            return drifts
+        if len(desired) == len(observed) and all(_equal(d, o) for d, o in zip(desired, observed)):
+            return []
+        return [Drift(key, path, desired, observed)]
+    if not _equal(desired, observed):
+        return [Drift(key, path, desired, observed)]
+    return []
+
+
+def content_hash(desired, observed):
+    """Hash of a normalized pair."""
+    payload = json.dumps([desired, observed], sort_keys=True, default=str).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class DriftEngine:
+    """Diffs desired against observed state, skipping pairs whose content hash is cached."""
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+        self.rediffed = 0
+
+    def run(self, desired, observed):
+        """``desired``/``observed`` map resource keys to raw property trees; returns all drift."""
+        cache = {}
+        drifts = []
+        for key in sorted(desired.keys() | observed.keys()):
+            cache_key = "/".join(key)
+            if key not in observed:
+                drifts.append(Drift(key, "", "present", None))
+                continue
+            if key not in desired:
+                continue
+            wanted, actual = normalize(desired[key]), normalize(observed[key])
+            digest = content_hash(wanted, actual)
+            cached = self.cache.get(cache_key)
+            if cached and cached["hash"] == digest:
+                found = [Drift(key, *d) for d in cached["drift"]]
+            else:
+                self.rediffed += 1
+                found = diff(key, wanted, actual)
+            cache[cache_key] = {"hash": digest, "drift": [list(d[1:]) for d in found]}
+            drifts += found
+        self.cache = cache
+        if self.cache_path:
+            with open(self.cache_path, "w") as f:
+                json.dump(cache, f)
+        return drifts
+
+
+def _desired_props(inputs):
+    return {k: v for k, v in inputs.items() if k not in LOCATION_FIELDS}
+
+
+def desired_from_stack_export(export):
+    """Desired properties of the stack's peerings and route tables, keyed on their ARM ids.
+
+    Resources the stack has not created yet have no id and are skipped.
+    """
+    desired = {}
+    for resource in export.get("deployment", export).get("resources", []):
+        if resource.get("type") not in (PEERING, ROUTE_TABLE):
+            continue
+        arm_id = resource.get("id") or resource.get("outputs", {}).get("id")
+        if arm_id:
+            desired[resource_key(resource["type"], arm_id)] = _desired_props(resource.get("inputs", {}))
+    return desired
+
+
+def load_state(path):
+    with open(path) as f:
+        return desired_from_stack_export(json.load(f))
+
+
+def _arm_objects(document):
+    if isinstance(document, list):
+        return document
+    if "value" in document:
+        return document["value"]
+    return [document]
+
+
+def load_observed(path):
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, p) for p in os.listdir(path) if p.endswith(".json"))
+    observed = {}
+    for p in paths:
+        with open(p) as f:
+            for obj in _arm_objects(json.load(f)):
+                typ = ARM_TYPES.get(str(obj.get("type", "")).lower())
+                if typ is None:
+                    continue
+                observed[resource_key(typ, obj["id"])] = obj
+    return observed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("state", help="pulumi stack export file")
+    parser.add_argument("observed", help="ARM JSON export file or directory")
+    parser.add_argument("--cache", help="content-hash cache file for incremental runs")
+    args = parser.parse_args()
+
+    desired = load_state(args.state)
+
+    engine = DriftEngine(args.cache)
+    drifts = engine.run(desired, load_observed(args.observed))
+    for d in drifts:
+        print(d)
+    print(f"{len(drifts)} drifted field(s) across {len(desired)} resource(s); {engine.rediffed} re-diffed",
+          file=sys.stderr)
+    sys.exit(1 if drifts else 0)
+
+
+if __name__ == "__main__":
+    main()
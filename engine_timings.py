@@ -0,0 +1,198 @@
+"""Per-resource deployment timings from Pulumi engine events.
+
+    python engine_timings.py LOG [LOG ...] [--config key=value ...] [--ops create update ...]
+
+``EventLog`` is an Automation API ``on_event`` callback. It appends a JSON
+line to a log when each resource step starts and when it ends
+(``orchestrate.py --event-log`` wires it in). The reporter replays these
+logs, or raw ``pulumi up --event-log`` files, without touching Azure. It
+prints p50/p95 step durations per resource type. It also prints the realized
+critical path of each run: the chain of steps, from the last one to
+finish, that each waited on the latest-finishing of its dependencies. The
+dependencies come from the program evaluated offline (see ``offline.py``).
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import NamedTuple
+
+# Steps that do work in Azure; "same", "read" and "refresh" finish instantly or are not part of an update.
+DEFAULT_OPS = ("create", "update", "delete", "replace", "create-replacement", "delete-replaced")
+
+
+class Step(NamedTuple):
+    run: str
+    urn: str
+    typ: str
+    op: str
+    start: float
+    end: float
+    failed: bool
+
+    @property
+    def name(self):
+        return self.urn.rsplit("::", 1)[-1]
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+def event_record(event, t):
+    """The log record for an engine event at time ``t``, or None if it is not a custom resource step."""
+    for kind, payload in (("start", event.resource_pre_event), ("end", event.res_outputs_event),
+                          ("failed", event.res_op_failed_event)):
+        if payload is None:
+            continue
+        if getattr(payload, "planning", None):
+            return None
+        meta = payload.metadata
+        state = meta.new or meta.old
+        if state is not None and state.custom is False:
+            return None
+        return {"t": t, "step": kind, "op": getattr(meta.op, "value", meta.op), "type": meta.type, "urn": meta.urn}
+    return None
+
+
+class EventLog:
+    """Append resource step starts and ends to ``path`` as JSON lines; pass as ``on_event``."""
+
+    def __init__(self, path, stack="", run=None):
+        self.path = path
+        self.stack = stack
+        self.run = run or f"{stack}@{time.strftime('%Y%m%dT%H%M%S')}.{os.getpid()}"
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        record = event_record(event, time.time())
+        if record is None:
+            return
+        record.update(run=self.run, stack=self.stack)
+        # One write per line, so stacks sharing a log interleave whole records.
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def read_log(path):
+    """Yield the records in an ``EventLog`` file or a raw ``pulumi --event-log`` file."""
+    from pulumi.automation import EngineEvent
+
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "sequence" in data:
+                # Raw engine events only carry whole-second timestamps.
+                data = event_record(EngineEvent.from_json(data), data.get("timestamp", 0))
+                if data is None:
+                    continue
+                data["run"] = os.path.basename(path)
+            yield data
+
+
+def steps_from_records(records):
+    starts, steps = {}, []
+    for record in records:
+        key = (record["run"], record["urn"], record["op"])
+        if record["step"] == "start":
+            starts[key] = record["t"]
+        elif key in starts:
+            steps.append(Step(record["run"], record["urn"], record["type"], record["op"], starts.pop(key),
+                              record["t"], record["step"] == "failed"))
+    return steps
+
+
+def percentile(values, q):
+    values = sorted(values)
+    rank = (len(values) - 1) * q
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def program_dependencies(config=None):
+    """(type, name) -> the (type, name) of every custom resource it depends on, from an offline evaluation."""
+    import offline
+
+    registrations = offline.run_program(config=config)
+    keys = {r.urn: (r.typ, r.name) for r in registrations if r.custom}
+    return {keys[r.urn]: {keys[d] for d in r.dependencies if d in keys} for r in registrations if r.custom}
+
+
+def realized_critical_path(steps, dependencies=None):
+    """The steps, in order, that the last step of a run to finish waited on.
+
+    A step whose resource is in ``dependencies`` waited on the latest of its
+    dependencies' steps that finished by the time it started. Any other
+    step waited on the latest step of the run to finish before it started.
+    """
+    dependencies = dependencies or {}
+    by_resource = defaultdict(list)
+    for step in steps:
+        by_resource[(step.typ, step.name)].append(step)
+
+    step = max(steps, key=lambda s: s.end, default=None)
+    path, seen = [], set()
+    while step is not None and step not in seen:
+        path.append(step)
+        seen.add(step)
+        deps = dependencies.get((step.typ, step.name))
+        if deps is None:
+            candidates = steps
+        else:
+            candidates = [s for dep in deps for s in by_resource.get(dep, ())]
+        candidates = [s for s in candidates if s.end <= step.start and s not in seen]
+        step = max(candidates, key=lambda s: s.end, default=None)
+    return path[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="config of the stacks in the logs, for the program's dependency graph")
+    parser.add_argument("--ops", nargs="+", default=list(DEFAULT_OPS))
+    args = parser.parse_args()
+    config = dict(item.split("=", 1) for item in args.config)
+
+    steps = [s for s in steps_from_records(r for path in args.logs for r in read_log(path)) if s.op in args.ops]
+    if not steps:
+        raise SystemExit(f"no {'/'.join(args.ops)} steps in {', '.join(args.logs)}")
+    runs = defaultdict(list)
+    for step in steps:
+        runs[step.run].append(step)
+
+    by_type = defaultdict(list)
+    for step in steps:
+        by_type[step.typ].append(step.duration)
+    width = max(len(typ) for typ in by_type)
+    print(f"Step durations by resource type ({len(runs)} run(s), {len(steps)} step(s)):")
+    print(f"  {'type':<{width}} {'steps':>6} {'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+    for typ, durations in sorted(by_type.items(), key=lambda item: -percentile(item[1], 0.5)):
+        print(f"  {typ:<{width}} {len(durations):>6} {percentile(durations, 0.5):>8.1f} "
+              f"{percentile(durations, 0.95):>8.1f} {max(durations):>8.1f}")
+
+    dependencies = program_dependencies(config)
+    paths = {run: realized_critical_path(run_steps, dependencies) for run, run_steps in runs.items()}
+    latest = max(runs, key=lambda run: min(s.start for s in runs[run]))
+    origin = min(s.start for s in runs[latest])
+    print(f"\nRealized critical path of {latest} "
+          f"({max(s.end for s in runs[latest]) - origin:.1f}s from the first step):")
+    for step in paths[latest]:
+        print(f"  {step.start - origin:8.1f} {step.end - origin:8.1f}  {step.name} ({step.typ}, {step.op}"
+              f"{', failed' if step.failed else ''})")
+
+    if len(runs) > 1:
+        counts = Counter(name for path in paths.values() for name in {step.name for step in path})
+        print(f"\nOn the critical path across {len(runs)} runs:")
+        for name, count in counts.most_common():
+            print(f"  {count:>4}/{len(runs)}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""Stream Azure NSG and VNet flow logs and aggregate them by the program's resources.
+
+    python flowlogs.py LOGS [--workers 8] [--top 10] [--json report.json] [--macs macs.json]
+        [--config key=value ...]
+
+LOGS is a directory of flow-log blobs, laid out however Azure or a copy of
+its ``insights-logs-*`` containers left them, or a blob container URL (for
+example an Azurite container with a SAS token; needs ``azure-storage-blob``).
+Both NSG flow logs (version 1 and 2) and VNet flow logs are read.
+
+Blobs are spread over worker processes. Each worker reads its blob in chunks
+and decodes one record of the ``records`` array at a time, collects the
+record's flow tuples into column batches and folds every batch into its
+totals, so memory is bounded by the largest record and the number of
+endpoints, not by the size of a blob.
+
+Addresses are named after what the program declares (see ``offline.py``):
+static NIC and load balancer frontend addresses, then subnets, then VNets;
+anything else is ``Internet``. Every source and destination pair is then
+traced with ``reachability.py`` to show the way its traffic takes, including
+the NVA and the VPN gateways. Records logged on an NVA's NIC count towards
+that NVA instance, which shows how evenly the load balancer spreads flows;
+VNet flow logs only name the NIC by MAC address, so pass ``--macs`` (a JSON
+object of MAC address to NIC name) to attribute those.
+
+Top talkers are kept in a bounded table per worker: once it holds twice
+``TALKER_CAPACITY`` sources the smallest are dropped, so the totals of
+sources that stay small throughout can be undercounted.
+"""
+
+import argparse
+import codecs
+import json
+import os
+import re
+import socket
+import struct
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import offline
+from reachability import (LOAD_BALANCER, NETWORK_INTERFACE, SUBNET, VIRTUAL_NETWORK, PrefixTrie, Simulator,
+                          model_from_registrations, pool_members)
+from routes import VIRTUAL_APPLIANCE
+
+INTERNET = "Internet"
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 1 << 16
+ADDRESS_CACHE_SIZE = 1 << 16
+TALKER_CAPACITY = 10_000
+RECORDS = re.compile(r'"records"\s*:\s*\[')
+
+
+class Endpoints(NamedTuple):
+    """Disjoint address ranges and the endpoint name each maps to; picklable for the workers."""
+    starts: list
+    names: list
+    subnets: dict
+
+    def name(self, address):
+        return self.names[bisect_right(self.starts, address) - 1]
+
+
+class PathStats(NamedTuple):
+    source: str
+    destination: str
+    route: str
+    flows: int
+    denied: int
+    bytes: int
+
+
+def endpoints_from_registrations(registrations):
+    """Map every address the program declares to the resource that owns it.
+
+    ``subnets`` maps each endpoint name to the subnet its traffic starts
+    from, for tracing.
+    """
+    trie, subnets, prefixes = PrefixTrie(), {}, []
+    for r in registrations:
+        if r.typ == VIRTUAL_NETWORK:
+            for prefix in r.inputs.get("addressSpace", {}).get("addressPrefixes", ()):
+                prefixes.append((prefix, 0, r.name, None))
+        elif r.typ == SUBNET:
+            for prefix in r.inputs.get("addressPrefixes") or [r.inputs["addressPrefix"]]:
+                prefixes.append((prefix, 1, r.name, r.name))
+        elif r.typ == NETWORK_INTERFACE:
+            for config in r.inputs.get("ipConfigurations", ()):
+                if config.get("privateIPAddress"):
+                    prefixes.append((f"{config['privateIPAddress']}/32", 2, r.name,
+                                     offline.name_from_id(config["subnet"]["id"])))
+        elif r.typ == LOAD_BALANCER:
+            for config in r.inputs.get("frontendIPConfigurations", ()):
+                if config.get("privateIPAddress"):
+                    prefixes.append((f"{config['privateIPAddress']}/32", 2, r.name,
+                                     offline.name_from_id(config["subnet"]["id"])))
+    trie.insert("0.0.0.0/0", INTERNET)
+    # On an equal prefix a NIC or frontend beats its subnet, which beats its VNet.
+    for prefix, _, name, subnet in sorted(prefixes, key=lambda p: p[1]):
+        trie.insert(prefix, name)
+        if subnet:
+            subnets[name] = subnet
+    table = trie.compile()
+    return Endpoints(table.starts, table.values, subnets)
+
+
+def nva_interfaces(registrations, model):
+    """NICs that carry NVA traffic: a route's next hop, or the pool members behind a load balancer that is one."""
+    next_hops = {route.next_hop_ip_address for table in model.route_tables.values() for route in table.routes
+                 if route.next_hop_ip_address}
+    members = pool_members(registrations)
+    nics = []
+    for r in registrations:
+        if r.typ == NETWORK_INTERFACE:
+            if any(config.get("privateIPAddress") in next_hops for config in r.inputs.get("ipConfigurations", ())):
+                nics.append(r.name)
+        elif r.typ == LOAD_BALANCER:
+            if any(config.get("privateIPAddress") in next_hops
+                   for config in r.inputs.get("frontendIPConfigurations", ())):
+                for pool in r.inputs.get("backendAddressPools", ()):
+                    nics.extend(members.get(pool["name"], ()))
+    return nics
+
+
+def resource_name(resource_id, names):
+    """The program's name for an ARM id's resource; auto-named resources carry a random suffix."""
+    physical = offline.name_from_id(resource_id).lower()
+    matches = [name for name in names if physical.startswith(name.lower())]
+    return max(matches, key=len) if matches else physical
+
+
+class LocalSource:
+    """Flow-log blobs under a directory."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        for root, _, files in os.walk(self.path):
+            for file in sorted(files):
+                if file.endswith(".json"):
+                    yield os.path.relpath(os.path.join(root, file), self.path)
+
+    def chunks(self, name):
+        with open(os.path.join(self.path, name), "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+
+class ContainerSource:
+    """Flow-log blobs in a blob container, addressed by a URL with a SAS token."""
+
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+
+    def __getstate__(self):
+        return {"url": self.url, "_client": None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            from azure.storage.blob import ContainerClient
+
+            self._client = ContainerClient.from_container_url(self.url)
+        return self._client
+
+    def names(self):
+        return (blob.name for blob in self.client.list_blobs() if blob.name.endswith(".json"))
+
+    def chunks(self, name):
+        return self.client.download_blob(name).chunks()
+
+
+def iter_records(chunks):
+    """Yield each object of a flow-log blob's ``records`` array, reading ``chunks`` as needed."""
+    decoder, text = json.JSONDecoder(), codecs.getincrementaldecoder("utf-8")()
+    chunks, buffer, position, started = iter(chunks), "", 0, False
+    while True:
+        if not started:
+            match = RECORDS.search(buffer)
+            if match:
+                buffer, position, started = buffer[match.end():], 0, True
+        if started:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if buffer.startswith("]", position):
+                return
+            if position < len(buffer):
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    pass
+                else:
+                    yield record
+                    continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            if started and buffer[position:].strip():
+                raise ValueError("flow log ends inside a record")
+            return
+        buffer = buffer[position:] + text.decode(chunk)
+        position = 0
+
+
+def _tuples(record):
+    """(observed-at id, MAC address, flow tuple strings with their format) for a record of either log type."""
+    if "flowRecords" in record:
+        for flow in record["flowRecords"].get("flows", ()):
+            for group in flow.get("flowGroups", ()):
+                yield record.get("targetResourceID", ""), record.get("macAddress"), "vnet", group["flowTuples"]
+        return
+    for rule in record.get("properties", {}).get("flows", ()):
+        for flow in rule.get("flows", ()):
+            yield record.get("resourceId", ""), flow.get("mac"), "nsg", flow["flowTuples"]
+
+
+class Aggregate:
+    """Totals for a set of blobs; ``merge`` combines the workers' results."""
+
+    def __init__(self):
+        self.paths = {}
+        self.talkers = {}
+        self.observers = {}
+        self.records = 0
+        self.tuples = 0
+
+    def add_batch(self, endpoints, observer, sources, destinations, begins, denies, sizes):
+        name, cache = endpoints.name, {}
+
+        def lookup(address):
+            endpoint = cache.get(address)
+            if endpoint is None:
+                if len(cache) >= ADDRESS_CACHE_SIZE:
+                    cache.clear()
+                endpoint = cache[address] = name(struct.unpack("!I", socket.inet_aton(address))[0])
+            return endpoint
+
+        paths, talkers = self.paths, self.talkers
+        for key, begin, denied, size, destination in zip(
+                zip(map(lookup, sources), map(lookup, destinations)), begins, denies, sizes, destinations):
+            stats = paths.get(key)
+            if stats is None:
+                stats = paths[key] = [0, 0, 0, destination]
+            stats[0] += begin
+            stats[1] += denied
+            stats[2] += size
+        for source, size in zip(sources, sizes):
+            if size:
+                talkers[source] = talkers.get(source, 0) + size
+        if len(talkers) > 2 * TALKER_CAPACITY:
+            self.talkers = dict(sorted(talkers.items(), key=lambda item: item[1], reverse=True)[:TALKER_CAPACITY])
+        totals = self.observers.setdefault(observer, [0, 0])
+        totals[0] += sum(begins)
+        totals[1] += sum(sizes)
+        self.tuples += len(sources)
+
+    def merge(self, other):
+        for key, (flows, denied, size, destination) in other.paths.items():
+            stats = self.paths.setdefault(key, [0, 0, 0, destination])
+            stats[0] += flows
+            stats[1] += denied
+            stats[2] += size
+        for source, size in other.talkers.items():
+            self.talkers[source] = self.talkers.get(source, 0) + size
+        for observer, (flows, size) in other.observers.items():
+            totals = self.observers.setdefault(observer, [0, 0])
+            totals[0] += flows
+            totals[1] += size
+        self.records += other.records
+        self.tuples += other.tuples
+
+
+def aggregate_blob(source, name, endpoints, macs):
+    """Stream one blob into an ``Aggregate``; tuples go through in columns of up to ``BATCH_SIZE``."""
+    result = Aggregate()
+    columns = ([], [], [], [], [])
+    observer = None
+
+    def flush():
+        if columns[0]:
+            result.add_batch(endpoints, observer, *columns)
+            for column in columns:
+                column.clear()
+
+    for record in iter_records(source.chunks(name)):
+        result.records += 1
+        for resource_id, mac, kind, tuples in _tuples(record):
+            seen_at = macs.get((mac or "").replace("-", "").upper()) or offline.name_from_id(resource_id)
+            if seen_at != observer:
+                flush()
+                observer = seen_at
+            sources, destinations, begins, denies, sizes = columns
+            for flow in tuples:
+                fields = flow.split(",")
+                sources.append(fields[1])
+                destinations.append(fields[2])
+                if kind == "vnet":
+                    # time,src,dst,sport,dport,protocol,direction,state,encryption,packets,bytes,packets,bytes
+                    state, denied = fields[7], fields[7] == "D"
+                else:
+                    # time,src,dst,sport,dport,protocol,direction,decision[,state,packets,bytes,packets,bytes]
+                    state, denied = (fields[8] if len(fields) > 8 else "B"), fields[7] == "D"
+                begins.append(state in ("B", "D"))
+                denies.append(denied)
+                sizes.append(int(fields[10] or 0) + int(fields[12] or 0) if len(fields) > 12 else 0)
+                if len(sources) >= BATCH_SIZE:
+                    flush()
+    flush()
+    return result
+
+
+def _observer_names(aggregate, names):
+    observers = {}
+    for observer, (flows, size) in aggregate.observers.items():
+        totals = observers.setdefault(resource_name(observer, names) if observer else "unknown", [0, 0])
+        totals[0] += flows
+        totals[1] += size
+    return observers
+
+
+def report(aggregate, registrations, endpoints, top=10):
+    """Per-path totals, top talkers and per-NVA-instance load, as plain data."""
+    model = model_from_registrations(registrations)
+    simulator = Simulator(model)
+    paths, appliances = [], {}
+    for (source, destination), (flows, denied, size, sample) in aggregate.paths.items():
+        subnet = endpoints.subnets.get(source)
+        trace = simulator.trace(subnet, sample) if subnet else None
+        paths.append(PathStats(source, destination, str(trace) if trace else "from outside the program",
+                               flows, denied, size))
+        for hop in trace.hops if trace else ():
+            if hop.route.next_hop_type == VIRTUAL_APPLIANCE:
+                ip = hop.route.next_hop_ip_address
+                totals = appliances.setdefault(ip, {"name": endpoints.name(_address(ip)), "flows": 0, "bytes": 0})
+                totals["flows"] += flows
+                totals["bytes"] += size
+    paths.sort(key=lambda p: (-p.bytes, -p.flows))
+
+    observers = _observer_names(aggregate, [r.name for r in registrations if r.custom])
+    instances = {name: observers.get(name, [0, 0]) for name in nva_interfaces(registrations, model)}
+    total = sum(size for _, size in instances.values())
+    mean = total / len(instances) if instances else 0
+    return {
+        "records": aggregate.records,
+        "tuples": aggregate.tuples,
+        "paths": [path._asdict() for path in paths],
+        "top_talkers": [{"address": address, "endpoint": endpoints.name(_address(address)), "bytes": size}
+                        for address, size in sorted(aggregate.talkers.items(), key=lambda t: -t[1])[:top]],
+        "nva": {
+            "routed": appliances,
+            "instances": {name: {"flows": flows, "bytes": size, "share": size / total if total else 0.0}
+                          for name, (flows, size) in instances.items()},
+            "imbalance": max(size for _, size in instances.values()) / mean if mean else None,
+        },
+        "observed_at": {name: {"flows": flows, "bytes": size} for name, (flows, size) in sorted(observers.items())},
+    }
+
+
+def _address(address):
+    return struct.unpack("!I", socket.inet_aton(address))[0]
+
+
+def analyze(source, registrations, workers=None, macs=None):
+    """Aggregate every blob in ``source``, ``workers`` processes at a time."""
+    endpoints = endpoints_from_registrations(registrations)
+    macs = {mac.replace("-", "").upper(): nic for mac, nic in (macs or {}).items()}
+    total = Aggregate()
+    names = list(source.names())
+    if workers == 1:
+        for name in names:
+            total.merge(aggregate_blob(source, name, endpoints, macs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(aggregate_blob, *zip(*((source, name, endpoints, macs) for name in names))):
+                total.merge(result)
+    return total, endpoints
+
+
+def _size(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", help="directory of flow-log blobs, or a blob container URL")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--macs", help="JSON object mapping NIC MAC addresses to NIC names")
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    args = parser.parse_args()
+
+    source = ContainerSource(args.logs) if re.match(r"https?://", args.logs) else LocalSource(args.logs)
+    macs = None
+    if args.macs:
+        with open(args.macs) as f:
+            macs = json.load(f)
+    registrations = offline.run_program(config=dict(i.split("=", 1) for i in args.config))
+    aggregate, endpoints = analyze(source, registrations, args.workers, macs)
+    result = report(aggregate, registrations, endpoints, args.top)
+
+    print(f"{result['records']} records, {result['tuples']} flow tuples")
+    print(f"\n{'source':<22} {'destination':<22} {'flows':>9} {'denied':>8} {'bytes':>10}  route")
+    for path in result["paths"]:
+        print(f"{path['source']:<22} {path['destination']:<22} {path['flows']:>9} {path['denied']:>8} "
+              f"{_size(path['bytes']):>10}  {path['route']}")
+    print(f"\n{'top talker':<18} {'endpoint':<22} {'bytes':>10}")
+    for talker in result["top_talkers"]:
+        print(f"{talker['address']:<18} {talker['endpoint']:<22} {_size(talker['bytes']):>10}")
+    nva = result["nva"]
+    for ip, routed in sorted(nva["routed"].items()):
+        print(f"\nrouted through {ip} ({routed['name']}): {routed['flows']} flows, {_size(routed['bytes'])}")
+    for name, instance in nva["instances"].items():
+        print(f"{name:<22} {instance['flows']:>9} flows {_size(instance['bytes']):>10} {instance['share']:>6.1%}")
+    if nva["imbalance"] is not None:
+        print(f"busiest NVA instance carries {nva['imbalance']:.2f}x the mean")
+    elif nva["instances"]:
+        print("no records were logged on an NVA NIC")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""VPN gateway settings and the gateways shared by the on-prem site and the hub.
+
+The ``gateway`` config object picks the SKU and mode per stack::
+
+    gateway:
+      sku: VpnGw2AZ          # default VpnGw1; *AZ SKUs are zone-redundant
+      mode: active-active    # default single
+      bgp: true              # default: on for active-active
+      asn: {hub: 65515, onprem: 65010}
+
+Active-active gateways get a second public IP and IP configuration. Two
+active-active gateways joined by one connection in each direction with BGP
+enabled build a full mesh of four tunnels, and BGP spreads traffic across
+them (ECMP). Azure assigns the BGP peering addresses from each
+GatewaySubnet; they are exported with the gateways.
+
+A gateway pool stack (``deploymentMode: gateway-pool``) keeps
+``GatewayPair``s alive between short-lived test stacks, which lease a pair
+(see ``leases.py``) instead of waiting for two new gateways.
+"""
+
+import re
+from typing import NamedTuple
+
+from azure_sdk import network, resources
+from components import NetworkComponent
+
+SINGLE = "single"
+ACTIVE_ACTIVE = "active-active"
+GATEWAY_MODES = (SINGLE, ACTIVE_ACTIVE)
+
+DEFAULT_SKU = "VpnGw1"
+SKU_PATTERN = re.compile(r"VpnGw[1-5](AZ)?")
+DEFAULT_ASNS = {"hub": 65515, "onprem": 65010}
+ZONES = ["1", "2", "3"]
+
+
+class GatewaySettings(NamedTuple):
+    sku: str = DEFAULT_SKU
+    mode: str = SINGLE
+    bgp: bool = False
+    asns: dict = DEFAULT_ASNS
+
+    @property
+    def active_active(self):
+        return self.mode == ACTIVE_ACTIVE
+
+    @property
+    def zone_redundant(self):
+        return self.sku.endswith("AZ")
+
+
+def gateway_settings(config):
+    raw = config.get_object("gateway") or {}
+    mode = raw.get("mode", SINGLE)
+    if mode not in GATEWAY_MODES:
+        raise ValueError(f"gateway.mode must be one of {', '.join(GATEWAY_MODES)}, not {mode!r}")
+    sku = raw.get("sku", DEFAULT_SKU)
+    if not SKU_PATTERN.fullmatch(sku):
+        raise ValueError(f"gateway.sku must be VpnGw1-5 or VpnGw1AZ-5AZ, not {sku!r}")
+    asns = dict(DEFAULT_ASNS, **raw.get("asn", {}))
+    if len(set(asns.values())) != len(asns):
+        raise ValueError(f"gateway.asn must give every site its own ASN: {asns}")
+    return GatewaySettings(sku=sku, mode=mode, bgp=bool(raw.get("bgp", mode == ACTIVE_ACTIVE)), asns=asns)
+
+
+def _public_ip(name, resource_group_name, settings, opts):
+    if settings.zone_redundant:
+        return network.PublicIPAddress(name,
+            resource_group_name=resource_group_name,
+            sku=network.PublicIPAddressSkuArgs(
+                name=network.PublicIPAddressSkuName.STANDARD
+            ),
+            public_ip_allocation_method=network.IPAllocationMethod.STATIC,
+            zones=ZONES,
+            opts=opts
+        )
+    return network.PublicIPAddress(name,
+        resource_group_name=resource_group_name,
+        public_ip_allocation_method=network.IPAllocationMethod.DYNAMIC,
+        opts=opts
+    )
+
+
+def vpn_gateway(component, name, asn, resource_group_name, subnet_id, public_ip_names, settings):
+    """Create a route-based VPN gateway, and its public IPs, as children of ``component``.
+
+    ``public_ip_names`` names the first and second public IP; the second is
+    only created for an active-active gateway.
+    """
+    ip_configurations = []
+    for i, pip_name in enumerate(public_ip_names[:2 if settings.active_active else 1]):
+        pip = _public_ip(pip_name, resource_group_name, settings, component.child_opts())
+        ip_configurations.append(network.VirtualNetworkGatewayIPConfigurationArgs(
+            name="vnetGatewayConfig" if i == 0 else f"vnetGatewayConfig{i + 1}",
+            public_ip_address=network.SubResourceArgs(
+                id=pip.id
+            ),
+            private_ip_allocation_method=network.IPAllocationMethod.DYNAMIC,
+            subnet=network.SubResourceArgs(
+                id=subnet_id
+            )
+        ))
+
+    return network.VirtualNetworkGateway(name,
+        resource_group_name=resource_group_name,
+        gateway_type=network.VirtualNetworkGatewayType.VPN,
+        vpn_type=network.VpnType.ROUTE_BASED,
+        active_active=settings.active_active,
+        enable_bgp=settings.bgp,
+        bgp_settings=network.BgpSettingsArgs(
+            asn=asn
+        ) if settings.bgp else None,
+        sku=network.VirtualNetworkGatewaySkuArgs(
+            name=settings.sku,
+            tier=settings.sku
+        ),
+        ip_configurations=ip_configurations,
+        opts=component.child_opts()
+    )
+
+
+def vnet_to_vnet_connection(component, name, resource_group_name, local_gateway, remote_gateway, shared_key,
+                            settings):
+    return network.VirtualNetworkGatewayConnection(name,
+        resource_group_name=resource_group_name,
+        connection_type=network.VirtualNetworkGatewayConnectionType.VNET2_VNET,
+        routing_weight=1,
+        enable_bgp=settings.bgp,
+        virtual_network_gateway1=network.VirtualNetworkGatewayArgs(
+            id=local_gateway.id
+        ),
+        virtual_network_gateway2=network.VirtualNetworkGatewayArgs(
+            id=remote_gateway.id
+        ),
+        shared_key=shared_key,
+        opts=component.child_opts()
+    )
+
+
+class GatewayPair(NetworkComponent):
+    """An on-prem and a hub VNet holding only their GatewaySubnets and VPN gateways, connected to each other.
+
+    The hub GatewaySubnet gets an empty route table; the stack leasing the
+    pair adds its routes to it as separate ``Route`` resources.
+    """
+
+    def __init__(self, name, topology, settings, shared_key, opts=None):
+        super().__init__("GatewayPair", name, opts)
+
+        self.resource_group = resources.ResourceGroup(f"{name}-rg", opts=self.child_opts())
+
+        self.gateway_route_table = network.RouteTable(f"{name}-hub-gateway-rt",
+            resource_group_name=self.resource_group.name,
+            disable_bgp_route_propagation=False,
+            opts=self.child_opts(ignore_changes=["routes"])
+        )
+
+        vnets, gateways = {}, {}
+        for site, spec in (("onprem", topology.onprem), ("hub", topology.hub)):
+            vnets[site] = network.VirtualNetwork(f"{name}-{site}-vnet",
+                resource_group_name=self.resource_group.name,
+                address_space=network.AddressSpaceArgs(
+                    address_prefixes=list(spec.address_prefixes)
+                ),
+                opts=self.child_opts()
+            )
+
+            gateway_subnet = network.Subnet(f"{name}-{site}-gateway-subnet",
+                subnet_name="GatewaySubnet",
+                resource_group_name=self.resource_group.name,
+                virtual_network_name=vnets[site].name,
+                address_prefixes=[spec.subnet("GatewaySubnet").address_prefix],
+                route_table=network.RouteTableArgs(
+                    id=self.gateway_route_table.id
+                ) if site == "hub" else None,
+                opts=self.child_opts()
+            )
+
+            gateways[site] = vpn_gateway(self, f"{name}-{site}-vpn-gateway", settings.asns[site],
+                                         resource_group_name=self.resource_group.name,
+                                         subnet_id=gateway_subnet.id,
+                                         public_ip_names=(f"{name}-{site}-vpn-gw1-pip", f"{name}-{site}-vpn-gw2-pip"),
+                                         settings=settings)
+
+        vnet_to_vnet_connection(self, f"{name}-hub-onprem-conn", self.resource_group.name,
+                                gateways["hub"], gateways["onprem"], shared_key, settings)
+        vnet_to_vnet_connection(self, f"{name}-onprem-hub-conn", self.resource_group.name,
+                                gateways["onprem"], gateways["hub"], shared_key, settings)
+
+        # Everything a leasing stack needs, exported by the pool stack under the pair's name.
+        self.outputs = {
+            "resource_group_name": self.resource_group.name,
+            "hub_vnet_id": vnets["hub"].id,
+            "hub_vnet_name": vnets["hub"].name,
+            "hub_gateway_id": gateways["hub"].id,
+            "hub_gateway_route_table_name": self.gateway_route_table.name,
+            "onprem_vnet_id": vnets["onprem"].id,
+            "onprem_vnet_name": vnets["onprem"].name,
+            "onprem_gateway_id": gateways["onprem"].id,
+        }
+        self.register_outputs(self.outputs)
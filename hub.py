@@ -0,0 +1,111 @@
+# From: https://learn.microsoft.com/en-us/azure/developer/terraform/hub-spoke-hub-network
+
+from azure_sdk import network, resources
+from components import NetworkComponent, linux_vm
+from gateways import vnet_to_vnet_connection, vpn_gateway
+from spokes import create_route_table, create_routes
+
+
+class HubNetwork(NetworkComponent):
+    """The hub VNet, its VPN gateway and the VNet-to-VNet connections to the on-prem site.
+
+    Also owns ``hub-nva-rg``, which holds the NVA and every route table.
+    Given a leased gateway ``pair``, the VNet, gateway and connections are the
+    pair's, and the gateway routes are added to the pair's gateway route table.
+    """
+
+    def __init__(self, name, spec, gateway_routes, admin_password, onprem, shared_key, gateway_settings,
+                 pair=None, opts=None):
+        super().__init__("HubNetwork", name, opts)
+
+        if pair is None:
+            self.resource_group = resources.ResourceGroup(f"{name}-vnet-rg", opts=self.child_opts())
+
+            vnet = network.VirtualNetwork(f"{name}-vnet",
+                resource_group_name=self.resource_group.name,
+                address_space=network.AddressSpaceArgs(
+                    address_prefixes=list(spec.address_prefixes)
+                ),
+                opts=self.child_opts()
+            )
+            self.resource_group_name, self.vnet_name, self.vnet_id = self.resource_group.name, vnet.name, vnet.id
+        else:
+            self.resource_group_name = pair["resource_group_name"]
+            self.vnet_name, self.vnet_id = pair["hub_vnet_name"], pair["hub_vnet_id"]
+
+        mgmt = network.Subnet(f"{name}-mgmt",
+            resource_group_name=self.resource_group_name,
+            virtual_network_name=self.vnet_name,
+            address_prefixes=[spec.subnet("mgmt").address_prefix],
+            opts=self.child_opts()
+        )
+
+        self.dmz = network.Subnet(f"{name}-dmz",
+            resource_group_name=self.resource_group_name,
+            virtual_network_name=self.vnet_name,
+            address_prefixes=[spec.subnet("dmz").address_prefix],
+            opts=self.child_opts()
+        )
+
+        nic = network.NetworkInterface(f"{name}-nic",
+            resource_group_name=self.resource_group_name,
+            enable_ip_forwarding=True,
+            ip_configurations=[network.NetworkInterfaceIPConfigurationArgs(
+                name=name,
+                subnet=network.SubnetArgs(
+                    id=mgmt.id
+                ),
+                private_ip_allocation_method=network.IPAllocationMethod.DYNAMIC
+            )],
+            opts=self.child_opts()
+        )
+
+        linux_vm(f"{name}-vm",
+                 resource_group_name=self.resource_group_name,
+                 nic_id=nic.id,
+                 computer_name="pk-onprem-vm",
+                 admin_password=admin_password,
+                 opts=self.child_opts())
+
+        self.nva_resource_group = resources.ResourceGroup(f"{name}-nva-rg", opts=self.child_opts())
+
+        self.gateway = None
+        if pair is None:
+            gateway_rt = create_route_table(f"{name}-gateway-rt", gateway_routes, self.nva_resource_group.name,
+                                            opts=self.child_opts())
+
+            gateway_subnet = network.Subnet(f"{name}-gateway-subnet",
+                subnet_name="GatewaySubnet",
+                resource_group_name=self.resource_group_name,
+                virtual_network_name=self.vnet_name,
+                address_prefixes=[spec.subnet("GatewaySubnet").address_prefix],
+                route_table=network.RouteTableArgs(
+                    id=gateway_rt.id
+                ),
+                opts=self.child_opts()
+            )
+
+            self.gateway = vpn_gateway(self, f"{name}-vpn-gateway", gateway_settings.asns["hub"],
+                                       resource_group_name=self.resource_group_name,
+                                       subnet_id=gateway_subnet.id,
+                                       public_ip_names=(f"{name}-vpn-gatway1-pip", f"{name}-vpn-gw2-pip"),
+                                       settings=gateway_settings)
+
+            vnet_to_vnet_connection(self, f"{name}-onprem-conn", self.resource_group_name,
+                                    self.gateway, onprem.gateway, shared_key, gateway_settings)
+
+            vnet_to_vnet_connection(self, f"onprem-{name}-conn", onprem.resource_group_name,
+                                    onprem.gateway, self.gateway, shared_key, gateway_settings)
+        else:
+            # The pool stack ignores changes to the table's routes, so they can be managed from here.
+            create_routes(f"{name}-gateway-rt", gateway_routes, pair["hub_gateway_route_table_name"],
+                          pair["resource_group_name"], opts=self.child_opts())
+        self.gateway_id = self.gateway.id if self.gateway else pair["hub_gateway_id"]
+
+        self.register_outputs({
+            "resource_group_name": self.resource_group_name,
+            "nva_resource_group_name": self.nva_resource_group.name,
+            "vnet_id": self.vnet_id,
+            "vnet_name": self.vnet_name,
+            "gateway_id": self.gateway_id,
+        })
@@ -0,0 +1,172 @@
+"""Leases on the gateway pairs of a gateway pool stack.
+
+    python leases.py --store DIR init pair1 pair2 ...
+    python leases.py --store DIR acquire HOLDER
+    python leases.py --store DIR release HOLDER
+    python leases.py --store DIR list
+
+A lease is a file named after the pair it holds. Acquiring and releasing
+hold an exclusive ``flock`` on the store, so stacks racing for pairs, or one
+holder acquiring twice at once, never end up with a pair leased twice or a
+holder with two. A lease is written to a temporary file and hard-linked into
+place, so it is never seen half-written; an empty or unreadable lease file
+(left by a crash of an older version, say) is stale and the pair is free.
+Acquiring again with the same holder returns the lease it already has, so a
+retried ``up`` keeps its pair. ``orchestrate.py`` acquires a pooled stack's lease
+before its ``up`` and releases it after its ``destroy``; the program only
+reads the pair from its ``gatewayPair`` config.
+
+``LocalLeaseStore`` keeps everything in one directory, so every stack that
+leases from the pool has to see the same filesystem.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import sys
+import time
+from typing import NamedTuple
+
+DEFAULT_STORE = ".gateway-leases"
+INVENTORY = "pairs.json"
+LOCK = ".lock"
+LEASE_SUFFIX = ".lease"
+
+
+class LeaseError(RuntimeError):
+    pass
+
+
+class Lease(NamedTuple):
+    pair: str
+    holder: str
+    acquired_at: float
+
+
+class LocalLeaseStore:
+    def __init__(self, path):
+        self.path = path
+
+    def _lease_path(self, pair):
+        return os.path.join(self.path, pair + LEASE_SUFFIX)
+
+    def init(self, pairs):
+        """Record the pairs the pool stack provides. Existing leases are kept."""
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, INVENTORY + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(list(pairs), f)
+        os.replace(tmp, os.path.join(self.path, INVENTORY))
+
+    def pairs(self):
+        try:
+            with open(os.path.join(self.path, INVENTORY)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise LeaseError(f"no gateway pool inventory in {self.path}; run `leases.py init` first") from None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(os.path.join(self.path, LOCK), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, pair):
+        """The lease on ``pair``; None if there is none or its file is stale."""
+        try:
+            with open(self._lease_path(pair)) as f:
+                return Lease(**json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def leases(self):
+        leases = {}
+        for pair in self.pairs():
+            lease = self._read(pair)
+            if lease is not None:
+                leases[pair] = lease
+        return leases
+
+    def held_by(self, holder):
+        for lease in self.leases().values():
+            if lease.holder == holder:
+                return lease
+        return None
+
+    def free(self):
+        """The first pair nobody holds, without leasing it; None if all are leased."""
+        leases = self.leases()
+        return next((pair for pair in self.pairs() if pair not in leases), None)
+
+    def _write(self, lease):
+        """Link a complete lease file into place; False if the pair's file exists."""
+        tmp = os.path.join(self.path, f"{lease.pair}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(lease._asdict(), f)
+        try:
+            os.link(tmp, self._lease_path(lease.pair))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+
+    def acquire(self, holder):
+        """Return ``holder``'s lease, taking the first free pair if it has none."""
+        with self._locked():
+            lease = self.held_by(holder)
+            if lease is not None:
+                return lease
+            for pair in self.pairs():
+                if self._read(pair) is not None:
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._lease_path(pair))  # stale
+                lease = Lease(pair, holder, time.time())
+                if self._write(lease):
+                    return lease
+        raise LeaseError(f"all {len(self.pairs())} gateway pairs in {self.path} are leased")
+
+    def release(self, holder):
+        """Drop ``holder``'s lease and return it, or None if it had none."""
+        with self._locked():
+            lease = self.held_by(holder)
+            if lease is not None:
+                os.remove(self._lease_path(lease.pair))
+        return lease
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init").add_argument("pairs", nargs="+")
+    commands.add_parser("acquire").add_argument("holder")
+    commands.add_parser("release").add_argument("holder")
+    commands.add_parser("list")
+    args = parser.parse_args()
+
+    store = LocalLeaseStore(args.store)
+    try:
+        if args.command == "init":
+            store.init(args.pairs)
+        elif args.command == "acquire":
+            print(store.acquire(args.holder).pair)
+        elif args.command == "release":
+            lease = store.release(args.holder)
+            print(lease.pair if lease else f"{args.holder} holds no lease", file=sys.stderr)
+        else:
+            leases = store.leases()
+            for pair in store.pairs():
+                print(f"{pair:<12} {leases[pair].holder if pair in leases else '-'}")
+    except LeaseError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Hub-and-spoke connectivity through Azure Virtual Network Manager instead of peerings.
+
+With ``connectivity: avnm`` (or ``avnm-mesh``) the spokes are static members
+of one network group, and a hub-and-spoke connectivity configuration tells
+AVNM to peer every member with the hub. ``avnm-mesh`` also connects the
+spokes directly to each other. Neither adds a peering resource per spoke, let
+alone one per spoke pair. Spoke subnets keep their route tables. With a mesh,
+those tables carry no spoke routes (see ``routes.spoke_route_tables``), so
+traffic between spokes takes the direct connection both ways and skips the
+NVA. On-prem traffic to the spokes still goes through it.
+"""
+
+from pulumi import Output
+
+from azure_sdk import authorization, network, resources
+from components import NetworkComponent
+
+PEERING = "peering"
+AVNM = "avnm"
+AVNM_MESH = "avnm-mesh"
+CONNECTIVITY_MODES = (PEERING, AVNM, AVNM_MESH)
+
+
+def connectivity_mode(config):
+    mode = config.get("connectivity") or PEERING
+    if mode not in CONNECTIVITY_MODES:
+        raise ValueError(f"connectivity must be one of {', '.join(CONNECTIVITY_MODES)}, not {mode!r}")
+    return mode
+
+
+class NetworkManagerConnectivity(NetworkComponent):
+    """A network manager scoped to the current subscription, with one spoke group connected to the hub.
+
+    ``group`` holds what a spoke needs to join (see ``Spoke``); a spoke stack
+    reads it from the hub stack's ``network_group`` output.
+    """
+
+    def __init__(self, name, hub_vnet_id, mesh=False, hub_gateway=None, opts=None):
+        super().__init__("NetworkManagerConnectivity", name, opts)
+
+        self.resource_group = resources.ResourceGroup(f"{name}-rg", opts=self.child_opts())
+
+        manager = network.NetworkManager(name,
+            network_manager_name=name,
+            resource_group_name=self.resource_group.name,
+            network_manager_scopes=network.NetworkManagerPropertiesNetworkManagerScopesArgs(
+                subscriptions=[Output.concat("/subscriptions/",
+                                             authorization.get_client_config_output().subscription_id)]
+            ),
+            network_manager_scope_accesses=[network.ConfigurationType.CONNECTIVITY],
+            opts=self.child_opts()
+        )
+
+        group = network.NetworkGroup(f"{name}-spokes",
+            network_group_name=f"{name}-spokes",
+            network_manager_name=manager.name,
+            resource_group_name=self.resource_group.name,
+            member_type="VirtualNetwork",
+            opts=self.child_opts()
+        )
+
+        configuration = network.ConnectivityConfiguration(f"{name}-hub-and-spoke",
+            network_manager_name=manager.name,
+            resource_group_name=self.resource_group.name,
+            connectivity_topology=network.ConnectivityTopology.HUB_AND_SPOKE,
+            hubs=[network.HubArgs(
+                resource_id=hub_vnet_id,
+                resource_type="Microsoft.Network/virtualNetworks"
+            )],
+            applies_to_groups=[network.ConnectivityGroupItemArgs(
+                network_group_id=group.id,
+                group_connectivity=(network.GroupConnectivity.DIRECTLY_CONNECTED if mesh
+                                    else network.GroupConnectivity.NONE),
+                use_hub_gateway=network.UseHubGateway.TRUE,
+                is_global=network.IsGlobal.FALSE
+            )],
+            delete_existing_peering=network.DeleteExistingPeering.TRUE,
+            opts=self.child_opts()
+        )
+
+        # Configurations only take effect once committed to a region. Spokes use
+        # the hub gateway, like spoke peerings do, so can't be connected before it
+        # exists; a leased gateway pair's gateway already does.
+        network.Commit(f"{name}-commit",
+            network_manager_name=manager.name,
+            resource_group_name=self.resource_group.name,
+            properties=network.CommitPropertiesArgs(
+                commit_type=network.ConfigurationType.CONNECTIVITY,
+                configuration_ids=[configuration.id],
+                target_locations=[self.resource_group.location]
+            ),
+            opts=self.child_opts(depends_on=[hub_gateway] if hub_gateway else None)
+        )
+
+        self.group = {
+            "resource_group_name": self.resource_group.name,
+            "network_manager_name": manager.name,
+            "network_group_name": group.name,
+        }
+        self.register_outputs(self.group)
@@ -0,0 +1,347 @@
+"""Offline NSG rule evaluation and rule-set lint.
+
+    python nsg.py [--nsg NAME] [--flow PROTOCOL SOURCE SOURCE_PORT DESTINATION DESTINATION_PORT]
+        [--direction Inbound|Outbound] [--config key=value ...]
+
+The program is evaluated offline (see ``offline.py``) and every network
+security group's rules, inline ``security_rules`` and separate
+``SecurityRule`` resources alike, are read from what it registers, with
+Azure's default rules appended. Service tags resolve against the program's
+own address space: ``VirtualNetwork`` is every VNet it declares, ``Internet``
+everything else.
+
+Each direction of an NSG compiles to bit masks over its rules in priority
+order: per protocol, a table of destination port ranges, and per address
+field a prefix trie compiled into disjoint ranges (see ``reachability.py``).
+A flow's candidate rules are the AND of one bisect per field, and the
+deciding rule is the lowest set bit. Fields that every rule wildcards are
+left out of the lookup.
+
+Without ``--flow`` every NSG is linted: a rule is shadowed when it never
+decides a flow because higher-priority rules always match first, and
+redundant when removing it would not change any decision. Only IPv4 is
+modelled.
+"""
+
+import argparse
+from bisect import bisect_right
+from ipaddress import IPv4Address, ip_address, ip_network, summarize_address_range
+from typing import NamedTuple
+
+import offline
+from reachability import PrefixTrie, VIRTUAL_NETWORK
+
+NETWORK_SECURITY_GROUP = "azure-native:network:NetworkSecurityGroup"
+SECURITY_RULE = "azure-native:network:SecurityRule"
+
+INBOUND = "Inbound"
+OUTBOUND = "Outbound"
+ALLOW = "Allow"
+DENY = "Deny"
+ANY = "*"
+PROTOCOLS = ("Tcp", "Udp", "Icmp", "Esp", "Ah")
+
+MAX_PORT = 65535
+AZURE_LOAD_BALANCER = "168.63.129.16/32"
+
+SHADOWED = "shadowed"
+REDUNDANT = "redundant"
+
+# https://learn.microsoft.com/en-us/azure/virtual-network/network-security-groups-overview#default-security-rules
+DEFAULT_RULES = (
+    {"name": "AllowVnetInBound", "priority": 65000, "direction": INBOUND, "access": ALLOW,
+     "sourceAddressPrefix": "VirtualNetwork", "destinationAddressPrefix": "VirtualNetwork"},
+    {"name": "AllowAzureLoadBalancerInBound", "priority": 65001, "direction": INBOUND, "access": ALLOW,
+     "sourceAddressPrefix": "AzureLoadBalancer", "destinationAddressPrefix": ANY},
+    {"name": "DenyAllInBound", "priority": 65500, "direction": INBOUND, "access": DENY},
+    {"name": "AllowVnetOutBound", "priority": 65000, "direction": OUTBOUND, "access": ALLOW,
+     "sourceAddressPrefix": "VirtualNetwork", "destinationAddressPrefix": "VirtualNetwork"},
+    {"name": "AllowInternetOutBound", "priority": 65001, "direction": OUTBOUND, "access": ALLOW,
+     "sourceAddressPrefix": ANY, "destinationAddressPrefix": "Internet"},
+    {"name": "DenyAllOutBound", "priority": 65500, "direction": OUTBOUND, "access": DENY},
+)
+
+
+class SecurityRule(NamedTuple):
+    name: str
+    priority: int
+    direction: str
+    access: str
+    protocol: str
+    source_prefixes: tuple
+    source_ports: tuple
+    destination_prefixes: tuple
+    destination_ports: tuple
+    default: bool = False
+
+    def __str__(self):
+        return f"{self.name} ({self.priority} {self.access})"
+
+
+class Flow(NamedTuple):
+    protocol: str
+    source: int
+    source_port: int
+    destination: int
+    destination_port: int
+
+
+class Finding(NamedTuple):
+    nsg: str
+    rule: SecurityRule
+    kind: str
+    covered_by: tuple
+
+    def __str__(self):
+        rules = ", ".join(map(str, self.covered_by))
+        if self.kind == SHADOWED:
+            return f"{self.nsg}/{self.rule}: shadowed by {rules}"
+        return f"{self.nsg}/{self.rule}: redundant, {rules} would decide the same"
+
+
+def service_tags(vnet_prefixes):
+    """Service tag -> prefixes, with ``VirtualNetwork`` standing for ``vnet_prefixes``."""
+    vnets = sorted(net for net in map(ip_network, vnet_prefixes) if net.version == 4)
+    internet, start = [], 0
+    for net in vnets:
+        if int(net.network_address) > start:
+            internet.extend(summarize_address_range(IPv4Address(start), net.network_address - 1))
+        start = max(start, int(net.broadcast_address) + 1)
+    if start <= int(IPv4Address("255.255.255.255")):
+        internet.extend(summarize_address_range(IPv4Address(start), IPv4Address("255.255.255.255")))
+    return {
+        "VirtualNetwork": tuple(map(str, vnets)),
+        "Internet": tuple(map(str, internet)),
+        "AzureLoadBalancer": (AZURE_LOAD_BALANCER,),
+    }
+
+
+def _prefixes(rule, field, tags):
+    values = rule.get(f"{field}AddressPrefixes") or [rule.get(f"{field}AddressPrefix") or ANY]
+    prefixes = []
+    for value in values:
+        if value in (ANY, "Any"):
+            prefixes.append("0.0.0.0/0")
+        elif value in tags:
+            prefixes.extend(tags[value])
+        else:
+            try:
+                net = ip_network(value, strict=False)
+            except ValueError:
+                raise ValueError(f"rule {rule['name']}: unknown service tag {value!r}") from None
+            if net.version == 4:
+                prefixes.append(str(net))
+    return tuple(prefixes)
+
+
+def _ports(rule, field):
+    values = rule.get(f"{field}PortRanges") or [rule.get(f"{field}PortRange") or ANY]
+    ports = []
+    for value in map(str, values):
+        low, _, high = value.partition("-")
+        ports.append((0, MAX_PORT) if value == ANY else (int(low), int(high or low)))
+    return tuple(ports)
+
+
+def parse_rule(rule, tags, default=False):
+    """A ``SecurityRule`` from a security rule's resource inputs."""
+    if rule.get("sourceApplicationSecurityGroups") or rule.get("destinationApplicationSecurityGroups"):
+        raise ValueError(f"rule {rule['name']}: application security groups are not modelled")
+    return SecurityRule(rule["name"], int(rule["priority"]), rule["direction"], rule["access"],
+                        rule.get("protocol") or ANY,
+                        _prefixes(rule, "source", tags), _ports(rule, "source"),
+                        _prefixes(rule, "destination", tags), _ports(rule, "destination"), default)
+
+
+def nsgs_from_registrations(registrations):
+    """NSG name -> raw rule inputs, and every VNet address prefix, from ``offline.run_program`` registrations."""
+    nsgs, vnet_prefixes = {}, []
+    for r in registrations:
+        if r.typ == NETWORK_SECURITY_GROUP:
+            nsgs.setdefault(r.inputs.get("networkSecurityGroupName") or r.name, []).extend(
+                r.inputs.get("securityRules", ()))
+        elif r.typ == SECURITY_RULE:
+            nsgs.setdefault(r.inputs["networkSecurityGroupName"], []).append(
+                dict(r.inputs, name=r.inputs.get("securityRuleName") or r.name))
+        elif r.typ == VIRTUAL_NETWORK:
+            vnet_prefixes.extend(r.inputs.get("addressSpace", {}).get("addressPrefixes", ()))
+    return nsgs, vnet_prefixes
+
+
+class _MaskTrie(PrefixTrie):
+    """Prefixes map to rule masks; a range gets the union of every prefix covering it."""
+
+    def _merge(self, old, new):
+        return (old or 0) | new
+
+    def _inherit(self, inherited, value):
+        return (inherited or 0) | (value or 0)
+
+
+def _squash(starts, masks):
+    """Drop ranges whose mask repeats the previous one's."""
+    kept_starts, kept_masks = [], []
+    for start, mask in zip(starts, masks):
+        if not kept_masks or kept_masks[-1] != mask:
+            kept_starts.append(start)
+            kept_masks.append(mask)
+    return kept_starts, kept_masks
+
+
+def _address_table(rules, field):
+    trie = _MaskTrie()
+    for i, rule in enumerate(rules):
+        for prefix in getattr(rule, field):
+            trie.insert(prefix, 1 << i)
+    table = trie.compile()
+    return _squash(table.starts, table.values)
+
+
+def _port_table(rules, field, within=-1):
+    """Disjoint port ranges and the mask of rules (restricted to ``within``) matching each."""
+    events = {0: []}
+    for i, rule in enumerate(rules):
+        if within >> i & 1:
+            for low, high in getattr(rule, field):
+                events.setdefault(low, []).append((i, 1))
+                events.setdefault(high + 1, []).append((i, -1))
+    starts, masks, counts, mask = [], [], {}, 0
+    for start in sorted(events):
+        if start > MAX_PORT:
+            break
+        for i, step in events[start]:
+            counts[i] = counts.get(i, 0) + step
+            mask = mask | 1 << i if counts[i] else mask & ~(1 << i)
+        starts.append(start)
+        masks.append(mask)
+    return _squash(starts, masks)
+
+
+# Flow fields with a table of their own; destination ports are looked up per protocol.
+TABLE_FIELDS = (("source", "source_prefixes", _address_table), ("source_port", "source_ports", _port_table),
+                ("destination", "destination_prefixes", _address_table))
+
+
+class CompiledRules:
+    """One direction of an NSG, defaults included, compiled for lookup.
+
+    ``rules`` are in priority order; bit ``i`` of a mask stands for ``rules[i]``.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules = tuple(sorted(rules, key=lambda rule: rule.priority))
+        self.protocol_masks = {protocol: sum(1 << i for i, rule in enumerate(rules) if rule.protocol in (ANY, protocol))
+                               for protocol in (*PROTOCOLS, None)}
+        tables = [(Flow._fields.index(field), table(rules, attribute)) for field, attribute, table in TABLE_FIELDS]
+        # A table with a single range can't tell flows apart; fold its mask into the port tables instead.
+        constant = -1
+        for _, (starts, masks) in tables:
+            if len(starts) == 1:
+                constant &= masks[0]
+        self.lookups = tuple((index, starts, masks) for index, (starts, masks) in tables if len(starts) > 1)
+        self.destination_ports = {}
+        for protocol, mask in self.protocol_masks.items():
+            starts, masks = _port_table(rules, "destination_ports", mask & constant)
+            self.destination_ports[protocol] = (starts, masks)
+        # Distinct masks per dimension of the rule space, for findings().
+        self._dimensions = [set(self.protocol_masks.values()),
+                            set(_port_table(rules, "destination_ports")[1]),
+                            *(set(masks) for _, (_, masks) in tables)]
+
+    def decide(self, flow):
+        """The rule that decides ``flow``."""
+        return self.evaluate((flow,))[0]
+
+    def evaluate(self, flows):
+        """The deciding rule for each flow, a ``Flow`` or any sequence in its field order."""
+        rules, ports, lookups = self.rules, self.destination_ports, self.lookups
+        other_ports = ports[None]
+        results = []
+        append = results.append
+        for flow in flows:
+            starts, masks = ports.get(flow[0], other_ports)
+            mask = masks[bisect_right(starts, flow[4]) - 1]
+            for index, starts, masks in lookups:
+                mask &= masks[bisect_right(starts, flow[index]) - 1]
+            append(rules[(mask & -mask).bit_length() - 1])
+        return results
+
+    def _cell_masks(self, bit):
+        """The distinct masks of the cells that make up one rule's match space.
+
+        The space is the cross product of every dimension's ranges; cells with
+        equal masks behave alike, so they are merged at every step.
+        """
+        cells = {-1}
+        for values in self._dimensions:
+            cells = {cell & value for cell in cells for value in values if value & bit}
+        return cells
+
+    def findings(self):
+        """(rule, kind, covering rules) for every non-default rule that is shadowed or redundant."""
+        rules = self.rules
+        for i, rule in enumerate(rules):
+            if rule.default:
+                continue
+            bit = 1 << i
+            cells = self._cell_masks(bit)
+            firsts = {(cell & -cell).bit_length() - 1 for cell in cells}
+            if i not in firsts:
+                yield rule, SHADOWED, tuple(rules[j] for j in sorted(firsts))
+                continue
+            # Where the rule decides, the next matching rule would decide without it.
+            nexts = {((cell ^ bit) & -(cell ^ bit)).bit_length() - 1 for cell in cells if cell & -cell == bit}
+            if all(rules[j].access == rule.access for j in nexts):
+                yield rule, REDUNDANT, tuple(rules[j] for j in sorted(nexts))
+
+
+def compile_nsg(raw_rules, tags):
+    """Direction -> ``CompiledRules`` for one NSG's rule inputs."""
+    rules = [parse_rule(rule, tags) for rule in raw_rules]
+    rules.extend(parse_rule(rule, tags, default=True) for rule in DEFAULT_RULES)
+    return {direction: CompiledRules(rule for rule in rules if rule.direction == direction)
+            for direction in (INBOUND, OUTBOUND)}
+
+
+def lint(nsgs, tags):
+    """Every ``Finding`` across ``nsgs`` (name -> raw rule inputs)."""
+    for name in sorted(nsgs):
+        for compiled in compile_nsg(nsgs[name], tags).values():
+            for rule, kind, covered_by in compiled.findings():
+                yield Finding(name, rule, kind, covered_by)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nsg", help="only this NSG")
+    parser.add_argument("--flow", nargs=5, metavar=("PROTOCOL", "SOURCE", "SOURCE_PORT", "DESTINATION",
+                                                    "DESTINATION_PORT"))
+    parser.add_argument("--direction", choices=(INBOUND, OUTBOUND), default=INBOUND)
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    args = parser.parse_args()
+
+    nsgs, vnet_prefixes = nsgs_from_registrations(
+        offline.run_program(config=dict(i.split("=", 1) for i in args.config)))
+    if args.nsg:
+        if args.nsg not in nsgs:
+            parser.error(f"no NSG named {args.nsg}; the program declares {', '.join(sorted(nsgs)) or 'none'}")
+        nsgs = {args.nsg: nsgs[args.nsg]}
+    tags = service_tags(vnet_prefixes)
+
+    if args.flow:
+        protocol, source, source_port, destination, destination_port = args.flow
+        flow = Flow(protocol, int(ip_address(source)), int(source_port),
+                    int(ip_address(destination)), int(destination_port))
+        for name in sorted(nsgs):
+            rule = compile_nsg(nsgs[name], tags)[args.direction].decide(flow)
+            print(f"{name:<24} {rule.access:<6} {rule}")
+        return
+
+    findings = list(lint(nsgs, tags))
+    for finding in findings:
+        print(finding)
+    print(f"{len(findings)} shadowed or redundant rule(s) in {len(nsgs)} NSG(s)")
+
+
+if __name__ == "__main__":
+    main()
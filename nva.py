@@ -0,0 +1,183 @@
+# From: https://learn.microsoft.com/en-us/azure/developer/terraform/hub-spoke-hub-nva
+
+import base64
+import functools
+import hashlib
+import ipaddress
+import os
+from string import Template
+from typing import NamedTuple
+
+import yaml
+from pulumi import Output
+
+from azure_sdk import authorization, network
+from components import NetworkComponent, linux_vm
+
+CLOUD_INIT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nva-cloud-init.yaml")
+
+# Port the load balancer probes on every NVA instance.
+HEALTH_PROBE_PORT = 22
+
+# Azure keeps the first four addresses and the last one of every subnet.
+RESERVED_LOW_ADDRESSES = 4
+RESERVED_HIGH_ADDRESSES = 1
+
+
+class CloudInit(NamedTuple):
+    text: str
+    sha256: str
+
+    @property
+    def custom_data(self):
+        return base64.b64encode(self.text.encode()).decode()
+
+
+@functools.lru_cache(maxsize=None)
+def render_cloud_init(forwarded_prefixes, template=CLOUD_INIT_TEMPLATE):
+    """Render the NVA cloud-config, forwarding traffic from ``forwarded_prefixes`` only.
+
+    The prefixes are collapsed and sorted, so the same address plan always
+    renders the same bytes and the VM's custom data never changes by accident.
+    """
+    with open(template) as f:
+        source = Template(f.read())
+    prefixes = ipaddress.collapse_addresses(ipaddress.ip_network(p) for p in forwarded_prefixes)
+    rules = [f"iptables -A FORWARD -s {prefix} -j ACCEPT" for prefix in sorted(prefixes)]
+    text = source.substitute(forward_rules="\n      ".join(rules))
+    yaml.safe_load(text)  # a template edit that breaks the YAML fails the preview, not the first boot
+    return CloudInit(text, hashlib.sha256(text.encode()).hexdigest())
+
+
+def next_hop_address(subnet_prefix, count):
+    """The address routes send NVA traffic to in ``subnet_prefix``, for ``count`` NVAs.
+
+    A single NVA takes the subnet's first usable address. A load balancer
+    frontend takes the last, with its NVAs on the addresses just below it
+    (see ``NvaCluster``), so no layout reuses another's addresses and
+    changing ``count`` never needs one the update has yet to free.
+    """
+    subnet = ipaddress.ip_network(subnet_prefix)
+    first = subnet.network_address + RESERVED_LOW_ADDRESSES
+    last = subnet.broadcast_address - RESERVED_HIGH_ADDRESSES
+    if count == 1:
+        return str(first)
+    most = int(last) - int(first) - 1
+    if count > most:
+        raise ValueError(f"nvaCount {count} does not fit the dmz subnet {subnet}: at most {most} NVAs")
+    return str(last)
+
+
+class NvaCluster(NetworkComponent):
+    """The network virtual appliances that every spoke and the gateway route through.
+
+    With ``count`` 1 this is a single NVA whose NIC owns ``private_ip``. With
+    more, ``count`` NVAs take the addresses just below ``private_ip`` and sit
+    in the backend pool of a Standard internal load balancer whose frontend
+    owns ``private_ip`` and forwards every port and protocol (an HA ports
+    rule).
+
+    Every NVA is set up by cloud-init from ``nva-cloud-init.yaml`` on first
+    boot and forwards traffic from ``forwarded_prefixes``.
+    """
+
+    def __init__(self, name, resource_group_name, subnet_id, private_ip, admin_password, forwarded_prefixes,
+                 count=1, opts=None):
+        super().__init__("NvaCluster", name, opts)
+        self.private_ip = private_ip
+        self.cloud_init = render_cloud_init(tuple(forwarded_prefixes))
+
+        if count == 1:
+            self._instance(name, "pk-hum-nva-vm", resource_group_name, subnet_id, admin_password,
+                           private_ip=private_ip)
+        else:
+            pool_id = self._load_balancer(name, resource_group_name, subnet_id, private_ip)
+            for i in range(1, count + 1):
+                self._instance(f"{name}-{i}", f"pk-hub-nva-vm{i}", resource_group_name, subnet_id, admin_password,
+                               private_ip=str(ipaddress.ip_address(private_ip) - i), backend_pool_id=pool_id)
+
+        self.register_outputs({"private_ip": private_ip})
+
+    def _load_balancer(self, name, resource_group_name, subnet_id, private_ip):
+        """Create the internal load balancer and return its backend pool id."""
+        lb_name = f"{name}-ilb"
+        frontend, pool, probe = f"{name}-frontend", f"{name}-pool", f"{name}-probe"
+        # The rule refers to parts of the load balancer itself, so their ids are built rather than read back.
+        lb_id = Output.concat("/subscriptions/", authorization.get_client_config_output().subscription_id,
+                              "/resourceGroups/", resource_group_name,
+                              "/providers/Microsoft.Network/loadBalancers/", lb_name)
+
+        lb = network.LoadBalancer(lb_name,
+            load_balancer_name=lb_name,
+            resource_group_name=resource_group_name,
+            sku=network.LoadBalancerSkuArgs(
+                name=network.LoadBalancerSkuName.STANDARD,
+                tier=network.LoadBalancerSkuTier.REGIONAL
+            ),
+            frontend_ip_configurations=[network.FrontendIPConfigurationArgs(
+                name=frontend,
+                subnet=network.SubnetArgs(
+                    id=subnet_id
+                ),
+                private_ip_address=private_ip,
+                private_ip_allocation_method=network.IPAllocationMethod.STATIC
+            )],
+            backend_address_pools=[network.BackendAddressPoolArgs(
+                name=pool
+            )],
+            probes=[network.ProbeArgs(
+                name=probe,
+                protocol=network.ProbeProtocol.TCP,
+                port=HEALTH_PROBE_PORT,
+                interval_in_seconds=5,
+                number_of_probes=2
+            )],
+            load_balancing_rules=[network.LoadBalancingRuleArgs(
+                name="ha-ports",
+                protocol=network.TransportProtocol.ALL,
+                frontend_port=0,
+                backend_port=0,
+                enable_floating_ip=False,
+                frontend_ip_configuration=network.SubResourceArgs(
+                    id=Output.concat(lb_id, "/frontendIPConfigurations/", frontend)
+                ),
+                backend_address_pool=network.SubResourceArgs(
+                    id=Output.concat(lb_id, "/backendAddressPools/", pool)
+                ),
+                probe=network.SubResourceArgs(
+                    id=Output.concat(lb_id, "/probes/", probe)
+                )
+            )],
+            opts=self.child_opts()
+        )
+        return Output.concat(lb.id, "/backendAddressPools/", pool)
+
+    def _instance(self, name, computer_name, resource_group_name, subnet_id, admin_password, private_ip=None,
+                  backend_pool_id=None):
+        nic = network.NetworkInterface(f"{name}-nic",
+            resource_group_name=resource_group_name,
+            enable_ip_forwarding=True,
+            ip_configurations=[network.NetworkInterfaceIPConfigurationArgs(
+                name=name,
+                subnet=network.SubnetArgs(
+                    id=subnet_id
+                ),
+                private_ip_address=private_ip,
+                private_ip_allocation_method=(network.IPAllocationMethod.STATIC if private_ip
+                                              else network.IPAllocationMethod.DYNAMIC),
+                load_balancer_backend_address_pools=[network.BackendAddressPoolArgs(
+                    id=backend_pool_id
+                )] if backend_pool_id else None
+            )],
+            opts=self.child_opts()
+        )
+
+        # Azure can't change an existing VM's custom data; a new forwarding setup needs a new VM.
+        linux_vm(f"{name}-vm",
+                 resource_group_name=resource_group_name,
+                 nic_id=nic.id,
+                 computer_name=computer_name,
+                 admin_password=admin_password,
+                 custom_data=self.cloud_init.custom_data,
+                 tags={"cloudInitSha256": self.cloud_init.sha256},
+                 opts=self.child_opts(replace_on_changes=["osProfile.customData"]))
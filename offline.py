@@ -0,0 +1,136 @@
+"""Run the Pulumi program offline under ``pulumi.runtime.set_mocks``.
+
+Nothing here talks to Azure: every resource registration is answered by
+``ProgramMocks`` and recorded by ``RecordingMonitor`` so tools and benchmarks
+can inspect what the program would create.
+"""
+
+import asyncio
+import json
+import os
+import runpy
+import sys
+import time
+from typing import NamedTuple
+
+import pulumi
+from pulumi.runtime.mocks import MockMonitor
+from pulumi.runtime.stack import wait_for_rpcs
+
+PROJECT = "network-peering-drift-code"
+PROGRAM_DIR = os.path.dirname(os.path.abspath(__file__))
+MOCK_ID_SUFFIX = "_id"
+MOCK_SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class Registration(NamedTuple):
+    urn: str
+    typ: str
+    name: str
+    inputs: dict
+    parent: str
+    dependencies: tuple
+    property_dependencies: dict
+    custom: bool
+    registered_at: float
+    ignore_changes: tuple = ()
+
+
+def mock_id(name):
+    return f"{name}{MOCK_ID_SUFFIX}"
+
+
+def name_from_id(resource_id):
+    """Resource name from an ARM id or from an id handed out by ``ProgramMocks``."""
+    name = resource_id.rstrip("/").rsplit("/", 1)[-1]
+    return name[:-len(MOCK_ID_SUFFIX)] if name.endswith(MOCK_ID_SUFFIX) else name
+
+
+class ProgramMocks(pulumi.runtime.Mocks):
+    """Echo inputs back as outputs; ``stack_outputs`` answers ``StackReference`` reads by stack name."""
+
+    def __init__(self, stack_outputs=None):
+        self.stack_outputs = stack_outputs or {}
+
+    def new_resource(self, args):
+        if args.typ == "pulumi:pulumi:StackReference":
+            return [args.name, {"name": args.name, "outputs": self.stack_outputs.get(args.name, {})}]
+        outputs = dict(args.inputs)
+        outputs.setdefault("name", args.name)
+        return [mock_id(args.name), outputs]
+
+    def call(self, args):
+        if args.token == "azure-native:authorization:getClientConfig":
+            return {"subscriptionId": MOCK_SUBSCRIPTION_ID, "tenantId": MOCK_SUBSCRIPTION_ID,
+                    "clientId": MOCK_SUBSCRIPTION_ID, "objectId": MOCK_SUBSCRIPTION_ID}
+        return {}
+
+
+class RecordingMonitor(MockMonitor):
+    def __init__(self, mocks):
+        super().__init__(mocks)
+        self.registrations = []
+        self.started = time.perf_counter()
+
+    def RegisterResource(self, request):
+        response = super().RegisterResource(request)
+        if request.type != "pulumi:pulumi:Stack":
+            self.registrations.append(Registration(
+                urn=response.urn,
+                typ=request.type,
+                name=request.name,
+                inputs=pulumi.runtime.rpc.deserialize_properties(request.object),
+                parent=request.parent,
+                dependencies=tuple(request.dependencies),
+                property_dependencies={k: tuple(v.urns) for k, v in request.propertyDependencies.items()},
+                custom=request.custom,
+                registered_at=time.perf_counter() - self.started,
+                ignore_changes=tuple(request.ignoreChanges),
+            ))
+        return response
+
+
+def _config_key(key):
+    return key if ":" in key else f"{PROJECT}:{key}"
+
+
+def _config_value(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def run_program(config=None, stack="dev", preview=False, program=None, stack_outputs=None, timings=None,
+                outputs=None):
+    """Evaluate ``program`` (``__main__.py`` by default) and return its registrations.
+
+    ``registered_at`` on each registration is seconds since the mocks were
+    installed. If ``timings`` is a dict it receives ``evaluate`` (running the
+    program body) and ``resolve`` (waiting for outstanding outputs and
+    registrations afterwards), in seconds. If ``outputs`` is a dict it
+    receives the stack's resolved exports, None for any a preview leaves
+    unknown.
+    """
+    mocks = ProgramMocks(stack_outputs)
+    monitor = RecordingMonitor(mocks)
+    pulumi.runtime.set_mocks(mocks, project=PROJECT, stack=stack, preview=preview, monitor=monitor)
+    # The root stack resource outlives a run; drop the previous program's exports
+    # and stack transformations.
+    root = pulumi.runtime.get_root_resource()
+    root.outputs.clear()
+    root._transformations = []
+    pulumi.runtime.set_all_config({_config_key(k): _config_value(v) for k, v in (config or {}).items()})
+
+    if PROGRAM_DIR not in sys.path:
+        sys.path.insert(0, PROGRAM_DIR)
+    start = time.perf_counter()
+    runpy.run_path(program or os.path.join(PROGRAM_DIR, "__main__.py"), run_name="__pulumi_main__")
+    evaluated = time.perf_counter()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(wait_for_rpcs())
+    if outputs is not None:
+        # Resolved one by one: a single unknown would make the whole dict None.
+        outputs.update({key: loop.run_until_complete(pulumi.Output.from_input(value).future())
+                        for key, value in root.outputs.items()})
+    if timings is not None:
+        timings["evaluate"] = evaluated - start
+        timings["resolve"] = time.perf_counter() - evaluated
+    return monitor.registrations
@@ -0,0 +1,107 @@
+# From: https://learn.microsoft.com/en-us/azure/developer/terraform/hub-spoke-on-prem
+
+from azure_sdk import network, resources
+from components import NetworkComponent, linux_vm
+from gateways import vpn_gateway
+
+
+class OnPremSite(NetworkComponent):
+    """The simulated on-premises network: a VNet with a test VM and a VPN gateway.
+
+    Given a leased gateway ``pair`` (the pool stack's outputs for it), the
+    VNet and gateway are the pair's and only the VM side is created here.
+    """
+
+    def __init__(self, name, spec, admin_password, gateway_settings, pair=None, opts=None):
+        super().__init__("OnPremSite", name, opts)
+
+        if pair is None:
+            self.resource_group = resources.ResourceGroup(f"{name}-vnet-rg", opts=self.child_opts())
+
+            vnet = network.VirtualNetwork(f"{name}-vnet",
+                resource_group_name=self.resource_group.name,
+                address_space=network.AddressSpaceArgs(
+                    address_prefixes=list(spec.address_prefixes)
+                ),
+                opts=self.child_opts()
+            )
+            self.resource_group_name, self.vnet_name, self.vnet_id = self.resource_group.name, vnet.name, vnet.id
+        else:
+            self.resource_group_name = pair["resource_group_name"]
+            self.vnet_name, self.vnet_id = pair["onprem_vnet_name"], pair["onprem_vnet_id"]
+
+        mgmt = network.Subnet(f"{name}-mgmt",
+            virtual_network_name=self.vnet_name,
+            resource_group_name=self.resource_group_name,
+            address_prefix=spec.subnet("mgmt").address_prefix,
+            opts=self.child_opts()
+        )
+
+        pip = network.PublicIPAddress(f"{name}-pip",
+            resource_group_name=self.resource_group_name,
+            public_ip_allocation_method=network.IPAllocationMethod.DYNAMIC,
+            opts=self.child_opts()
+        )
+
+        nic = network.NetworkInterface(f"{name}-nic",
+            resource_group_name=self.resource_group_name,
+            enable_ip_forwarding=True,
+            ip_configurations=[network.NetworkInterfaceIPConfigurationArgs(
+                name=name,
+                subnet=network.SubnetArgs(
+                    id=mgmt.id
+                ),
+                private_ip_allocation_method=network.IPAllocationMethod.DYNAMIC,
+                public_ip_address=network.PublicIPAddressArgs(
+                    id=pip.id
+                )
+            )],
+            opts=self.child_opts()
+        )
+
+        network.NetworkSecurityGroup(f"{name}_nsg",
+            resource_group_name=self.resource_group_name,
+            security_rules=[network.SecurityRuleArgs(
+                name="SSH",
+                priority=1001,
+                direction=network.SecurityRuleDirection.INBOUND,
+                access="Allow",
+                protocol="Tcp",
+                source_port_range="*",
+                source_address_prefix="86.27.128.191/32",
+                destination_address_prefix="*",
+                destination_port_range="22"
+            )],
+            opts=self.child_opts()
+        )
+
+        linux_vm(f"{name}-vm",
+                 resource_group_name=self.resource_group_name,
+                 nic_id=nic.id,
+                 computer_name="pk-onprem-vm",
+                 admin_password=admin_password,
+                 os_disk_name="myosdisk1",
+                 opts=self.child_opts())
+
+        self.gateway = None
+        if pair is None:
+            gateway_subnet = network.Subnet("GatewaySubnet",
+                name="GatewaySubnet",
+                virtual_network_name=self.vnet_name,
+                resource_group_name=self.resource_group_name,
+                address_prefix=spec.subnet("GatewaySubnet").address_prefix,
+                opts=self.child_opts()
+            )
+
+            self.gateway = vpn_gateway(self, f"{name}-vpn-gateway", gateway_settings.asns["onprem"],
+                                       resource_group_name=self.resource_group_name,
+                                       subnet_id=gateway_subnet.id,
+                                       public_ip_names=(f"{name}-vpn-gw1-pip", f"{name}-vpn-gw2-pip"),
+                                       settings=gateway_settings)
+        self.gateway_id = self.gateway.id if self.gateway else pair["onprem_gateway_id"]
+
+        self.register_outputs({
+            "resource_group_name": self.resource_group_name,
+            "vnet_id": self.vnet_id,
+            "gateway_id": self.gateway_id,
+        })
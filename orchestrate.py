@@ -0,0 +1,305 @@
+"""Run the program across many stacks, dependencies first, with the Automation API.
+
+    python orchestrate.py stacks.yaml up|preview|refresh|destroy [--concurrency 4] [--timeout 3600]
+        [--retries 2] [--backend file://~/.pulumi-local] [--report report.json] [--event-log events.jsonl]
+        [--offline]
+
+The stack file (YAML or JSON) lists the stacks and their config::
+
+    stacks:
+      - name: org/network-peering-drift-code/hub
+        config: {deploymentMode: hub, "azure-native:location": uksouth}
+      - name: org/network-peering-drift-code/spoke1
+        config: {deploymentMode: spoke, hubStack: org/network-peering-drift-code/hub, spoke: spoke1}
+        depends_on: []
+
+A stack waits for the listed stacks its ``hubStack`` or ``gatewayPool``
+config names and those in its ``depends_on``, and is skipped if one of them
+does not succeed; ``destroy`` runs the other way round, dependents first.
+Up to --concurrency stacks run at once, each attempt in its own process
+group. Failures that look transient (throttling, dropped connections, a
+concurrent update) are retried up to --retries times with jittered
+exponential backoff. --timeout bounds a stack's whole run, retries and
+backoff included: an attempt still running when it is up is killed, and no
+retry starts that could not begin before it.
+
+A ``pooled`` stack without a ``gatewayPair`` in its config gets one from
+the lease store named by ``gatewayLeaseStore`` (see ``leases.py``): ``up``
+leases a pair for the stack, ``preview`` and ``refresh`` use the pair it holds
+or else the first free one without leasing it, and a successful ``destroy``
+releases its lease.
+
+--event-log appends every resource step's start and end to a JSON Lines
+log for ``engine_timings.py``.
+
+--offline evaluates every stack under the mocks in ``offline.py`` instead of
+running the Pulumi CLI, and hands each stack's exports to the stacks that
+reference it.
+"""
+
+import argparse
+import graphlib
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+import yaml
+
+from leases import DEFAULT_STORE, LeaseError, LocalLeaseStore
+from offline import PROGRAM_DIR, _config_key, _config_value
+
+OPERATIONS = ("up", "preview", "refresh", "destroy")
+REFERENCE_KEYS = ("hubStack", "gatewayPool")
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMEOUT = "timeout"
+SKIPPED = "skipped"
+
+TRANSIENT_ERRORS = re.compile(
+    r"ConcurrentUpdateError|another update is currently in progress|\bstatus ?(?:code)?[:=]? ?429\b|TooManyRequests"
+    r"|Too Many Requests|RetryableError"
+    r"|ServiceUnavailable|InternalServerError|connection reset|i/o timeout|TLS handshake timeout|unexpected EOF",
+    re.IGNORECASE)
+
+
+class StackSpec(NamedTuple):
+    name: str
+    config: dict
+    depends_on: tuple
+
+
+class StackResult(NamedTuple):
+    name: str
+    status: str
+    attempts: int
+    seconds: float
+    changes: dict
+    error: str
+
+
+def load_stacks(path):
+    with open(path) as f:
+        raw = json.load(f) if path.endswith(".json") else yaml.safe_load(f) or {}
+    specs = [StackSpec(s["name"], s.get("config") or {}, tuple(s.get("depends_on") or ()))
+             for s in raw.get("stacks", [])]
+    names = [spec.name for spec in specs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"stacks listed more than once: {', '.join(duplicates)}")
+    return specs
+
+
+def dependencies(specs):
+    """Map every stack to the listed stacks it waits for.
+
+    References to stacks that are not listed are assumed to be deployed
+    already; an unlisted ``depends_on`` entry or a cycle is an error.
+    """
+    names = {spec.name for spec in specs}
+    deps = {}
+    for spec in specs:
+        unknown = set(spec.depends_on) - names
+        if unknown:
+            raise ValueError(f"{spec.name} depends on unlisted stacks: {', '.join(sorted(unknown))}")
+        references = {spec.config[key] for key in REFERENCE_KEYS if key in spec.config}
+        deps[spec.name] = (set(spec.depends_on) | references) & names
+    try:
+        tuple(graphlib.TopologicalSorter(deps).static_order())
+    except graphlib.CycleError as e:
+        raise ValueError(f"stack dependencies form a cycle: {' -> '.join(e.args[1])}") from None
+    return deps
+
+
+def orchestrate(specs, run, concurrency, reverse=False):
+    """Call ``run(spec, upstream_outputs)`` for every stack, at most ``concurrency`` at a time.
+
+    ``run`` returns a ``StackResult`` and the stack's outputs. With
+    ``reverse`` a stack waits for its dependents instead, as a destroy must.
+    Results come back in the order of ``specs``.
+    """
+    deps = dependencies(specs)
+    if reverse:
+        deps = {name: {other for other, upstream in deps.items() if name in upstream} for name in deps}
+    by_name = {spec.name: spec for spec in specs}
+    sorter = graphlib.TopologicalSorter(deps)
+    sorter.prepare()
+    results, outputs, running = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                failed = sorted(dep for dep in deps[name] if results[dep].status != SUCCEEDED)
+                if failed:
+                    results[name] = StackResult(name, SKIPPED, 0, 0.0, {}, f"{', '.join(failed)} did not succeed")
+                    sorter.done(name)
+                else:
+                    running[pool.submit(run, by_name[name], {dep: outputs[dep] for dep in deps[name]})] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                results[name], outputs[name] = future.result()
+                sorter.done(name)
+    return [results[spec.name] for spec in specs]
+
+
+def run_child(request, timeout):
+    """Run one attempt in a child process group and return its result dict."""
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"], cwd=PROGRAM_DIR,
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                             start_new_session=True)
+    try:
+        out, err = child.communicate(json.dumps(request), timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # The Pulumi CLI runs in the child's process group; take it down too.
+        os.killpg(child.pid, signal.SIGKILL)
+        child.communicate()
+        return {"status": TIMEOUT}
+    try:
+        return json.loads(out.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        error = err.strip().splitlines()[-1] if err.strip() else f"exited with status {child.returncode}"
+        return {"status": FAILED, "error": error, "transient": bool(TRANSIENT_ERRORS.search(err))}
+
+
+def lease_store(config):
+    return LocalLeaseStore(os.path.join(PROGRAM_DIR, config.get("gatewayLeaseStore") or DEFAULT_STORE))
+
+
+def with_gateway_pair(spec, operation):
+    """``spec``'s config with the gateway pair a pooled stack runs on, leased for ``up``."""
+    if spec.config.get("deploymentMode") != "pooled" or "gatewayPair" in spec.config:
+        return spec.config
+    store = lease_store(spec.config)
+    lease = store.acquire(spec.name) if operation == "up" else store.held_by(spec.name)
+    pair = lease.pair if lease else store.free()
+    return dict(spec.config, gatewayPair=pair) if pair else spec.config
+
+
+def runner(operation, args):
+    def run(spec, upstream):
+        try:
+            config = with_gateway_pair(spec, operation)
+        except LeaseError as e:
+            return StackResult(spec.name, FAILED, 0, 0.0, {}, str(e)), {}
+        request = {"stack": spec.name, "config": config, "operation": operation, "offline": args.offline,
+                   "backend": args.backend, "event_log": args.event_log and os.path.abspath(args.event_log),
+                   "stack_outputs": upstream}
+        start = time.perf_counter()
+        deadline = start + args.timeout
+        for attempt in range(1, args.retries + 2):
+            result = run_child(request, deadline - time.perf_counter())
+            if result["status"] == TIMEOUT:
+                result["error"] = f"no result within {args.timeout:g}s"
+            if result["status"] != FAILED or not result.get("transient") or attempt > args.retries:
+                break
+            delay = random.uniform(0, args.backoff * 2 ** (attempt - 1))
+            if time.perf_counter() + delay >= deadline:
+                break
+            time.sleep(delay)
+        if operation == "destroy" and result["status"] == SUCCEEDED and spec.config.get("deploymentMode") == "pooled":
+            lease_store(spec.config).release(spec.name)
+        return StackResult(spec.name, result["status"], attempt, time.perf_counter() - start,
+                           result.get("changes", {}), result.get("error", "")), result.get("outputs", {})
+    return run
+
+
+def run_offline(request):
+    import offline
+
+    if request["operation"] == "destroy":
+        # The mocks keep no state, so there is nothing to delete.
+        return {}, {}
+    outputs = {}
+    registrations = offline.run_program(config=request["config"], stack=request["stack"].rsplit("/", 1)[-1],
+                                        preview=request["operation"] == "preview",
+                                        stack_outputs=request["stack_outputs"], outputs=outputs)
+    return {"create": sum(r.custom for r in registrations)}, outputs
+
+
+def run_automation(request):
+    from pulumi import automation as auto
+
+    from engine_timings import EventLog
+
+    env_vars = {"PULUMI_BACKEND_URL": request["backend"]} if request["backend"] else None
+    stack = auto.create_or_select_stack(stack_name=request["stack"], work_dir=PROGRAM_DIR,
+                                        opts=auto.LocalWorkspaceOptions(env_vars=env_vars))
+    stack.set_all_config({_config_key(k): auto.ConfigValue(value=_config_value(v))
+                          for k, v in request["config"].items()})
+    on_event = EventLog(request["event_log"], stack=request["stack"]) if request["event_log"] else None
+    if request["operation"] == "up":
+        result = stack.up(on_event=on_event)
+        return result.summary.resource_changes or {}, {k: v.value for k, v in result.outputs.items()}
+    if request["operation"] == "preview":
+        return stack.preview(on_event=on_event).change_summary, {}
+    if request["operation"] == "refresh":
+        return stack.refresh(on_event=on_event).summary.resource_changes or {}, {}
+    return stack.destroy(on_event=on_event).summary.resource_changes or {}, {}
+
+
+def child():
+    request = json.load(sys.stdin)
+    try:
+        changes, outputs = (run_offline if request["offline"] else run_automation)(request)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(json.dumps({"status": FAILED, "error": error.strip().splitlines()[-1],
+                          "transient": bool(TRANSIENT_ERRORS.search(error))}))
+        return
+    print(json.dumps({"status": SUCCEEDED, "changes": changes, "outputs": outputs}))
+
+
+def main():
+    if sys.argv[1:] == ["--child"]:
+        child()
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("stacks", help="YAML or JSON stack file")
+    parser.add_argument("operation", choices=OPERATIONS)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds per stack, retries and backoff included")
+    parser.add_argument("--retries", type=int, default=2, help="retries for transient failures")
+    parser.add_argument("--backoff", type=float, default=30, help="seconds before the first retry, doubling")
+    parser.add_argument("--backend", help="Pulumi backend URL, e.g. file://~/.pulumi-local")
+    parser.add_argument("--report", help="write the aggregated report to this JSON file")
+    parser.add_argument("--event-log", help="append resource step timings to this JSON Lines file")
+    parser.add_argument("--offline", action="store_true", help="evaluate under mocks instead of running Pulumi")
+    args = parser.parse_args()
+
+    try:
+        specs = load_stacks(args.stacks)
+        start = time.perf_counter()
+        results = orchestrate(specs, runner(args.operation, args), args.concurrency,
+                              reverse=args.operation == "destroy")
+    except ValueError as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - start
+
+    width = max((len(spec.name) for spec in specs), default=5)
+    print(f"{'stack':<{width}} {'status':<9} {'attempts':>8} {'seconds':>8}  changes")
+    for result in results:
+        changes = ", ".join(f"{op} {count}" for op, count in sorted(result.changes.items()))
+        print(f"{result.name:<{width}} {result.status:<9} {result.attempts:>8} {result.seconds:>8.1f}  "
+              f"{changes or result.error}")
+    print(f"{len(results)} stack(s) in {elapsed:.1f}s ({sum(r.seconds for r in results):.1f}s of stack time)")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"operation": args.operation, "seconds": elapsed,
+                       "stacks": [result._asdict() for result in results]}, f, indent=2)
+            f.write("\n")
+    sys.exit(0 if all(result.status == SUCCEEDED for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Skip ``pulumi preview`` when nothing it depends on has changed.
+
+    python preview_cache.py preview STACK [--observed DIR] [--cache .preview-cache] [--max-entries 32]
+        [--backend file://~/.pulumi-local]
+    python preview_cache.py list [--cache .preview-cache]
+    python preview_cache.py invalidate [KEY ...] [--cache .preview-cache]
+
+The cache key hashes everything a preview of STACK depends on here: the
+program's sources (every top-level module, since ``__main__.py`` is only the
+entry point, plus ``nva-cloud-init.yaml`` and ``Pulumi.yaml``), the stack's
+``Pulumi.<stack>.yaml``, the topology file that config points at and the
+package versions resolved in ``uv.lock``.
+
+Only clean previews, those that would change nothing, are stored, and only
+once ``drift.py`` finds no drift between the stack (``pulumi stack export``)
+and the ARM export in --observed. The entry keeps a hash of each of the
+stack's peerings and route tables as observed then, normalized the way
+``drift.py`` compares them. A later preview with the same key is answered
+from the cache if the export in --observed still hashes the same; nothing is
+evaluated. Without --observed nothing vouches for Azure's side, so the
+preview always runs.
+
+Entries are files named after their key; a hit refreshes the file's mtime
+and the least recently used entries beyond --max-entries are deleted.
+``invalidate`` drops the given keys, or everything.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+import tomllib
+from typing import NamedTuple
+
+import yaml
+
+import drift
+from offline import PROGRAM_DIR, PROJECT
+
+CACHE_DIR = ".preview-cache"
+MAX_ENTRIES = 32
+ENTRY_SUFFIX = ".json"
+PROGRAM_FILES = ("*.py", "nva-cloud-init.yaml", "Pulumi.yaml")
+DEFAULT_TOPOLOGY_FILE = "topology.yaml"
+
+
+class Outcome(NamedTuple):
+    key: str
+    hit: bool
+    summary: dict
+    reason: str
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+
+def stack_config(stack, program_dir=PROGRAM_DIR):
+    """The ``config`` section of ``Pulumi.<stack>.yaml``, with this project's keys unprefixed."""
+    raw = yaml.safe_load(_read(os.path.join(program_dir, f"Pulumi.{stack.rsplit('/', 1)[-1]}.yaml"))) or {}
+    prefix = f"{PROJECT}:"
+    return {key[len(prefix):] if key.startswith(prefix) else key: value
+            for key, value in (raw.get("config") or {}).items()}
+
+
+def locked_packages(program_dir=PROGRAM_DIR):
+    """``name==version`` for every package ``uv.lock`` resolves, sorted."""
+    lock = tomllib.loads(_read(os.path.join(program_dir, "uv.lock")).decode() or "")
+    return sorted(f"{p['name']}=={p.get('version', '')}" for p in lock.get("package", ()))
+
+
+def key_components(stack, program_dir=PROGRAM_DIR):
+    """Digest of each input the cache key covers, by name."""
+    sources = sorted({path for pattern in PROGRAM_FILES for path in glob.glob(os.path.join(program_dir, pattern))})
+    config = stack_config(stack, program_dir)
+    topology = os.path.join(program_dir, config.get("topologyFile") or DEFAULT_TOPOLOGY_FILE)
+    return {
+        "program": _digest(*(os.path.relpath(path, program_dir).encode() + b"\0" + _read(path)
+                             for path in sources)),
+        "config": _digest(_read(os.path.join(program_dir, f"Pulumi.{stack.rsplit('/', 1)[-1]}.yaml"))),
+        "topology": _digest(_read(topology)),
+        "packages": _digest("\n".join(locked_packages(program_dir)).encode()),
+    }
+
+
+def cache_key(stack, components):
+    return _digest(stack.encode(), json.dumps(components, sort_keys=True).encode())
+
+
+def is_clean(summary):
+    return all(op == "same" or not count for op, count in summary.items())
+
+
+def observed_digests(observed, keys=None):
+    """Digest of each normalized resource in ``observed`` (as ``drift.load_observed`` returns it), by key."""
+    digests = {}
+    for key, obj in observed.items():
+        name = "/".join(key)
+        if keys is None or name in keys:
+            digests[name] = _digest(json.dumps(drift.normalize(obj), sort_keys=True).encode())
+    return digests
+
+
+class PreviewCache:
+    """Clean preview results in a directory, one file per key, evicted least recently used first."""
+
+    def __init__(self, path=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        try:
+            with open(self._entry_path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def touch(self, key):
+        os.utime(self._entry_path(key))
+
+    def put(self, key, stack, components, summary, observed):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._entry_path(key) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"key": key, "stack": stack, "components": components, "summary": summary,
+                       "observed": observed, "created_at": time.time()}, f)
+        os.replace(tmp, self._entry_path(key))
+        self.evict()
+
+    def entries(self):
+        """(key, last used) for every entry, most recently used first."""
+        try:
+            names = [name for name in os.listdir(self.path) if name.endswith(ENTRY_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            try:
+                entries.append((name[:-len(ENTRY_SUFFIX)], os.path.getmtime(os.path.join(self.path, name))))
+            except FileNotFoundError:
+                continue
+        return sorted(entries, key=lambda entry: entry[1], reverse=True)
+
+    def evict(self):
+        for key, _ in self.entries()[self.max_entries:]:
+            self.invalidate([key])
+
+    def invalidate(self, keys=None):
+        """Drop ``keys``, or every entry; returns how many were dropped."""
+        dropped = 0
+        for key in keys if keys is not None else [key for key, _ in self.entries()]:
+            try:
+                os.unlink(self._entry_path(key))
+                dropped += 1
+            except FileNotFoundError:
+                pass
+        return dropped
+
+
+def cached_preview(cache, stack, run_preview, observed=None, export_state=None, program_dir=PROGRAM_DIR):
+    """Answer from ``cache`` when the key matches and nothing observed changed, otherwise call ``run_preview()``.
+
+    ``run_preview`` returns a change summary (operation -> count).
+    ``export_state`` returns the stack's ``pulumi stack export``; a clean
+    summary is stored if the stack shows no drift against ``observed``.
+    """
+    components = key_components(stack, program_dir)
+    key = cache_key(stack, components)
+    entry = cache.get(key)
+    current = drift.load_observed(observed) if observed else None
+    if entry is None:
+        reason = "no clean preview with this key"
+    elif current is None:
+        reason = "no observed state to check for drift"
+    else:
+        digests = observed_digests(current, entry["observed"])
+        changed = sum(digests.get(name) != digest for name, digest in entry["observed"].items())
+        if not changed:
+            cache.touch(key)
+            return Outcome(key, True, entry["summary"], "")
+        reason = f"{changed} resource(s) changed in observed state"
+    summary = run_preview()
+    if is_clean(summary) and current is not None and export_state is not None:
+        desired = drift.desired_from_stack_export(export_state())
+        if not drift.DriftEngine().run(desired, current):
+            cache.put(key, stack, components, summary, observed_digests(current, {"/".join(k) for k in desired}))
+    return Outcome(key, False, summary, reason)
+
+
+def _select_stack(stack_name, backend):
+    from pulumi import automation as auto
+
+    env_vars = {"PULUMI_BACKEND_URL": backend} if backend else None
+    return auto.select_stack(stack_name=stack_name, work_dir=PROGRAM_DIR,
+                             opts=auto.LocalWorkspaceOptions(env_vars=env_vars))
+
+
+def automation_preview(stack_name, backend=None):
+    return lambda: _select_stack(stack_name, backend).preview().change_summary
+
+
+def automation_export(stack_name, backend=None):
+    return lambda: _select_stack(stack_name, backend).export_stack().deployment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cache", default=CACHE_DIR, help="cache directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    preview = commands.add_parser("preview")
+    preview.add_argument("stack")
+    preview.add_argument("--observed", help="ARM JSON export file or directory to check for drift")
+    preview.add_argument("--max-entries", type=int, default=MAX_ENTRIES)
+    preview.add_argument("--backend", help="Pulumi backend URL, e.g. file://~/.pulumi-local")
+    commands.add_parser("list")
+    invalidate = commands.add_parser("invalidate")
+    invalidate.add_argument("keys", nargs="*", help="keys to drop; all when none are given")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        cache = PreviewCache(args.cache)
+        for key, used in cache.entries():
+            entry = cache.get(key) or {}
+            print(f"{key[:16]}  {entry.get('stack', '?'):<24} last used {time.ctime(used)}  {entry.get('summary')}")
+        return
+    if args.command == "invalidate":
+        print(f"dropped {PreviewCache(args.cache).invalidate(args.keys or None)} cache entries")
+        return
+
+    cache = PreviewCache(args.cache, args.max_entries)
+    start = time.perf_counter()
+    outcome = cached_preview(cache, args.stack, automation_preview(args.stack, args.backend), args.observed,
+                             automation_export(args.stack, args.backend))
+    changes = ", ".join(f"{op} {count}" for op, count in sorted(outcome.summary.items()))
+    source = "cached" if outcome.hit else f"ran preview ({outcome.reason})"
+    print(f"{args.stack}: {changes or 'no resources'}; {source} in {time.perf_counter() - start:.1f}s, "
+          f"key {outcome.key[:16]}")
+
+
+if __name__ == "__main__":
+    main()
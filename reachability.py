@@ -0,0 +1,502 @@
+"""Offline effective routes and reachability.
+
+    python reachability.py [--from SUBNET --to ADDRESS] [--routes SUBNET] [--config key=value ...]
+
+The program is evaluated offline (see ``offline.py``) and the effective
+routes Azure would program on every subnet are rebuilt from what it
+registers: the default system routes, VNet peering routes, prefixes learned
+from VPN gateways (including gateway transit through a peering with
+``use_remote_gateways``) and user-defined routes. On an equal prefix a user
+route beats a gateway route, which beats a system route; otherwise the
+longest prefix wins.
+
+Each subnet's routes are inserted into a binary trie, which is compiled into
+a sorted list of disjoint address ranges so a lookup is one bisect. The
+boundaries of every compiled table together split the address space into
+ranges that no lookup can tell apart, so a traced path is cached per
+(source subnet, range) and batch queries only pay for the bisect.
+
+Only IPv4 is modelled. Without arguments every subnet is probed against
+every other subnet and an internet address.
+"""
+
+import argparse
+from bisect import bisect_right
+from ipaddress import ip_address, ip_network
+from typing import NamedTuple
+
+import offline
+from routes import VIRTUAL_APPLIANCE, VNET_LOCAL, Route
+
+VIRTUAL_NETWORK = "azure-native:network:VirtualNetwork"
+SUBNET = "azure-native:network:Subnet"
+ROUTE_TABLE = "azure-native:network:RouteTable"
+PEERING = "azure-native:network:VirtualNetworkPeering"
+GATEWAY = "azure-native:network:VirtualNetworkGateway"
+CONNECTION = "azure-native:network:VirtualNetworkGatewayConnection"
+NETWORK_INTERFACE = "azure-native:network:NetworkInterface"
+LOAD_BALANCER = "azure-native:network:LoadBalancer"
+STATIC_MEMBER = "azure-native:network:StaticMember"
+CONNECTIVITY_CONFIGURATION = "azure-native:network:ConnectivityConfiguration"
+
+INTERNET = "Internet"
+NONE = "None"
+VNET_PEERING = "VNetPeering"
+VIRTUAL_NETWORK_GATEWAY = "VirtualNetworkGateway"
+
+# Route sources, lowest precedence first.
+DEFAULT = "Default"
+GATEWAY_LEARNED = "VirtualNetworkGateway"
+USER = "User"
+
+# Address ranges Azure drops unless something more specific covers them.
+# https://learn.microsoft.com/en-us/azure/virtual-network/virtual-networks-udr-overview#default
+DEFAULT_NONE_PREFIXES = ("10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "100.64.0.0/10")
+
+DELIVERED = "Delivered"
+DROPPED = "Dropped"
+LOOP = "Loop"
+
+INTERNET_PROBE = "8.8.8.8"
+
+
+class EffectiveRoute(NamedTuple):
+    source: str
+    address_prefix: str
+    next_hop_type: str
+    next_hop_ip_address: str = None
+
+    def __str__(self):
+        hop = f"{self.next_hop_type} {self.next_hop_ip_address}" if self.next_hop_ip_address else self.next_hop_type
+        return f"{self.address_prefix:<20} {hop:<30} ({self.source})"
+
+
+class Subnet(NamedTuple):
+    name: str
+    vnet: str
+    address_prefixes: tuple
+    route_table: str = None
+
+
+class Peering(NamedTuple):
+    vnet: str
+    remote: str
+    allow_forwarded_traffic: bool
+    allow_gateway_transit: bool
+    use_remote_gateways: bool
+
+
+class RouteTable(NamedTuple):
+    routes: tuple
+    propagate_gateway_routes: bool = True
+
+
+class Model(NamedTuple):
+    vnets: dict
+    subnets: dict
+    peerings: dict
+    route_tables: dict
+    gateways: dict
+    connections: tuple
+    appliances: dict
+
+
+class Hop(NamedTuple):
+    subnet: str
+    route: EffectiveRoute
+
+
+class Path(NamedTuple):
+    outcome: str
+    hops: tuple
+    destination: str = None
+    reason: str = None
+
+    def __str__(self):
+        steps = " -> ".join(hop.subnet for hop in self.hops)
+        end = self.destination if self.outcome == DELIVERED else self.outcome
+        return f"{steps} => {end}" + (f" ({self.reason})" if self.reason else "")
+
+
+def _ipv4(prefix):
+    net = ip_network(prefix, strict=False)
+    return net if net.version == 4 else None
+
+
+class PrefixTrie:
+    """Binary trie over IPv4 prefixes; a later insert of the same prefix replaces the earlier one."""
+
+    WIDTH = 32
+
+    def __init__(self):
+        self._root = [None, None, None]  # zero child, one child, value
+
+    def insert(self, prefix, value):
+        net = _ipv4(prefix)
+        if net is None:
+            return
+        address, node = int(net.network_address), self._root
+        for depth in range(net.prefixlen):
+            bit = (address >> (self.WIDTH - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = self._merge(node[2], value)
+
+    def lookup(self, address):
+        address, node, best = int(address), self._root, self._root[2]
+        for depth in range(self.WIDTH):
+            node = node[(address >> (self.WIDTH - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = node[2]
+        return best
+
+    def _merge(self, old, new):
+        """Value stored when ``new`` is inserted where ``old`` already is."""
+        return new
+
+    def _inherit(self, inherited, value):
+        """Value of a node's range given its own value and its nearest ancestor's."""
+        return value if value is not None else inherited
+
+    def compile(self):
+        starts, values = [], []
+
+        def emit(start, value):
+            if not values or values[-1] is not value:
+                starts.append(start)
+                values.append(value)
+
+        def walk(node, start, depth, inherited):
+            value = self._inherit(inherited, node[2])
+            if node[0] is None and node[1] is None:
+                emit(start, value)
+                return
+            half = 1 << (self.WIDTH - depth - 1)
+            for bit in (0, 1):
+                child = node[bit]
+                if child is None:
+                    emit(start + bit * half, value)
+                else:
+                    walk(child, start + bit * half, depth + 1, value)
+
+        walk(self._root, 0, 0, None)
+        return CompiledTable(starts, values)
+
+
+class CompiledTable:
+    """Disjoint address ranges starting at ``starts[i]`` and mapping to ``values[i]``."""
+
+    def __init__(self, starts, values):
+        self.starts = starts
+        self.values = values
+
+    def lookup(self, address):
+        return self.values[bisect_right(self.starts, int(address)) - 1]
+
+
+def is_ha_ports(rule):
+    return rule.get("protocol") == "All" and not rule.get("frontendPort") and not rule.get("backendPort")
+
+
+def ha_ports_frontends(load_balancers, pool_members):
+    """Frontend IP -> subnet for every HA ports rule whose backend pool has an IP-forwarding member."""
+    name = offline.name_from_id
+    frontends = {}
+    for lb in load_balancers:
+        configs = {c["name"]: c for c in lb.get("frontendIPConfigurations", ())}
+        for rule in lb.get("loadBalancingRules", ()):
+            frontend = configs.get(name(rule["frontendIPConfiguration"]["id"]))
+            if (is_ha_ports(rule) and frontend and frontend.get("privateIPAddress")
+                    and pool_members.get(name(rule["backendAddressPool"]["id"]))):
+                frontends[frontend["privateIPAddress"]] = name(frontend["subnet"]["id"])
+    return frontends
+
+
+def pool_members(registrations):
+    """Backend pool name -> names of the IP-forwarding NICs in it."""
+    members = {}
+    for r in registrations:
+        if r.typ == NETWORK_INTERFACE and r.inputs.get("enableIPForwarding"):
+            for config in r.inputs.get("ipConfigurations", ()):
+                for pool in config.get("loadBalancerBackendAddressPools") or ():
+                    members.setdefault(offline.name_from_id(pool["id"]), []).append(r.name)
+    return members
+
+
+def network_manager_peerings(configurations, members):
+    """The peerings Virtual Network Manager creates for ``configurations``, keyed like ``Model.peerings``.
+
+    ``members`` maps a network group name to its member VNets.
+    """
+    peerings = {}
+    for configuration in configurations:
+        hubs = [offline.name_from_id(hub["resourceId"]) for hub in configuration.get("hubs", ())]
+        for group in configuration.get("appliesToGroups", ()):
+            spokes = members.get(offline.name_from_id(group["networkGroupId"]), ())
+            use_gateway = group.get("useHubGateway") == "True"
+            for hub in hubs:
+                for spoke in spokes:
+                    peerings[(hub, spoke)] = Peering(hub, spoke, True, use_gateway, False)
+                    peerings[(spoke, hub)] = Peering(spoke, hub, True, False, use_gateway)
+            if configuration["connectivityTopology"] == "Mesh" or group.get("groupConnectivity") == "DirectlyConnected":
+                for spoke in spokes:
+                    for other in spokes:
+                        if other != spoke:
+                            peerings[(spoke, other)] = Peering(spoke, other, True, False, False)
+    return peerings
+
+
+def model_from_registrations(registrations):
+    """Build the network model from ``offline.run_program`` registrations.
+
+    Appliances are IP-forwarding NICs with a static address, and internal
+    load balancer frontends with an HA ports rule in front of them. Virtual
+    Network Manager connectivity becomes the peerings it would create.
+    """
+    name = offline.name_from_id
+    vnets, subnets, peerings, route_tables, gateways, connections, appliances = {}, {}, {}, {}, {}, [], {}
+    load_balancers, configurations, members = [], [], {}
+    for r in registrations:
+        inputs = r.inputs
+        if r.typ == VIRTUAL_NETWORK:
+            vnets[r.name] = tuple(inputs.get("addressSpace", {}).get("addressPrefixes", ()))
+        elif r.typ == SUBNET:
+            prefixes = inputs.get("addressPrefixes") or [inputs["addressPrefix"]]
+            route_table = inputs.get("routeTable")
+            subnets[r.name] = Subnet(r.name, inputs["virtualNetworkName"], tuple(prefixes),
+                                     name(route_table["id"]) if route_table else None)
+        elif r.typ == ROUTE_TABLE:
+            route_tables[r.name] = RouteTable(
+                tuple(Route(route["name"], route["addressPrefix"], route["nextHopType"],
+                            route.get("nextHopIpAddress")) for route in inputs.get("routes", ())),
+                not inputs.get("disableBgpRoutePropagation", False))
+        elif r.typ == PEERING:
+            remote = name(inputs["remoteVirtualNetwork"]["id"])
+            peerings[(inputs["virtualNetworkName"], remote)] = Peering(
+                inputs["virtualNetworkName"], remote,
+                bool(inputs.get("allowForwardedTraffic")),
+                bool(inputs.get("allowGatewayTransit")),
+                bool(inputs.get("useRemoteGateways")))
+        elif r.typ == GATEWAY:
+            gateways[r.name] = name(inputs["ipConfigurations"][0]["subnet"]["id"])
+        elif r.typ == CONNECTION:
+            connections.append((name(inputs["virtualNetworkGateway1"]["id"]),
+                                name(inputs["virtualNetworkGateway2"]["id"])))
+        elif r.typ == NETWORK_INTERFACE and inputs.get("enableIPForwarding"):
+            for config in inputs.get("ipConfigurations", ()):
+                if config.get("privateIPAddress"):
+                    appliances[config["privateIPAddress"]] = name(config["subnet"]["id"])
+        elif r.typ == LOAD_BALANCER:
+            load_balancers.append(inputs)
+        elif r.typ == STATIC_MEMBER:
+            members.setdefault(inputs["networkGroupName"], []).append(name(inputs["resourceId"]))
+        elif r.typ == CONNECTIVITY_CONFIGURATION:
+            configurations.append(inputs)
+    peerings.update(network_manager_peerings(configurations, members))
+    appliances.update(ha_ports_frontends(load_balancers, pool_members(registrations)))
+    return Model(vnets, subnets, peerings, route_tables, gateways, tuple(connections), appliances)
+
+
+class Simulator:
+    def __init__(self, model):
+        self.model = model
+        # A peering only carries traffic once both sides exist.
+        self.peered = {}
+        for vnet, remote in model.peerings:
+            if (remote, vnet) in model.peerings:
+                self.peered.setdefault(vnet, set()).add(remote)
+        self.gateway_subnets = {vnet: subnet for vnet, subnet in
+                                ((model.subnets[s].vnet, s) for s in model.gateways.values() if s in model.subnets)}
+
+        self.subnet_index = self._compile({p: name for name, s in model.subnets.items() for p in s.address_prefixes})
+        self.gateway_tables = {vnet: self._compile(self._gateway_next_hops(vnet)) for vnet in model.vnets}
+        self.tables = {name: self._compile_routes(self.effective_routes(name)) for name in model.subnets}
+
+        bounds = set(self.subnet_index.starts)
+        for table in list(self.tables.values()) + list(self.gateway_tables.values()):
+            bounds.update(table.starts)
+        self.bounds = sorted(bounds)
+        self._paths = {name: [None] * len(self.bounds) for name in model.subnets}
+
+    @staticmethod
+    def _compile(values_by_prefix):
+        trie = PrefixTrie()
+        for prefix, value in values_by_prefix.items():
+            trie.insert(prefix, value)
+        return trie.compile()
+
+    @staticmethod
+    def _compile_routes(routes):
+        trie = PrefixTrie()
+        for route in routes:
+            trie.insert(route.address_prefix, route)
+        return trie.compile()
+
+    def gateway_vnet(self, vnet):
+        """The VNet whose VPN gateway serves ``vnet``: its own, or one reached with ``use_remote_gateways``."""
+        if vnet in self.gateway_subnets:
+            return vnet
+        for remote in self.peered.get(vnet, ()):
+            if (self.model.peerings[(vnet, remote)].use_remote_gateways
+                    and self.model.peerings[(remote, vnet)].allow_gateway_transit
+                    and remote in self.gateway_subnets):
+                return remote
+        return None
+
+    def _advertised(self, gateway_vnet):
+        """Prefixes a gateway advertises: its VNet and every VNet using it through gateway transit."""
+        prefixes = list(self.model.vnets.get(gateway_vnet, ()))
+        for vnet in self.peered.get(gateway_vnet, ()):
+            if vnet != gateway_vnet and self.gateway_vnet(vnet) == gateway_vnet:
+                prefixes += self.model.vnets.get(vnet, ())
+        return prefixes
+
+    def _gateway_next_hops(self, vnet):
+        """Prefix -> remote gateway subnet, for every prefix the gateway serving ``vnet`` has learned."""
+        local = self.gateway_vnet(vnet)
+        if local is None:
+            return {}
+        subnet_vnet = {subnet: self.model.subnets[subnet].vnet
+                       for subnet in self.model.gateways.values() if subnet in self.model.subnets}
+        gateway_vnet = {gw: subnet_vnet.get(subnet) for gw, subnet in self.model.gateways.items()}
+        connections = set(self.model.connections)
+        learned = {}
+        for gw1, gw2 in connections:
+            if gateway_vnet.get(gw1) != local or (gw2, gw1) not in connections or gateway_vnet.get(gw2) is None:
+                continue
+            remote = gateway_vnet[gw2]
+            for prefix in self._advertised(remote):
+                learned[prefix] = self.gateway_subnets[remote]
+        return learned
+
+    def effective_routes(self, subnet_name):
+        subnet = self.model.subnets[subnet_name]
+        vnet = subnet.vnet
+        routes = [EffectiveRoute(DEFAULT, "0.0.0.0/0", INTERNET)]
+        routes += [EffectiveRoute(DEFAULT, prefix, NONE) for prefix in DEFAULT_NONE_PREFIXES]
+        routes += [EffectiveRoute(DEFAULT, prefix, VNET_LOCAL) for prefix in self.model.vnets.get(vnet, ())]
+        for remote in sorted(self.peered.get(vnet, ())):
+            routes += [EffectiveRoute(DEFAULT, prefix, VNET_PEERING) for prefix in self.model.vnets.get(remote, ())]
+
+        table = self.model.route_tables.get(subnet.route_table) if subnet.route_table else None
+        if table is None or table.propagate_gateway_routes:
+            routes += [EffectiveRoute(GATEWAY_LEARNED, prefix, VIRTUAL_NETWORK_GATEWAY)
+                       for prefix in self._gateway_next_hops(vnet)]
+        if table is not None:
+            routes += [EffectiveRoute(USER, route.address_prefix, route.next_hop_type, route.next_hop_ip_address)
+                       for route in table.routes]
+        return routes
+
+    def _trace(self, source, address):
+        hops, location, forwarded, visited = [], source, False, set()
+        while True:
+            if location in visited:
+                return Path(LOOP, tuple(hops), reason=f"revisits {location}")
+            visited.add(location)
+            route = self.tables[location].lookup(address)
+            if route is None:
+                return Path(DROPPED, tuple(hops), reason=f"no route in {location}")
+            hops.append(Hop(location, route))
+            vnet = self.model.subnets[location].vnet
+            hop_type = route.next_hop_type
+
+            if hop_type in (VNET_LOCAL, VNET_PEERING):
+                target = self.subnet_index.lookup(address)
+                target_vnet = self.model.subnets[target].vnet if target else None
+                if hop_type == VNET_LOCAL and target_vnet != vnet:
+                    return Path(DROPPED, tuple(hops), reason=f"{VNET_LOCAL} but no subnet of {vnet} holds it")
+                if hop_type == VNET_PEERING:
+                    if target_vnet is None or target_vnet not in self.peered.get(vnet, ()):
+                        return Path(DROPPED, tuple(hops), reason=f"no subnet of a VNet peered with {vnet} holds it")
+                    if forwarded and not self.model.peerings[(target_vnet, vnet)].allow_forwarded_traffic:
+                        return Path(DROPPED, tuple(hops),
+                                    reason=f"{target_vnet} does not allow forwarded traffic from {vnet}")
+                return Path(DELIVERED, tuple(hops), destination=target)
+            if hop_type == INTERNET:
+                return Path(INTERNET, tuple(hops))
+            if hop_type == VIRTUAL_APPLIANCE:
+                appliance = self.model.appliances.get(route.next_hop_ip_address)
+                if appliance is None:
+                    return Path(DROPPED, tuple(hops), reason=f"no IP-forwarding NIC at {route.next_hop_ip_address}")
+                appliance_vnet = self.model.subnets[appliance].vnet
+                if appliance_vnet != vnet and appliance_vnet not in self.peered.get(vnet, ()):
+                    return Path(DROPPED, tuple(hops), reason=f"{route.next_hop_ip_address} is not reachable from {vnet}")
+                location, forwarded = appliance, True
+                continue
+            if hop_type == VIRTUAL_NETWORK_GATEWAY:
+                remote = self.gateway_tables[vnet].lookup(address)
+                if remote is None:
+                    return Path(DROPPED, tuple(hops), reason=f"no VPN connection from {vnet} covers it")
+                location = remote
+                continue
+            return Path(DROPPED, tuple(hops), reason=f"next hop {hop_type}")
+
+    def trace(self, source, destination):
+        """Path from subnet ``source`` to ``destination`` (an address string or int)."""
+        address = int(ip_address(destination)) if isinstance(destination, str) else destination
+        return self.query(source, (address,))[0]
+
+    def query(self, source, addresses):
+        """Paths from subnet ``source`` to each integer address in ``addresses``."""
+        bounds, paths, trace = self.bounds, self._paths[source], self._trace
+        results = []
+        append = results.append
+        for address in addresses:
+            i = bisect_right(bounds, address) - 1
+            path = paths[i]
+            if path is None:
+                path = paths[i] = trace(source, address)
+            append(path)
+        return results
+
+    def probe_address(self, subnet_name):
+        """First address Azure hands out in a subnet (the first four are reserved)."""
+        return int(ip_network(self.model.subnets[subnet_name].address_prefixes[0]).network_address) + 4
+
+    def matrix(self, internet_probe=INTERNET_PROBE):
+        """Yield (source, target, path) for every subnet pair, plus an internet probe per source."""
+        names = sorted(self.model.subnets)
+        probes = [(name, self.probe_address(name)) for name in names]
+        probes.append((INTERNET, int(ip_address(internet_probe))))
+        for source in names:
+            paths = self.query(source, [address for _, address in probes])
+            for (target, _), path in zip(probes, paths):
+                if target != source:
+                    yield source, target, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="source", metavar="SUBNET")
+    parser.add_argument("--to", dest="destination", metavar="ADDRESS")
+    parser.add_argument("--routes", metavar="SUBNET", help="print the effective routes of a subnet")
+    parser.add_argument("--internet-probe", default=INTERNET_PROBE)
+    parser.add_argument("--config", nargs="*", default=[], metavar="KEY=VALUE")
+    args = parser.parse_args()
+
+    model = model_from_registrations(offline.run_program(config=dict(i.split("=", 1) for i in args.config)))
+    simulator = Simulator(model)
+
+    if args.routes:
+        for route in simulator.effective_routes(args.routes):
+            print(route)
+        return
+    if args.source:
+        if not args.destination:
+            parser.error("--from needs --to")
+        path = simulator.trace(args.source, args.destination)
+        for hop in path.hops:
+            print(f"{hop.subnet:<24} {hop.route}")
+        print(path.outcome + (f": {path.destination}" if path.destination else "")
+              + (f" ({path.reason})" if path.reason else ""))
+        return
+
+    for source, target, path in simulator.matrix(args.internet_probe):
+        print(f"{source:<20} -> {target:<20} {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Route table compiler.
+
+Builds the gateway-subnet routes and the spoke UDRs from the topology.
+In the spoke UDRs, spoke prefixes are merged into the smallest set of
+covering supernets, and spokes whose compiled routes are identical share one
+route table.
+
+Summaries never grow outside ``spoke_pool`` and never overlap the hub, the
+on-prem network or (for a spoke's own table) the spoke itself. They are only
+safe where nothing more specific exists for the same space: the hub
+GatewaySubnet has a peering system route for every spoke prefix, and Azure
+picks the longest prefix before looking at route sources, so its table
+lists every spoke prefix exactly.
+"""
+
+from ipaddress import collapse_addresses, ip_network
+from typing import NamedTuple
+
+from cidr import duplicate_prefixes
+from topology import TopologyError, spoke_route_name
+
+# https://learn.microsoft.com/en-us/azure/azure-resource-manager/management/azure-subscription-service-limits#networking-limits
+MAX_ROUTES_PER_TABLE = 400
+
+VIRTUAL_APPLIANCE = "VirtualAppliance"
+VNET_LOCAL = "VnetLocal"
+
+
+class Route(NamedTuple):
+    name: str
+    address_prefix: str
+    next_hop_type: str
+    next_hop_ip_address: str = None
+
+
+class CompiledRouteTable(NamedTuple):
+    name: str
+    routes: tuple
+    spokes: tuple
+
+
+def summarize(prefixes, within=None, avoid=()):
+    """Merge ``prefixes`` into covering supernets.
+
+    Without ``within`` only exactly adjacent blocks are merged. With it, a
+    block may also absorb unused space, as long as the supernet stays inside
+    ``within`` and does not overlap anything in ``avoid``.
+    """
+    blocks = set(collapse_addresses(ip_network(p) for p in prefixes))
+    if within is None:
+        return sorted(blocks)
+    within = ip_network(within)
+    avoid = [ip_network(p) for p in avoid]
+
+    changed = True
+    while changed:
+        changed = False
+        for block in sorted(blocks, key=lambda b: b.prefixlen, reverse=True):
+            if (block not in blocks or block.version != within.version
+                    or block.prefixlen <= within.prefixlen or not block.subnet_of(within)):
+                continue
+            parent = block.supernet()
+            if any(parent.version == a.version and parent.overlaps(a) for a in avoid):
+                continue
+            blocks = {b for b in blocks if not b.subnet_of(parent)}
+            blocks.add(parent)
+            changed = True
+    return sorted(blocks)
+
+
+def _owned_route_name(spoke, index):
+    return spoke_route_name(spoke.name) + (f"-{index}" if index else "")
+
+
+def _exact_routes(spokes, next_hop_ip):
+    return [Route(_owned_route_name(spoke, i), prefix, VIRTUAL_APPLIANCE, next_hop_ip)
+            for spoke in spokes for i, prefix in enumerate(spoke.address_prefixes)]
+
+
+def _summary_routes(topology, spokes, avoid, next_hop_ip):
+    owners = {ip_network(p): (spoke, i) for spoke in spokes for i, p in enumerate(spoke.address_prefixes)}
+    routes = []
+    for prefix in summarize(owners, within=topology.spoke_pool, avoid=avoid):
+        if prefix in owners:
+            name = _owned_route_name(*owners[prefix])
+        else:
+            name = f"toSpokes-{prefix.network_address}-{prefix.prefixlen}"
+        routes.append(Route(name, str(prefix), VIRTUAL_APPLIANCE, next_hop_ip))
+    return routes
+
+
+def check_routes(table_name, routes):
+    """Azure rejects duplicate prefixes and tables over the route limit; fail at preview instead."""
+    duplicates = duplicate_prefixes((route.name, route.address_prefix) for route in routes)
+    if duplicates:
+        raise TopologyError(f"{table_name}: duplicate route prefixes "
+                            + ", ".join(f"{name} ({prefix})" for name, prefix in duplicates))
+    if len(routes) > MAX_ROUTES_PER_TABLE:
+        raise TopologyError(f"{table_name}: {len(routes)} routes exceeds the Azure limit of {MAX_ROUTES_PER_TABLE}")
+    return tuple(routes)
+
+
+def default_route():
+    return Route("default", "0.0.0.0/0", VNET_LOCAL)
+
+
+def gateway_routes(topology, next_hop_ip):
+    """Routes for the hub GatewaySubnet: hub traffic stays local, spoke traffic goes via the NVA.
+
+    Spoke prefixes are not summarized here; a summary would lose to the
+    peering route for each spoke and on-prem traffic would skip the NVA.
+    """
+    hub_name = spoke_route_name(topology.hub.name)
+    routes = [Route(hub_name if i == 0 else f"{hub_name}-{i}", prefix, VNET_LOCAL)
+              for i, prefix in enumerate(topology.hub.address_prefixes)]
+    routes += _exact_routes(topology.spokes, next_hop_ip)
+    return check_routes("hub-gateway-rt", routes)
+
+
+def spoke_route_tables(topology, next_hop_ip, mesh=False):
+    """Compile one route table per distinct set of spoke UDRs.
+
+    Every spoke starts from a table summarizing all spokes. A summary that
+    covers a spoke's own prefix is harmless, since the spoke's VnetLocal
+    system route is more specific and wins. A route at least as specific as
+    one of the spoke's prefixes would send its own traffic to the NVA, so that
+    spoke gets a table built from the other spokes only, with the summaries
+    split around its own prefixes.
+
+    With ``mesh`` the spokes are connected to each other directly and the
+    tables carry no spoke routes. Any UDR would either lose to a direct
+    route on one side only or pull the mesh's traffic through the NVA, so
+    every spoke shares a table with only the default route.
+    """
+    fixed = topology.hub.address_prefixes + topology.onprem.address_prefixes
+    shared = _summary_routes(topology, topology.spokes, avoid=fixed, next_hop_ip=next_hop_ip)
+    shared_nets = [ip_network(r.address_prefix) for r in shared]
+
+    tables = {}
+    for spoke in topology.spokes:
+        own = [ip_network(p) for p in spoke.address_prefixes]
+        if mesh:
+            routes = ()
+        elif any(r.overlaps(o) and r.prefixlen >= o.prefixlen
+                 for r in shared_nets for o in own if r.version == o.version):
+            others = [s for s in topology.spokes if s is not spoke]
+            routes = _summary_routes(topology, others, avoid=fixed + spoke.address_prefixes,
+                                     next_hop_ip=next_hop_ip)
+        else:
+            routes = shared
+        key = tuple(routes) + (default_route(),)
+        tables.setdefault(key, []).append(spoke.name)
+
+    return [CompiledRouteTable(name=f"{spokes[0]}-rt",
+                               routes=check_routes(f"{spokes[0]}-rt", list(routes)),
+                               spokes=tuple(spokes))
+            for routes, spokes in tables.items()]
@@ -0,0 +1,124 @@
+# From: https://learn.microsoft.com/en-us/azure/developer/terraform/hub-spoke-spoke-network
+
+from azure_sdk import network, resources
+from components import NetworkComponent
+
+
+def route_args(routes):
+    return [network.RouteArgs(
+        name=route.name,
+        address_prefix=route.address_prefix,
+        next_hop_type=route.next_hop_type,
+        next_hop_ip_address=route.next_hop_ip_address
+    ) for route in routes]
+
+
+def create_route_table(name, routes, resource_group_name, opts=None):
+    return network.RouteTable(name,
+        resource_group_name=resource_group_name,
+        disable_bgp_route_propagation=False,
+        routes=route_args(routes),
+        opts=opts
+    )
+
+
+def create_routes(name, routes, route_table_name, resource_group_name, opts=None):
+    """Add ``routes`` to a route table owned by another stack, one ``Route`` resource each."""
+    return [network.Route(f"{name}-{route.name}",
+        route_name=route.name,
+        route_table_name=route_table_name,
+        resource_group_name=resource_group_name,
+        address_prefix=route.address_prefix,
+        next_hop_type=route.next_hop_type,
+        next_hop_ip_address=route.next_hop_ip_address,
+        opts=opts
+    ) for route in routes]
+
+
+def create_spoke_route_tables(compiled_tables, resource_group_name, opts=None):
+    """Create one RouteTable per compiled table and map every spoke to the one it uses."""
+    by_spoke = {}
+    for compiled in compiled_tables:
+        route_table = create_route_table(compiled.name, compiled.routes, resource_group_name, opts)
+        by_spoke.update((spoke, route_table) for spoke in compiled.spokes)
+    return by_spoke
+
+
+class Spoke(NetworkComponent):
+    """A spoke VNet peered both ways with the hub.
+
+    The hub is passed as plain inputs (``hub_vnet_id``, ``hub_vnet_name``,
+    ``hub_resource_group_name``) so they can come from the hub's own resources
+    or from a ``StackReference`` to a hub stack. Given a ``network_group``
+    (see ``network_manager.py``) the spoke joins it instead of peering.
+    """
+
+    def __init__(self, spec, route_table_id, hub_vnet_id, hub_vnet_name, hub_resource_group_name,
+                 hub_gateway=None, network_group=None, opts=None):
+        super().__init__("Spoke", spec.name, opts)
+        name = spec.name
+
+        self.resource_group = resources.ResourceGroup(f"{name}-vnet-rg", opts=self.child_opts())
+
+        self.vnet = network.VirtualNetwork(f"{name}-vnet",
+            resource_group_name=self.resource_group.name,
+            address_space=network.AddressSpaceArgs(
+                address_prefixes=list(spec.address_prefixes)
+            ),
+            opts=self.child_opts()
+        )
+
+        for subnet in spec.subnets:
+            network.Subnet(f"{name}-{subnet.name}",
+                resource_group_name=self.resource_group.name,
+                virtual_network_name=self.vnet.name,
+                address_prefixes=[subnet.address_prefix],
+                route_table=network.RouteTableArgs(
+                    id=route_table_id
+                ) if subnet.route_table else None,
+                opts=self.child_opts()
+            )
+
+        if network_group is not None:
+            network.StaticMember(f"{name}-avnm-member",
+                static_member_name=name,
+                network_group_name=network_group["network_group_name"],
+                network_manager_name=network_group["network_manager_name"],
+                resource_group_name=network_group["resource_group_name"],
+                resource_id=self.vnet.id,
+                opts=self.child_opts()
+            )
+        else:
+            # Only the spoke side (use_remote_gateways) has to wait for the hub gateway;
+            # the hub side can be created as soon as both VNets exist. A spoke stack
+            # reads the hub from a finished stack, so there is nothing to wait for.
+            network.VirtualNetworkPeering(f"{name}-hub-peer",
+                resource_group_name=self.resource_group.name,
+                virtual_network_name=self.vnet.name,
+                remote_virtual_network=network.SubResourceArgs(
+                    id=hub_vnet_id
+                ),
+                allow_virtual_network_access=True,
+                allow_forwarded_traffic=True,
+                allow_gateway_transit=False,
+                use_remote_gateways=True,
+                opts=self.child_opts(depends_on=[hub_gateway] if hub_gateway else None)
+            )
+
+            network.VirtualNetworkPeering(f"hub-{name}-peer",
+                resource_group_name=hub_resource_group_name,
+                virtual_network_name=hub_vnet_name,
+                remote_virtual_network=network.SubResourceArgs(
+                    id=self.vnet.id
+                ),
+                allow_virtual_network_access=True,
+                allow_forwarded_traffic=True,
+                allow_gateway_transit=True,
+                use_remote_gateways=False,
+                opts=self.child_opts()
+            )
+
+        self.register_outputs({
+            "resource_group_name": self.resource_group.name,
+            "vnet_id": self.vnet.id,
+        })
@@ -0,0 +1,235 @@
+"""Spoke topology for the hub-and-spoke program.
+
+The spoke list comes from the ``spokes`` config object, or from a YAML/JSON
+file named by ``topologyFile`` (``topology.yaml`` next to this module when
+neither is set). The file may also describe the hub and on-prem VNets.
+
+Spokes or subnets without an address prefix are allocated from
+``spoke_pool`` / their VNet, and the whole address plan is checked for
+overlaps before any resource is declared.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field, replace
+from ipaddress import ip_network
+
+import yaml
+
+from cidr import AllocationError, PrefixAllocator, find_overlaps
+
+DEFAULT_TOPOLOGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topology.yaml")
+
+DEFAULT_SPOKE_PREFIX_LENGTH = 16
+
+
+@dataclass(frozen=True)
+class SubnetSpec:
+    name: str
+    address_prefix: str = None
+    route_table: bool = True
+    prefix_length: int = None
+
+
+@dataclass(frozen=True)
+class VnetSpec:
+    name: str
+    address_prefixes: tuple
+    subnets: tuple = field(default_factory=tuple)
+    prefix_length: int = None
+
+    def subnet(self, name):
+        for subnet in self.subnets:
+            if subnet.name == name:
+                return subnet
+        raise KeyError(f"{self.name} has no subnet {name!r}")
+
+
+DEFAULT_HUB = VnetSpec(name="hub",
+                       address_prefixes=("10.0.0.0/16",),
+                       subnets=(SubnetSpec("mgmt", "10.0.0.64/27"),
+                                SubnetSpec("dmz", "10.0.0.32/27"),
+                                SubnetSpec("GatewaySubnet", "10.0.255.224/27")))
+
+DEFAULT_ONPREM = VnetSpec(name="onprem",
+                          address_prefixes=("192.168.0.0/16",),
+                          subnets=(SubnetSpec("mgmt", "192.168.1.128/25"),
+                                   SubnetSpec("GatewaySubnet", "192.168.255.224/27")))
+
+
+@dataclass(frozen=True)
+class Topology:
+    spokes: tuple
+    hub: VnetSpec = DEFAULT_HUB
+    onprem: VnetSpec = DEFAULT_ONPREM
+    spoke_pool: str = None
+
+    @property
+    def vnets(self):
+        return (self.onprem, self.hub) + self.spokes
+
+    def spoke(self, name):
+        for spoke in self.spokes:
+            if spoke.name == name:
+                return spoke
+        raise KeyError(f"topology has no spoke {name!r}")
+
+
+class TopologyError(ValueError):
+    pass
+
+
+def _parse_subnet(vnet_name, raw):
+    if not raw.get("name"):
+        raise TopologyError(f"{vnet_name!r}: subnet entry has no name: {raw!r}")
+    if not raw.get("address_prefix") and not raw.get("prefix_length"):
+        raise TopologyError(f"{vnet_name!r}: subnet {raw['name']!r} needs address_prefix or prefix_length")
+    return SubnetSpec(name=raw["name"],
+                      address_prefix=raw.get("address_prefix"),
+                      route_table=bool(raw.get("route_table", True)),
+                      prefix_length=raw.get("prefix_length"))
+
+
+def _parse_vnet(raw, name=None):
+    name = name or raw.get("name")
+    if not name:
+        raise TopologyError(f"VNet entry has no name: {raw!r}")
+    return VnetSpec(name=name,
+                    address_prefixes=tuple(raw.get("address_prefixes") or ()),
+                    subnets=tuple(_parse_subnet(name, s) for s in raw.get("subnets", [])),
+                    prefix_length=raw.get("prefix_length"))
+
+
+def parse_topology(raw):
+    spokes = tuple(_parse_vnet(s) for s in raw.get("spokes", []))
+    seen = set()
+    for spoke in spokes:
+        if spoke.name in seen:
+            raise TopologyError(f"duplicate spoke name {spoke.name!r}")
+        seen.add(spoke.name)
+    topology = Topology(spokes=spokes,
+                        hub=_parse_vnet(raw["hub"], "hub") if "hub" in raw else DEFAULT_HUB,
+                        onprem=_parse_vnet(raw["onprem"], "onprem") if "onprem" in raw else DEFAULT_ONPREM,
+                        spoke_pool=raw.get("spoke_pool"))
+    # Allocation parses every prefix, so malformed ones are reported first.
+    _check_plan(malformed_prefixes(topology))
+    topology = allocate_addresses(topology, raw.get("spoke_prefix_length", DEFAULT_SPOKE_PREFIX_LENGTH))
+    _check_plan(address_plan_errors(topology))
+    return topology
+
+
+def _check_plan(errors):
+    if errors:
+        raise TopologyError("address plan is invalid:\n  " + "\n  ".join(errors))
+
+
+def _reserve_all(allocator, prefixes):
+    for prefix in prefixes:
+        try:
+            allocator.reserve(prefix)
+        except AllocationError:
+            # Overlaps and out-of-range prefixes are reported by address_plan_errors.
+            pass
+
+
+def _allocate_subnets(vnet):
+    if all(s.address_prefix for s in vnet.subnets):
+        return vnet
+    allocators = [PrefixAllocator(p) for p in vnet.address_prefixes]
+    for allocator in allocators:
+        _reserve_all(allocator, [s.address_prefix for s in vnet.subnets
+                                 if s.address_prefix and allocator.pool.overlaps(ip_network(s.address_prefix))])
+    subnets = []
+    for subnet in vnet.subnets:
+        if not subnet.address_prefix:
+            subnet = replace(subnet, address_prefix=str(_allocate_from(allocators, subnet.prefix_length, vnet.name)))
+        subnets.append(subnet)
+    return replace(vnet, subnets=tuple(subnets))
+
+
+def _allocate_from(allocators, prefix_length, owner):
+    for allocator in allocators:
+        try:
+            return allocator.allocate(prefix_length)
+        except AllocationError:
+            continue
+    raise TopologyError(f"{owner!r}: no free /{prefix_length} left")
+
+
+def allocate_addresses(topology, spoke_prefix_length=DEFAULT_SPOKE_PREFIX_LENGTH):
+    """Fill in missing spoke and subnet prefixes; explicit prefixes are kept as written."""
+    spokes = topology.spokes
+    if any(not s.address_prefixes for s in spokes):
+        if not topology.spoke_pool:
+            missing = next(s.name for s in spokes if not s.address_prefixes)
+            raise TopologyError(f"spoke {missing!r} has no address_prefixes and no spoke_pool is set")
+        pool = PrefixAllocator(topology.spoke_pool)
+        _reserve_all(pool, [p for vnet in topology.vnets for p in vnet.address_prefixes
+                            if pool.pool.overlaps(ip_network(p))])
+        allocated = []
+        for spoke in spokes:
+            if not spoke.address_prefixes:
+                net = _allocate_from([pool], spoke.prefix_length or spoke_prefix_length, spoke.name)
+                spoke = replace(spoke, address_prefixes=(str(net),))
+            allocated.append(spoke)
+        spokes = tuple(allocated)
+    return replace(topology,
+                   hub=_allocate_subnets(topology.hub),
+                   onprem=_allocate_subnets(topology.onprem),
+                   spokes=tuple(_allocate_subnets(s) for s in spokes))
+
+
+def _prefix_error(label, prefix):
+    try:
+        ip_network(prefix)
+    except ValueError as e:
+        return f"{label}: {e}"
+    return None
+
+
+def malformed_prefixes(topology):
+    """Prefixes that aren't valid networks, host bits set included, labelled by their VNet or subnet."""
+    labelled = [("spoke_pool", topology.spoke_pool)] if topology.spoke_pool else []
+    for vnet in topology.vnets:
+        labelled += [(vnet.name, prefix) for prefix in vnet.address_prefixes]
+        labelled += [(f"{vnet.name}-{s.name}", s.address_prefix) for s in vnet.subnets if s.address_prefix]
+    return [error for error in (_prefix_error(label, prefix) for label, prefix in labelled) if error]
+
+
+def address_plan_errors(topology):
+    """Malformed prefixes, or else overlaps between VNets (all of them are reachable
+    from each other through the hub peerings and the VPN), subnets outside their
+    VNet and overlapping subnets."""
+    malformed = malformed_prefixes(topology)
+    if malformed:
+        return malformed
+    errors = [str(o) for o in find_overlaps((vnet.name, prefix)
+                                            for vnet in topology.vnets
+                                            for prefix in vnet.address_prefixes)]
+    for vnet in topology.vnets:
+        spaces = [ip_network(p) for p in vnet.address_prefixes]
+        for subnet in vnet.subnets:
+            net = ip_network(subnet.address_prefix)
+            if not any(net.version == space.version and net.subnet_of(space) for space in spaces):
+                errors.append(f"{vnet.name}-{subnet.name} ({net}) is outside {vnet.name} address space")
+        errors.extend(str(o) for o in find_overlaps((f"{vnet.name}-{s.name}", s.address_prefix)
+                                                    for s in vnet.subnets))
+    return errors
+
+
+def read_topology_file(path):
+    with open(path) as f:
+        if path.endswith(".json"):
+            return parse_topology(json.load(f))
+        return parse_topology(yaml.safe_load(f) or {})
+
+
+def load_topology(config):
+    spokes = config.get_object("spokes")
+    if spokes is not None:
+        return parse_topology({"spokes": spokes})
+    return read_topology_file(config.get("topologyFile") or DEFAULT_TOPOLOGY_FILE)
+
+
+def spoke_route_name(spoke_name):
+    return "to" + spoke_name[:1].upper() + spoke_name[1:]
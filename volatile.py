@@ -0,0 +1,102 @@
+"""Input fields Azure fills in on network resources, ignored wherever the program leaves them unset.
+
+A refresh writes ARM's response back into state, cut down to the resource's
+input properties, and the next ``up`` diffs those against the program's
+inputs. Some inputs are filled in by Azure whenever a request leaves them
+out: etags and provisioning states that the API models as inputs, the ids
+and types of inline list items, and server defaults such as a NIC's
+``nicType`` or a connection's ``connectionProtocol``. Each one turns the next
+``up`` into a no-op update. ``ignore_volatile_fields`` is a stack
+transformation that adds this module's table to ``ignore_changes`` on every
+azure-native network resource. A path the resource does set is left out, so
+a value written in the program is never masked.
+
+Output-only properties (a NIC's ``macAddress``, a connection's byte
+counters) are never diffed and don't belong here. Paths use Pulumi's input
+property names, which azure-native flattens out of the ARM ``properties``
+envelope; ``benchmarks/bench_noop_update.py`` finds them from recorded ARM
+responses.
+"""
+
+import re
+
+from pulumi import Output, ResourceOptions, ResourceTransformationResult
+
+NETWORK_TYPE_PREFIX = "azure-native:network:"
+
+# Lists whose items are separate resources in this program (a VNet's subnets
+# and peerings) or that Azure fills in entirely (an NSG's default rules) are
+# ignored whole.
+BY_TYPE = {
+    "ConnectivityConfiguration": ("description", "isGlobal"),
+    "LoadBalancer": ("backendAddressPools[*].id", "frontendIPConfigurations[*].id",
+                     "frontendIPConfigurations[*].privateIPAddressVersion", "loadBalancingRules[*].id",
+                     "loadBalancingRules[*].backendAddressPools", "loadBalancingRules[*].disableOutboundSnat",
+                     "loadBalancingRules[*].enableTcpReset", "loadBalancingRules[*].idleTimeoutInMinutes",
+                     "loadBalancingRules[*].loadDistribution", "probes[*].id", "probes[*].probeThreshold"),
+    "NetworkGroup": ("description",),
+    "NetworkInterface": ("auxiliaryMode", "auxiliarySku", "disableTcpStateTracking", "nicType",
+                         "ipConfigurations[*].id", "ipConfigurations[*].primary",
+                         "ipConfigurations[*].privateIPAddress", "ipConfigurations[*].privateIPAddressVersion",
+                         "ipConfigurations[*].type"),
+    "NetworkManager": ("description",),
+    "NetworkSecurityGroup": ("etag", "provisioningState", "resourceGuid", "defaultSecurityRules",
+                             "securityRules[*].etag", "securityRules[*].id", "securityRules[*].provisioningState",
+                             "securityRules[*].type"),
+    "PublicIPAddress": ("idleTimeoutInMinutes", "ipAddress", "publicIPAddressVersion", "sku.name", "sku.tier"),
+    "RouteTable": ("etag", "provisioningState", "routes[*].etag", "routes[*].id", "routes[*].provisioningState",
+                   "routes[*].type"),
+    "Subnet": ("etag", "provisioningState", "type"),
+    "VirtualNetwork": ("privateEndpointVNetPolicies", "subnets", "virtualNetworkPeerings"),
+    "VirtualNetworkGateway": ("allowRemoteVnetTraffic", "allowVirtualWanTraffic", "bgpSettings.asn",
+                              "bgpSettings.bgpPeeringAddress", "bgpSettings.bgpPeeringAddresses",
+                              "bgpSettings.peerWeight", "disableIPSecReplayProtection",
+                              "enableBgpRouteTranslationForNat", "enablePrivateIpAddress", "ipConfigurations[*].id",
+                              "vpnGatewayGeneration"),
+    "VirtualNetworkGatewayConnection": ("connectionMode", "connectionProtocol", "dpdTimeoutSeconds", "enableBgp",
+                                        "enablePrivateLinkFastPath", "expressRouteGatewayBypass",
+                                        "useLocalAzureIpAddress", "usePolicyBasedTrafficSelectors"),
+    "VirtualNetworkPeering": ("doNotVerifyRemoteGateways", "peerCompleteVnets", "peeringState", "peeringSyncLevel",
+                              "remoteAddressSpace", "remoteVirtualNetworkAddressSpace", "type"),
+}
+
+
+def volatile_fields(typ):
+    """The ``ignore_changes`` paths for a resource type token; empty outside azure-native network."""
+    if not typ.startswith(NETWORK_TYPE_PREFIX):
+        return ()
+    return BY_TYPE.get(typ[len(NETWORK_TYPE_PREFIX):], ())
+
+
+def _field(value, name):
+    """``value``'s field for the input property ``name``, from a props dict, a dict input or an input type."""
+    key = name.lower()
+    if isinstance(value, dict):
+        return next((v for k, v in value.items() if k.replace("_", "").lower() == key), None)
+    return next((getattr(value, attr) for attr in dir(type(value))
+                 if isinstance(getattr(type(value), attr), property) and attr.replace("_", "").lower() == key), None)
+
+
+def _is_set(value, path):
+    """Whether ``value`` sets ``path`` anywhere; unknown outputs count as set."""
+    if value is None:
+        return False
+    if not path or isinstance(value, Output):
+        return True
+    if path[0] == "*":
+        return isinstance(value, (list, tuple)) and any(_is_set(item, path[1:]) for item in value)
+    return _is_set(_field(value, path[0]), path[1:])
+
+
+def ignore_volatile_fields(args):
+    """Stack transformation: merge the ``volatile_fields`` the resource leaves unset into its ``ignore_changes``."""
+    fields = volatile_fields(args.type_)
+    if not fields:
+        return None
+    own = list(args.opts.ignore_changes or [])
+    unset = [field for field in fields
+             if field not in own and not _is_set(args.props, [s for s in re.split(r"[.\[\]]+", field) if s])]
+    # merge() copies the options; setting the list keeps it free of duplicates.
+    opts = ResourceOptions.merge(args.opts, None)
+    opts.ignore_changes = own + unset
+    return ResourceTransformationResult(args.props, opts)